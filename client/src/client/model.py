@@ -35,14 +35,26 @@ class Message(Base):
     is_delivered = Column(Boolean, default=False, index=True)
 
 
+class SessionToken(Base):
+    """
+    Таблица токенов сессии, выданных пользователю серверами: токен переживает перезапуск клиента
+    """
+
+    __tablename__ = "session_token"
+
+    id = Column(Integer, primary_key=True)
+    server = Column(String, index=True, unique=True)
+    token = Column(String)
+
+
 def init_db(username: str):
     """Функция инициализации сессии ORM и базы данных при её отсутствии"""
     db_path = ClientConf.DATA_DIR / f"jim_client_db_{username}.sqlite"
     conn_string = f"sqlite:///{db_path}?check_same_thread=false&uri=true"
 
     engine = create_engine(conn_string, future=True, echo=False, pool_recycle=7200)
-    if not db_path.exists():
-        Base.metadata.create_all(engine)
+    # создает только отсутствующие таблицы, в том числе добавленные в базу прежней версии клиента
+    Base.metadata.create_all(engine)
 
     Session = sessionmaker(bind=engine)
     session = Session()
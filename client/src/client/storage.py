@@ -3,7 +3,7 @@ from datetime import datetime
 from sqlalchemy import and_
 from sqlalchemy.exc import NoResultFound
 
-from client.model import Contact, Message, init_db
+from client.model import Contact, Message, SessionToken, init_db
 
 
 class ClientStorage:
@@ -35,9 +35,13 @@ class ClientStorage:
         for new_contact in contacts:
             self.add_contact(new_contact)
 
-    def store_msg(self, contact: str, msg_text: str, timestamp: datetime, is_incoming: bool, is_delivered: bool = True):
+    def store_msg(self, contact: str, msg_text: str, timestamp: float, is_incoming: bool, is_delivered: bool = True):
         message = Message(
-            contact=contact, text=msg_text, timestamp=timestamp, is_incoming=is_incoming, is_delivered=is_delivered
+            contact=contact,
+            text=msg_text,
+            timestamp=datetime.fromtimestamp(timestamp),
+            is_incoming=is_incoming,
+            is_delivered=is_delivered,
         )
         self.session.add(message)
         self.session.commit()
@@ -90,3 +94,18 @@ class ClientStorage:
             self.session.commit()
         except NoResultFound:
             pass
+
+    def get_session_token(self, server: str) -> str | None:
+        entry = self.session.query(SessionToken).filter_by(server=server).one_or_none()
+        return entry.token if entry else None
+
+    def set_session_token(self, server: str, token: str | None):
+        entry = self.session.query(SessionToken).filter_by(server=server).one_or_none()
+        if token is None:
+            if entry:
+                self.session.delete(entry)
+        elif entry:
+            entry.token = token
+        else:
+            self.session.add(SessionToken(server=server, token=token))
+        self.session.commit()
@@ -1,3 +1,4 @@
+from collections import deque
 from contextlib import ContextDecorator
 from http import HTTPStatus
 from ipaddress import ip_address
@@ -6,11 +7,16 @@ from threading import Lock, Thread
 from time import sleep
 
 from common.base import JIMBase
+from common.buffers import RECV_POOL
+from common.codecs import JSON_CODEC, get_codec, supported_codecs
 from common.descriptors import PortDescriptor
 from common.errors import IncorrectDataRecivedError, NonDictInputError, ReqiuredFieldMissingError, ServerDisconnectError
-from common.schema import Actions, Keys
+from common.framing import FrameDecoder, pack_frame
+from common.messages import ChatMsg, JIMMessage, Probe
+from common.schema import Features, Keys
 from PyQt6 import QtCore
 
+from client.config import ClientConf
 from client.logger_conf import main_logger
 from client.messages import ClientMessages
 from client.storage import ClientStorage
@@ -52,6 +58,10 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
         self.storage = ClientStorage(self.username)
         self.notifier = SignalNotifier()
         self.status = ""
+        self.framed = False
+        self.compress_threshold: int | None = None
+        self.frame_decoder = FrameDecoder()
+        self._inbox: deque[dict] = deque()
 
     def __str__(self):
         return f"JIM_client_object"
@@ -65,10 +75,12 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
     def _connect(self):
         while True:
             try:
-                if not self.sock:
+                if not self.sock or self.sock.fileno() == -1:
+                    # после close() сокет закрыт, переподключение идет через новый
                     self.sock = socket(AF_INET, SOCK_STREAM)
                 self.sock.connect((str(self.ip), self.port))
                 self.connected = True
+                self._reset_wire_state()
                 break
             except ConnectionRefusedError as ex:
                 main_logger.info(f"Пытаюсь подключиться как {self.username} к серверу {self.server_name}...")
@@ -81,6 +93,7 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
 
     def close(self):
         main_logger.info("Закрываю соединение...")
+        self.connected = False
         self.sock.close()
 
     def authenticate(self):
@@ -88,14 +101,45 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
         self._connect()
         if self.connected:
             msg = self.msg_factory.make_authenticate_msg(password=self.password)
+            msg.features = self._offer_features()
+            # по токену сессии, сохраненному в БД клиента, сервер впускает без проверки пароля
+            msg.token = self.storage.get_session_token(self.server_name)
             resp = self._send_data(msg, return_response=True)
             if resp.get(Keys.RESPONSE) == HTTPStatus.OK:  # type: ignore
+                self.storage.set_session_token(self.server_name, resp.get(Keys.TOKEN))  # type: ignore
+                self._apply_features(resp.get(Keys.FEATURES) or dict())  # type: ignore
                 main_logger.info(f"Успешно подключен к серверу {self.server_name} от имени {self.username}")
                 self.send_presence(status=self.status)
                 return True, resp
             return False, resp
         return False, dict()
 
+    def _offer_features(self) -> dict:
+        features = dict()
+        if ClientConf.FRAMING_ENABLED:
+            features[Features.FRAMING] = True
+            codecs = supported_codecs(ClientConf.CODECS)
+            if codecs:
+                features[Features.CODEC] = codecs
+            if ClientConf.COMPRESSION_ENABLED:
+                features[Features.COMPRESSION] = True
+            features[Features.OFFLINE_MSGS] = True
+        return features
+
+    def _apply_features(self, features: dict):
+        self.framed = bool(features.get(Features.FRAMING))
+        self.codec = get_codec(features.get(Features.CODEC)) if self.framed else JSON_CODEC
+        is_compressed = self.framed and features.get(Features.COMPRESSION)
+        self.compress_threshold = ClientConf.COMPRESSION_THRESHOLD if is_compressed else None
+
+    def _reset_wire_state(self):
+        self.framed = False
+        self.codec = JSON_CODEC
+        self.compress_threshold = None
+        self.frame_decoder.close()
+        self.frame_decoder = FrameDecoder()
+        self._inbox.clear()
+
     def run(self):
         """Запускает синхронизацию контактов и фоновый поток обработки сообщений после подключения и аутентификации"""
         if self.connected:
@@ -125,10 +169,11 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
 
     def send_msg(self, contact: str, msg_text: str, store_msg: bool = True):
         msg = self.msg_factory.make_msg(user_or_room=contact, message=msg_text)
-        timestamp = self._from_iso_to_datetime(msg[Keys.TIME])
+        timestamp = msg.time
         resp = self._send_data(msg, return_response=True)
         is_delivered = False
-        if resp and resp.get(Keys.RESPONSE) == HTTPStatus.OK:
+        if resp and resp.get(Keys.RESPONSE) in (HTTPStatus.OK, HTTPStatus.ACCEPTED):
+            # 202: получатель не в сети, сервер сохранил сообщение и доставит его при входе получателя
             is_delivered = True
         if store_msg:
             self.storage.store_msg(
@@ -170,12 +215,12 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
                 try:
                     msg = self._recv()
                     try:
-                        self._validate_msg(msg)
+                        message = self._parse_msg(msg)
                     except (NonDictInputError, IncorrectDataRecivedError, ReqiuredFieldMissingError) as ex:
                         main_logger.error(f"Принято некорректное сообщение: {msg} ({ex})")
                     else:
-                        main_logger.info(f"Принято сообщение: {msg}")
-                        self._process_server_msg(msg)
+                        main_logger.info(f"Принято сообщение: {message}")
+                        self._process_server_msg(message)
                 except (ConnectionError, ConnectionAbortedError, ConnectionResetError, ServerDisconnectError):
                     main_logger.info("Потеряно соединение с сервером.")
                     self.notifier.connection_lost.emit()
@@ -190,34 +235,58 @@ class JIMClient(Thread, JIMBase, ContextDecorator):
                 finally:
                     self.sock.settimeout(5)
 
-    def _process_server_msg(self, msg):
-        if msg.get(Keys.ACTION) == Actions.MSG:
-            user_from = msg[Keys.FROM]
-            if not self.storage.check_contact(contact=user_from):
-                self.storage.add_contact(contact=user_from)
-            text = msg[Keys.MSG]
-            timestamp = self._from_iso_to_datetime(msg[Keys.TIME])
-            self.storage.store_msg(contact=user_from, msg_text=text, is_incoming=True, timestamp=timestamp)
-            self.notifier.new_message.emit(user_from)
-            main_logger.debug(f"Получено сообщение: {msg}")
-        elif msg.get(Keys.ACTION) == Actions.PROBE:
-            self.send_presence(status=self.status)
-            main_logger.debug(f"Получено сообщение от сервера: {msg}")
-        else:
-            main_logger.error(f"Сообщение не распознано: {msg}")
-
-    def _send_data(self, msg_data: dict, return_response: bool = False):
+    def _process_server_msg(self, msg: JIMMessage):
+        match msg:
+            case ChatMsg():
+                user_from = msg.from_
+                if not self.storage.check_contact(contact=user_from):
+                    self.storage.add_contact(contact=user_from)
+                self.storage.store_msg(contact=user_from, msg_text=msg.message, is_incoming=True, timestamp=msg.time)
+                self.notifier.new_message.emit(user_from)
+                main_logger.debug(f"Получено сообщение: {msg}")
+            case Probe():
+                self.send_presence(status=self.status)
+                main_logger.debug(f"Получено сообщение от сервера: {msg}")
+            case _:
+                main_logger.error(f"Сообщение не распознано: {msg}")
+
+    def _send_data(self, msg_data: JIMMessage, return_response: bool = False):
         with socket_lock:
             msg_raw_data = self._dump_msg(msg_data)
-            self.sock.send(msg_raw_data)
+            if self.framed:
+                msg_raw_data = pack_frame(msg_raw_data, self.compress_threshold)
+            self.sock.sendall(msg_raw_data)
             resp = self._recv()
+            # сообщения, пересланные сервером до ответа, остаются в очереди для потока приема
+            pushed = []
+            while Keys.RESPONSE not in resp:
+                pushed.append(resp)
+                resp = self._recv()
+            self._inbox.extendleft(reversed(pushed))
         main_logger.debug(f"Отправлено сообщение: {msg_data}")
         main_logger.debug(f"Принят ответ: {resp}")
         if return_response:
             return resp
 
     def _recv(self) -> dict:
-        raw_resp_data = self.sock.recv(self.package_length)
-        if not raw_resp_data:
-            raise ServerDisconnectError()
-        return self._load_msg(raw_resp_data)
+        if self._inbox:
+            return self._inbox.popleft()
+        if not self.framed:
+            buffer = RECV_POOL.acquire(self.package_length)
+            try:
+                received = self.sock.recv_into(buffer, self.package_length)
+                if not received:
+                    raise ServerDisconnectError()
+                with memoryview(buffer)[:received] as raw_resp_data:
+                    return self._load_msg(raw_resp_data)
+            finally:
+                RECV_POOL.release(buffer)
+        while not self._inbox:
+            try:
+                payloads = self.frame_decoder.recv_from(self.sock)
+            except ConnectionResetError:
+                raise ServerDisconnectError()
+            # тела кадров - представления буфера приема, поэтому разбираются сразу, до следующего чтения
+            self._inbox.extend(self._load_msg(payload) for payload in payloads)
+            self.frame_decoder.reclaim()
+        return self._inbox.popleft()
@@ -1,11 +1,32 @@
 import os
+from datetime import datetime
 from copy import deepcopy
 from http import HTTPStatus
-from unittest import TestCase, mock
+from socket import socket
+from unittest import TestCase, mock, skipUnless
 
 from client.config import ClientConf
 from client.transport import JIMClient
-from common.schema import Actions, Keys
+from common.codecs import CODECS
+from common.framing import pack_frame
+from common.messages import ChatMsg
+from common.schema import Actions, Features, Keys
+
+
+def emulate_recv_into(sock: mock.Mock):
+    """recv_into поверх мока recv: байты, не поместившиеся в буфер, отдаются следующими вызовами"""
+    pending = bytearray()
+
+    def recv_into(buffer, nbytes=0):
+        size = nbytes or len(buffer)
+        if not pending:
+            pending.extend(sock.recv(size))
+        size = min(size, len(pending))
+        buffer[:size] = pending[:size]
+        del pending[:size]
+        return size
+
+    sock.recv_into.side_effect = recv_into
 
 
 class TestJIMClient(TestCase):
@@ -23,6 +44,7 @@ class TestJIMClient(TestCase):
         self.client.sock.connect.return_value = None
         self.client.sock.send.return_value = None
         self.client.sock.recv.return_value = self.client._dump_msg(self.mock_resp.copy())
+        emulate_recv_into(self.client.sock)
         return super().setUp()
 
     def tearDown(self) -> None:
@@ -37,21 +59,89 @@ class TestJIMClient(TestCase):
         resp.update(self.mock_time)
         self.assertEqual(resp, resp_orig)
 
+    def test_recv_framed(self):
+        self.client._apply_features({Features.FRAMING: True})
+        frames = pack_frame(self.client._dump_msg(self.mock_resp.copy())) * 2
+        self.client.sock.recv.side_effect = [frames[:3], frames[3:]]
+        responses = [self.client._recv(), self.client._recv()]
+        for resp in responses:
+            resp.update(self.mock_time)
+        self.assertEqual(responses, [self.mock_resp, self.mock_resp])
+        self.assertEqual(self.client.sock.recv.call_count, 2)
+
+    @skipUnless("msgpack" in CODECS, "msgpack не установлен")
+    def test_recv_binary_codec(self):
+        self.assertIn("msgpack", self.client._offer_features()[Features.CODEC])
+        self.client._apply_features({Features.FRAMING: True, Features.CODEC: "msgpack"})
+        self.client.sock.recv.return_value = pack_frame(CODECS["msgpack"].encode(self.mock_resp.copy()))
+        resp = self.client._recv()
+        resp.update(self.mock_time)
+        self.assertEqual(resp, self.mock_resp)
+
+    def test_process_server_msg_stores_datetime(self):
+        timestamp = 1700000000.5
+        msg = ChatMsg(from_="contact", to=self.username, encoding="utf-8", message="text", time=timestamp)
+        self.client._process_server_msg(msg)
+        ((text, is_incoming, _, stored_time),) = self.client.storage.get_chat_messages(contact="contact")
+        self.assertEqual((text, is_incoming), ("text", True))
+        self.assertEqual(stored_time, datetime.fromtimestamp(timestamp))
+
     def test_make_presence_msg(self):
         status = "some_status"
         msg_orig = {Keys.ACTION: Actions.PRESENCE, Keys.USER: {Keys.ACCOUNT_NAME: self.username, Keys.STATUS: status}}
-        msg = self.client.msg_factory.make_presence_msg(status=status)
+        msg = self.client.msg_factory.make_presence_msg(status=status).to_dict()
         msg_orig.update(self.mock_time)
         msg.update(self.mock_time)
         self.assertEqual(msg, msg_orig)
 
+    def test_send_data_keeps_pushed_msgs(self):
+        self.client._apply_features({Features.FRAMING: True})
+        chat_msg = {Keys.ACTION: Actions.MSG, Keys.FROM: "contact", Keys.TO: self.username, Keys.MSG: "hi"}
+        frames = [pack_frame(self.client._dump_msg(msg)) for msg in (chat_msg, self.mock_resp.copy())]
+        self.client.sock.recv.return_value = b"".join(frames)
+        resp = self.client._send_data(self.client.msg_factory.make_get_contacts_msg(), return_response=True)
+        self.assertEqual(resp[Keys.RESPONSE], HTTPStatus.OK)
+        self.assertEqual(self.client._recv()[Keys.MSG], "hi")
+        self.assertIn(Features.OFFLINE_MSGS, self.client._offer_features())
+
+    def test_session_token_reused_on_reconnect(self):
+        resp = dict(self.mock_resp, **{Keys.TOKEN: "signed.token"})
+        self.client.sock.recv.return_value = self.client._dump_msg(resp)
+        ok, _ = self.client.authenticate()
+        self.assertTrue(ok)
+        self.assertEqual(self.client.storage.get_session_token(self.client.server_name), "signed.token")
+        first_auth = self.client._load_msg(self.client.sock.sendall.call_args_list[0].args[0])
+        self.assertNotIn(Keys.TOKEN, first_auth)
+
+        # приложение создает новый клиент на каждое подключение: токен берется из БД клиента
+        client = JIMClient(ip=self.ip, port=self.port, username=self.username, password="")
+        client.close()
+        client.sock = mock.Mock()
+        client.sock.recv.return_value = client._dump_msg(self.mock_resp.copy())
+        emulate_recv_into(client.sock)
+        ok, _ = client.authenticate()
+        self.assertTrue(ok)
+        auth = client._load_msg(client.sock.sendall.call_args_list[0].args[0])
+        self.assertEqual(auth[Keys.TOKEN], "signed.token")
+        self.assertIsNone(client.storage.get_session_token(client.server_name))
+
+    def test_reconnect_after_close(self):
+        self.client.sock = socket()
+        self.client.close()
+        new_sock = mock.Mock()
+        with mock.patch("client.transport.socket", return_value=new_sock):
+            self.client._connect()
+        self.assertIs(self.client.sock, new_sock)
+        new_sock.connect.assert_called_once_with((self.ip, self.port))
+        self.assertTrue(self.client.connected)
+
     def test_make_authenticate_msg(self):
         passwd = "qwerty1234"
         msg_orig = {
             Keys.ACTION: Actions.AUTH,
             Keys.USER: {Keys.ACCOUNT_NAME: self.username, Keys.PASSWORD: passwd},
         }
-        msg = self.client.msg_factory.make_authenticate_msg(password=passwd)
+        msg = self.client.msg_factory.make_authenticate_msg(password=passwd).to_dict()
         msg_orig.update(self.mock_time)
         msg.update(self.mock_time)
         self.assertEqual(msg, msg_orig)
@@ -60,7 +150,7 @@ class TestJIMClient(TestCase):
         msg_orig = {
             Keys.ACTION: Actions.QUIT,
         }
-        msg = self.client.msg_factory.make_quit_msg()
+        msg = self.client.msg_factory.make_quit_msg().to_dict()
         msg_orig.update(self.mock_time)  # type: ignore
         msg.update(self.mock_time)  # type: ignore
         self.assertEqual(msg, msg_orig)
@@ -75,7 +165,7 @@ class TestJIMClient(TestCase):
             Keys.MSG: msg_text,
             Keys.ENCODING: self.encoding,
         }
-        msg = self.client.msg_factory.make_msg(user_or_room=target, message=msg_text)
+        msg = self.client.msg_factory.make_msg(user_or_room=target, message=msg_text).to_dict()
         msg_orig.update(self.mock_time)  # type: ignore
         msg.update(self.mock_time)  # type: ignore
         self.assertEqual(msg, msg_orig)
@@ -83,7 +173,7 @@ class TestJIMClient(TestCase):
     def test_make_join_room_msg(self):
         room_name_right = "#room"
         msg_orig_right_room = {Keys.ACTION: Actions.JOIN, Keys.ROOM: room_name_right}
-        msg_right_room = self.client.msg_factory.make_join_room_msg(room_name_right)
+        msg_right_room = self.client.msg_factory.make_join_room_msg(room_name_right).to_dict()
         msg_orig_right_room.update(self.mock_time)  # type: ignore
         msg_right_room.update(self.mock_time)  # type: ignore
         self.assertEqual(msg_right_room, msg_orig_right_room)
@@ -92,7 +182,7 @@ class TestJIMClient(TestCase):
         room_name_right = "#room"
         room_name_wrong = "room"
         msg_orig = {Keys.ACTION: Actions.JOIN, Keys.ROOM: room_name_right}
-        msg = self.client.msg_factory.make_join_room_msg(room_name_wrong)
+        msg = self.client.msg_factory.make_join_room_msg(room_name_wrong).to_dict()
         msg_orig.update(self.mock_time)  # type: ignore
         msg.update(self.mock_time)  # type: ignore
         self.assertEqual(msg, msg_orig)
@@ -100,7 +190,7 @@ class TestJIMClient(TestCase):
     def test_make_leave_room_msg(self):
         room_name_right = "#room"
         msg_orig_right_room = {Keys.ACTION: Actions.LEAVE, Keys.ROOM: room_name_right}
-        msg_right_room = self.client.msg_factory.make_leave_room_msg(room_name_right)
+        msg_right_room = self.client.msg_factory.make_leave_room_msg(room_name_right).to_dict()
         msg_orig_right_room.update(self.mock_time)  # type: ignore
         msg_right_room.update(self.mock_time)  # type: ignore
         self.assertEqual(msg_right_room, msg_orig_right_room)
@@ -109,7 +199,7 @@ class TestJIMClient(TestCase):
         room_name_right = "#room"
         room_name_wrong = "room"
         msg_orig = {Keys.ACTION: Actions.LEAVE, Keys.ROOM: room_name_right}
-        msg = self.client.msg_factory.make_leave_room_msg(room_name_wrong)
+        msg = self.client.msg_factory.make_leave_room_msg(room_name_wrong).to_dict()
         msg_orig.update(self.mock_time)  # type: ignore
         msg.update(self.mock_time)  # type: ignore
         self.assertEqual(msg, msg_orig)
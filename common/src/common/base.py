@@ -1,10 +1,10 @@
-import json
 from abc import abstractmethod
-from datetime import datetime
-from json import JSONDecodeError
+from time import time
 
+from .codecs import JSON_CODEC
 from .config import CommonConf
-from .errors import IncorrectDataRecivedError, NonDictInputError, ReqiuredFieldMissingError
+from .errors import IncorrectDataRecivedError, NonDictInputError
+from .messages import JIMMessage, parse_msg
 from .schema import JIMValidationSchema, Keys
 
 
@@ -18,50 +18,46 @@ class JIMBase:
         self.encoding = CommonConf.ENCODING
         self.package_length = CommonConf.MAX_PACKAGE_LENGTH
         self.schema = JIMValidationSchema()
+        self.codec = JSON_CODEC
 
     @abstractmethod
     def close():
         pass
 
-    def _validate_keys(self, schema_keys: set, msg: dict):
-        missing = schema_keys - set(msg.keys())
-        if missing:
-            raise ReqiuredFieldMissingError(missing_fields=missing)
-
-    def _validate_msg(self, msg: dict):
+    def _parse_msg(self, msg: dict) -> JIMMessage:
         if not isinstance(msg, dict):
             raise NonDictInputError()
-        try:
-            if action := msg.get(Keys.ACTION):
-                self._validate_keys(self.schema.msg_keys[action], msg)
-                if action in self.schema.usr_keys:
-                    self._validate_keys(self.schema.usr_keys[action], msg[Keys.USER])
-            elif response := msg[Keys.RESPONSE]:
-                keys = self.schema.resp_keys[Keys.ERROR] if 400 <= response < 600 else self.schema.resp_keys[Keys.ALERT]
-                self._validate_keys(keys, msg)
-        except KeyError:
-            raise IncorrectDataRecivedError()
-
-    def _from_timestamp_to_iso(self, timestamp: float | int) -> str:
-        return datetime.fromtimestamp(timestamp).isoformat()
-
-    def _from_iso_to_datetime(self, iso_timestamp: str) -> datetime:
-        return datetime.fromisoformat(iso_timestamp)
-
-    def _update_timestamp(self, msg: dict):
-        timestamp = {Keys.TIME: datetime.now().isoformat()}
-        msg.update(timestamp)
-
-    def _dump_msg(self, msg: dict) -> bytes:
-        timestamp = {Keys.TIME: datetime.now().timestamp()}
-        msg.update(timestamp)
-        return json.dumps(msg).encode(self.encoding)
-
-    def _load_msg(self, data: bytes) -> dict:
-        try:
-            msg: dict = json.loads(data.decode(self.encoding))
-            timestamp = msg.get(Keys.TIME, 0)
-            msg.update({Keys.TIME: self._from_timestamp_to_iso(timestamp)})
-            return msg
-        except JSONDecodeError:
+        return parse_msg(msg)
+
+    # Время в сообщениях всегда хранится числом - секундами Unix epoch (float).
+    # В datetime и строки оно преобразуется только при записи в базу данных и при выводе пользователю.
+
+    def _update_timestamp(self, msg: dict | JIMMessage):
+        if type(msg) is dict:
+            msg[Keys.TIME] = time()
+        else:
+            msg.time = time()  # type: ignore
+
+    def _dump_msg(self, msg: dict | JIMMessage, codec=None) -> bytes:
+        """
+        Сериализует сообщение (словарь или типизированное сообщение) кодеком соединения
+        (по умолчанию - кодеком объекта, т.е. JSON).
+        Принятое из сети сообщение, пересылаемое тем же кодеком, не сериализуется заново:
+        к его исходным байтам дописывается только новое время
+        """
+        codec = codec or self.codec
+        wire = None if type(msg) is dict else msg.wire  # type: ignore
+        if wire is not None and wire[0] is codec:
+            timestamp = time()
+            data = codec.stamp(wire[1], timestamp)
+            if data is not None:
+                msg.time = timestamp  # type: ignore
+                return data
+        self._update_timestamp(msg)
+        return codec.encode(msg)
+
+    def _load_msg(self, data: bytes, codec=None) -> dict:
+        msg: dict = (codec or self.codec).decode(data)
+        if not isinstance(msg, dict):
             raise IncorrectDataRecivedError()
+        return msg
@@ -0,0 +1,60 @@
+from bisect import bisect_left
+
+from .config import CommonConf
+
+
+class BufferPool:
+    """
+    Пул буферов приема (bytearray) с классами размеров: запрошенный размер округляется вверх до ближайшего класса,
+    освобожденный буфер возвращается в список свободных буферов своего класса и выдается повторно.
+    Буферы больше старшего класса не кешируются. Счетчики показывают, сколько буферов было создано
+    и сколько выдано повторно: в установившемся режиме чтение сокетов не создает новых буферов
+    """
+
+    def __init__(
+        self, size_classes: tuple = CommonConf.RECV_BUFFER_CLASSES, max_free: int = CommonConf.RECV_POOL_MAX_FREE
+    ) -> None:
+        self.size_classes = sorted(size_classes)
+        self.max_free = max_free
+        self.free: dict[int, list[bytearray]] = {size: [] for size in self.size_classes}
+        self.allocated = 0
+        self.reused = 0
+        self.released = 0
+        self.discarded = 0
+
+    def size_class(self, size: int) -> int:
+        """Класс размера для запроса size; для запросов больше старшего класса - сам size"""
+        index = bisect_left(self.size_classes, size)
+        return self.size_classes[index] if index < len(self.size_classes) else size
+
+    def acquire(self, size: int) -> bytearray:
+        """Выдает буфер длиной не меньше size"""
+        capacity = self.size_class(size)
+        free = self.free.get(capacity)
+        if free:
+            self.reused += 1
+            return free.pop()
+        self.allocated += 1
+        return bytearray(capacity)
+
+    def release(self, buffer: bytearray):
+        """Возвращает буфер в пул; буфер нестандартного размера или сверх лимита свободных отбрасывается"""
+        free = self.free.get(len(buffer))
+        if free is None or len(free) >= self.max_free:
+            self.discarded += 1
+            return
+        self.released += 1
+        free.append(buffer)
+
+    def stats(self) -> dict:
+        return {
+            "allocated": self.allocated,
+            "reused": self.reused,
+            "released": self.released,
+            "discarded": self.discarded,
+            "free": sum(len(free) for free in self.free.values()),
+        }
+
+
+# общий пул процесса: сервер читает сокеты в одном потоке, операции со списками свободных буферов атомарны под GIL
+RECV_POOL = BufferPool()
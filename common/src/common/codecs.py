@@ -0,0 +1,174 @@
+import json
+
+from .config import CommonConf
+from .errors import IncorrectDataRecivedError
+from .messages import to_wire
+from .schema import Keys
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - двоичный кодек необязателен
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - быстрый JSON необязателен
+    orjson = None
+
+
+def _skip_spaces(data: bytes, pos: int) -> int:
+    """Индекс первого не пробельного символа JSON, начиная с pos"""
+    while data[pos : pos + 1] in (b" ", b"\t", b"\r", b"\n"):
+        pos += 1
+    return pos
+
+
+def _strip_end(data: bytes, end: int) -> int:
+    """Индекс конца данных до end без пробельных символов JSON в конце"""
+    while end and data[end - 1] in b" \t\r\n":
+        end -= 1
+    return end
+
+
+def _is_escaped(data: bytes, pos: int) -> bool:
+    """Экранирован ли символ в позиции pos: перед ним нечетное число обратных косых черт"""
+    start = pos
+    while start and data[start - 1] == 0x5C:
+        start -= 1
+    return (pos - start) % 2 == 1
+
+
+class JSONCodec:
+    """
+    Текстовый кодек по умолчанию: JSON в кодировке CommonConf.ENCODING, понятен всем версиям клиентов.
+    Кодеки принимают как словари, так и типизированные сообщения из common.messages.
+    JSON пишется компактно (без пробелов) и без экранирования не-ASCII символов - побайтно так же,
+    как его пишет orjson, поэтому выбор реализации JSON не меняет данные на проводе
+    """
+
+    name = "json"
+    backend = "json"
+
+    def __init__(self, encoding: str = CommonConf.ENCODING) -> None:
+        self.encoding = encoding
+        self._encoder = json.JSONEncoder(default=to_wire, separators=(",", ":"), ensure_ascii=False)
+        self._time_key = f'"{Keys.TIME}"'.encode(encoding)
+        self._time_field = b"," + self._time_key + b":"
+
+    def encode(self, msg) -> bytes:
+        return self._encoder.encode(msg).encode(self.encoding)
+
+    def decode(self, data: bytes | memoryview) -> dict:
+        try:
+            return json.loads(str(data, self.encoding))
+        except (ValueError, UnicodeDecodeError):
+            raise IncorrectDataRecivedError()
+
+    def stamp(self, payload: bytes | memoryview, timestamp: float) -> bytes | None:
+        """
+        Заменяет поле времени закодированного плоского объекта (значения - строки и числа), не разбирая его:
+        ключ ищется поиском подстроки, а неэкранированная кавычка перед "time" может только открывать строку,
+        поэтому совпадение внутри значения исключается. Прежнее поле вырезается, новое дописывается в конец.
+        None - если payload не оканчивается объектом
+        """
+        if payload[-1:] != b"}":
+            return None
+        body = bytes(payload[:-1])
+        pos = body.find(self._time_key)
+        while pos != -1:
+            colon = _skip_spaces(body, pos + len(self._time_key))
+            if body[colon : colon + 1] == b":" and not _is_escaped(body, pos):
+                # значение времени - число, поэтому поле заканчивается на ближайшей запятой или в конце объекта
+                start, end = pos, body.find(b",", colon) + 1
+                if not end:
+                    end = len(body)
+                    # поле было последним: вместе с ним убирается запятая перед ним
+                    head_end = _strip_end(body, start)
+                    if body[head_end - 1 : head_end] == b",":
+                        start = head_end - 1
+                body = body[:start] + body[end:]
+                break
+            pos = body.find(self._time_key, pos + 1)
+        end = _strip_end(body, len(body))
+        time_field = self._time_field[1:] if body[end - 1 : end] == b"{" else self._time_field
+        return b"".join((body, time_field, repr(float(timestamp)).encode(), b"}"))
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Тот же JSON, но через orjson: сериализует сразу в байты UTF-8 без промежуточной строки.
+    Dataclass-сообщения передаются в хук to_wire, а не сериализуются orjson по полям
+    """
+
+    backend = "orjson"
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATACLASS if orjson is not None else 0
+
+    def encode(self, msg) -> bytes:
+        return orjson.dumps(msg, default=to_wire, option=self.OPTIONS)
+
+    def decode(self, data: bytes | memoryview) -> dict:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            raise IncorrectDataRecivedError()
+
+
+class MsgPackCodec:
+    """Компактный двоичный кодек MessagePack; доступен, если установлен пакет msgpack"""
+
+    name = "msgpack"
+
+    def encode(self, msg) -> bytes:
+        return msgpack.packb(msg, default=to_wire)
+
+    def decode(self, data: bytes | memoryview) -> dict:
+        try:
+            return msgpack.unpackb(data)
+        except (ValueError, TypeError):
+            raise IncorrectDataRecivedError()
+
+    def stamp(self, payload: bytes | memoryview, timestamp: float) -> bytes | None:
+        """
+        Исходные байты не переиспользуются: чтобы заменить поле времени, словарь пришлось бы обойти
+        по заголовкам элементов в Python, а это дольше, чем сериализация сообщения заново в msgpack на C
+        """
+        return None
+
+
+def make_json_codec(backend: str = CommonConf.JSON_BACKEND, encoding: str = CommonConf.ENCODING) -> JSONCodec:
+    """
+    Выбирает реализацию JSON по настройке backend: orjson используется, если он установлен
+    и кодировка - UTF-8 (orjson пишет только её); иначе - стандартный модуль json
+    """
+    is_utf8 = encoding.lower().replace("-", "") == "utf8"
+    if backend in ("orjson", "auto") and orjson is not None and is_utf8:
+        return OrjsonCodec(encoding)
+    return JSONCodec(encoding)
+
+
+JSON_CODEC = make_json_codec()
+
+CODECS = {JSON_CODEC.name: JSON_CODEC}
+if msgpack is not None:
+    CODECS[MsgPackCodec.name] = MsgPackCodec()
+
+
+def get_codec(name: str | None):
+    """Возвращает кодек по имени; неизвестное или отсутствующее имя означает JSON"""
+    return CODECS.get(name, JSON_CODEC)  # type: ignore
+
+
+def supported_codecs(preferred: tuple = CommonConf.CODECS) -> list[str]:
+    """Имена доступных в этой установке кодеков в порядке предпочтения из настроек"""
+    return [name for name in preferred if name in CODECS]
+
+
+def choose_codec(offer, preferred: tuple = CommonConf.CODECS) -> str | None:
+    """Выбирает первый из предложенных клиентом кодеков, который поддерживает и разрешает сервер"""
+    if not isinstance(offer, list):
+        return None
+    supported = supported_codecs(preferred)
+    for name in offer:
+        if name in supported:
+            return name
+    return None
@@ -6,3 +6,13 @@ class CommonConf:
     MAX_PACKAGE_LENGTH = 640 * 2
     ENCODING = "utf-8"
     DEFAULT_PORT = 7777
+    FRAMING_ENABLED = True
+    MAX_FRAME_LENGTH = 1024 * 1024
+    RECV_BUFFER_SIZE = 64 * 1024
+    RECV_BUFFER_CLASSES = (4 * 1024, 64 * 1024, 2 * 1024 * 1024)  # классы размеров пула буферов приема
+    RECV_POOL_MAX_FREE = 16  # свободных буферов каждого класса, которые пул хранит для повторной выдачи
+    COMPRESSION_ENABLED = True
+    COMPRESSION_THRESHOLD = 1024  # байт; кадры короче порога не сжимаются
+    COMPRESSION_LEVEL = 6
+    CODECS = ("msgpack", "json")  # в порядке предпочтения; двоичный кодек используется только вместе с кадрами
+    JSON_BACKEND = "auto"  # "orjson", "json" или "auto" - orjson, если установлен; иначе стандартный модуль json
@@ -27,14 +27,19 @@ def log(logger):
 
 
 def login_required(fnc):
-    """Декоратор проверяет, залогинен ли пользователь на сервере"""
+    """
+    Декоратор проверяет, залогинен ли пользователь на сервере.
+    Соединением считается сокет или любой объект с интерфейсом сокета (например, адаптер потока asyncio),
+    сессия соединения ищется в реестре сессий сервера за O(1)
+    """
 
     @wraps(fnc)
     def check(*args, **kwargs):
         server = args[0]
         for arg in args[1:]:
-            if isinstance(arg, socket):
-                if arg not in server.active_clients.values():
+            if isinstance(arg, socket) or hasattr(arg, "getpeername"):
+                session = server.sessions.get(arg)
+                if session is None or not session.is_authenticated:
                     return HTTPStatus.FORBIDDEN, "", True
         return fnc(*args, **kwargs)
 
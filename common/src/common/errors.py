@@ -16,6 +16,18 @@ class IncorrectDataRecivedError(Exception):
         return "Принято некорректное сообщение от удалённого компьютера."
 
 
+class InvalidFieldError(IncorrectDataRecivedError):
+    """
+    Исключение - значение поля сообщения имеет недопустимый тип или превышает допустимый размер
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+
+    def __str__(self):
+        return f"Недопустимое значение поля сообщения: {self.field}."
+
+
 class NonDictInputError(Exception):
     """
     Исключение - аргумент функции не словарь
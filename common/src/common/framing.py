@@ -0,0 +1,133 @@
+import struct
+import zlib
+
+from .buffers import RECV_POOL, BufferPool
+from .config import CommonConf
+from .errors import IncorrectDataRecivedError
+
+FRAME_HEADER = struct.Struct("!I")
+COMPRESSED_FLAG = 0x80000000  # старший бит слова длины: тело кадра сжато zlib
+LENGTH_MASK = COMPRESSED_FLAG - 1
+
+
+def pack_frame(payload: bytes, compress_threshold: int | None = None) -> bytes:
+    """
+    Упаковывает сериализованное сообщение в кадр: 4 байта длины (big-endian) и тело сообщения.
+    Если задан порог и тело не короче порога, тело сжимается zlib (когда это дает выигрыш),
+    а в заголовке выставляется флаг сжатия
+    """
+    if compress_threshold is not None and len(payload) >= compress_threshold:
+        compressed = zlib.compress(payload, CommonConf.COMPRESSION_LEVEL)
+        if len(compressed) < len(payload):
+            return FRAME_HEADER.pack(len(compressed) | COMPRESSED_FLAG) + compressed
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """
+    Потоковый декодер кадров одного соединения: накапливает принятые байты
+    и при каждом чтении возвращает все полностью полученные сообщения (ноль или больше).
+    Сжатые кадры распаковываются; размер распакованного тела ограничен max_frame_length.
+    Байты хранятся в буфере из пула (RECV_POOL) и читаются в него напрямую через recv_into;
+    буфер занят соединением, только пока в нем есть недочитанный кадр
+    """
+
+    def __init__(self, max_frame_length: int = CommonConf.MAX_FRAME_LENGTH, pool: BufferPool = RECV_POOL) -> None:
+        self.max_frame_length = max_frame_length
+        self.pool = pool
+        self._buffer: bytearray | None = None
+        self._start = 0
+        self._end = 0
+        self._frame_size = FRAME_HEADER.size
+
+    @property
+    def buffer(self) -> bytearray:
+        """Принятые, но еще не разобранные байты (копия)"""
+        if self._buffer is None:
+            return bytearray()
+        return self._buffer[self._start : self._end]
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Добавляет принятые байты и возвращает тела готовых кадров (копии, их можно хранить)"""
+        self._reserve(len(data))
+        end = self._end + len(data)
+        self._buffer[self._end : end] = data  # type: ignore
+        self._end = end
+        payloads = [bytes(payload) for payload in self._parse()]
+        self.reclaim()
+        return payloads
+
+    def recv_from(self, sock) -> list:
+        """
+        Читает из сокета прямо в буфер (recv_into) и возвращает тела готовых кадров как memoryview без копирования.
+        Представления действительны до следующего чтения или reclaim(): после обработки сообщений
+        владелец соединения вызывает reclaim(), чтобы вернуть опустевший буфер в пул
+        """
+        self._reserve(max(self._frame_size - (self._end - self._start), 1))
+        with memoryview(self._buffer)[self._end :] as free:  # type: ignore
+            received = sock.recv_into(free)
+        if not received:
+            raise ConnectionResetError()
+        self._end += received
+        return self._parse()
+
+    def reclaim(self):
+        """Возвращает буфер в пул, если в нем не осталось байтов незавершенного кадра"""
+        if self._buffer is not None and self._start == self._end:
+            self.close()
+
+    def close(self):
+        """Возвращает буфер в пул вместе с недочитанными байтами (соединение закрыто)"""
+        if self._buffer is not None:
+            self.pool.release(self._buffer)
+        self._buffer = None
+        self._start = self._end = 0
+        self._frame_size = FRAME_HEADER.size
+
+    def _reserve(self, size: int):
+        """Обеспечивает не меньше size свободных байтов после данных: сдвигом данных к началу или буфером побольше"""
+        buffer = self._buffer
+        if buffer is None:
+            self._buffer = self.pool.acquire(max(size, CommonConf.RECV_BUFFER_SIZE))
+            return
+        if len(buffer) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if pending + size <= len(buffer):
+            buffer[:pending] = buffer[self._start : self._end]
+        else:
+            self._buffer = self.pool.acquire(pending + size)
+            self._buffer[:pending] = buffer[self._start : self._end]
+            self.pool.release(buffer)
+        self._start, self._end = 0, pending
+
+    def _parse(self) -> list:
+        buffer = self._buffer
+        view = memoryview(buffer)  # type: ignore
+        payloads = []
+        offset, end = self._start, self._end
+        self._frame_size = FRAME_HEADER.size
+        while end - offset >= FRAME_HEADER.size:
+            (header,) = FRAME_HEADER.unpack_from(buffer, offset)  # type: ignore
+            length = header & LENGTH_MASK
+            if length > self.max_frame_length:
+                raise IncorrectDataRecivedError()
+            frame_end = offset + FRAME_HEADER.size + length
+            if frame_end > end:
+                self._frame_size = FRAME_HEADER.size + length
+                break
+            payload = view[offset + FRAME_HEADER.size : frame_end]
+            payloads.append(self._decompress(payload) if header & COMPRESSED_FLAG else payload)
+            offset = frame_end
+        self._start = offset
+        return payloads
+
+    def _decompress(self, payload) -> bytes:
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(payload, self.max_frame_length)
+        except zlib.error:
+            raise IncorrectDataRecivedError()
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise IncorrectDataRecivedError()
+        return data
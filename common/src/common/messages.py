@@ -0,0 +1,148 @@
+from abc import abstractmethod
+from dataclasses import field, make_dataclass
+from keyword import iskeyword
+from typing import ClassVar
+
+from .schema import Actions, JIMValidationSchema, Keys, validate_msg
+
+
+class JIMMessage:
+    """
+    Базовый класс типизированных сообщений протокола JIM.
+    Классы сообщений генерируются из JIMValidationSchema: поля сообщения (и вложенного объекта пользователя)
+    становятся атрибутами в __slots__, а методы to_dict/from_dict переводят объект в словарь протокола и обратно.
+    Атрибут wire (не поле протокола) хранит пару (кодек, исходные байты) принятого из сети сообщения:
+    по ней сообщение пересылается без повторной сериализации
+    """
+
+    __slots__ = ()
+
+    action: ClassVar[str | None] = None
+
+    @abstractmethod
+    def to_dict(self) -> dict:
+        pass
+
+    @classmethod
+    @abstractmethod
+    def from_dict(cls, msg: dict) -> "JIMMessage":
+        pass
+
+
+# имена классов сообщений по значению поля action
+TYPE_NAMES = {
+    Actions.AUTH: "Auth",
+    Actions.PRESENCE: "Presence",
+    Actions.PROBE: "Probe",
+    Actions.QUIT: "Quit",
+    Actions.MSG: "ChatMsg",
+    Actions.JOIN: "Join",
+    Actions.LEAVE: "Leave",
+    Actions.CONTACTS: "Contacts",
+    Actions.ADD_CONTACT: "AddContact",
+    Actions.DEL_CONTACT: "DelContact",
+}
+
+# порядок полей в конструкторах повторяет порядок объявления ключей в Keys
+KEYS_ORDER = [value for name, value in vars(Keys).items() if not name.startswith("_")]
+
+
+def attr_name(key: str) -> str:
+    """Имя атрибута для ключа протокола: ключевые слова Python получают суффикс _ (from -> from_)"""
+    return f"{key}_" if iskeyword(key) else key
+
+
+def _make_message_type(name: str, action: str | None, keys: set, user_keys: set, optional: set) -> type:
+    keys = keys - {Keys.ACTION, Keys.TIME, Keys.USER}
+    required = [key for key in KEYS_ORDER if key in keys or key in user_keys]
+    optional_order = [key for key in KEYS_ORDER if key in optional]
+
+    fields = [(attr_name(key), object) for key in required]
+    fields.append((Keys.TIME, float, field(default=0.0)))
+    fields += [(attr_name(key), object, field(default=None)) for key in optional_order]
+    fields.append(("wire", object, field(default=None, compare=False, repr=False)))
+
+    # словарь протокола собирается одним литералом, необязательные поля добавляются, только если заданы
+    items = [] if action is None else [f"{Keys.ACTION!r}: {action!r}"]
+    items.append(f"{Keys.TIME!r}: self.time")
+    if user_keys:
+        user_items = ", ".join(f"{key!r}: self.{attr_name(key)}" for key in required if key in user_keys)
+        items.append(f"{Keys.USER!r}: {{{user_items}}}")
+    items += [f"{key!r}: self.{attr_name(key)}" for key in required if key not in user_keys]
+    to_dict_lines = ["def to_dict(self):", f"    msg = {{{', '.join(items)}}}"]
+    for key in optional_order:
+        to_dict_lines.append(f"    if self.{attr_name(key)} is not None:")
+        to_dict_lines.append(f"        msg[{key!r}] = self.{attr_name(key)}")
+    to_dict_lines.append("    return msg")
+
+    args = [f"user[{key!r}]" if key in user_keys else f"msg[{key!r}]" for key in required]
+    args.append(f"msg[{Keys.TIME!r}]")
+    args += [f"msg.get({key!r})" for key in optional_order]
+    from_dict_lines = ["def from_dict(cls, msg):"]
+    if user_keys:
+        from_dict_lines.append(f"    user = msg[{Keys.USER!r}]")
+    from_dict_lines.append(f"    return cls({', '.join(args)})")
+
+    namespace: dict = dict()
+    exec("\n".join(to_dict_lines) + "\n\n" + "\n".join(from_dict_lines), namespace)
+    return make_dataclass(
+        name,
+        fields,
+        bases=(JIMMessage,),
+        namespace={
+            "action": action,
+            "to_dict": namespace["to_dict"],
+            "from_dict": classmethod(namespace["from_dict"]),
+            "__module__": __name__,
+        },
+        slots=True,
+    )
+
+
+def make_message_types(schema=JIMValidationSchema) -> tuple[dict[str, type], type]:
+    """Генерирует классы сообщений для каждого действия схемы и общий класс ответа сервера"""
+    types = {
+        action: _make_message_type(
+            TYPE_NAMES[action],
+            action,
+            keys,
+            schema.usr_keys.get(action, set()),
+            schema.optional_keys.get(action, set()),
+        )
+        for action, keys in schema.msg_keys.items()
+    }
+    resp_keys = set().union(*schema.resp_keys.values())
+    response = _make_message_type(
+        "Response", None, {Keys.RESPONSE}, set(), (resp_keys - {Keys.RESPONSE, Keys.TIME}) | schema.resp_optional_keys
+    )
+    return types, response
+
+
+MESSAGE_TYPES, Response = make_message_types()
+
+Auth = MESSAGE_TYPES[Actions.AUTH]
+Presence = MESSAGE_TYPES[Actions.PRESENCE]
+Probe = MESSAGE_TYPES[Actions.PROBE]
+Quit = MESSAGE_TYPES[Actions.QUIT]
+ChatMsg = MESSAGE_TYPES[Actions.MSG]
+Join = MESSAGE_TYPES[Actions.JOIN]
+Leave = MESSAGE_TYPES[Actions.LEAVE]
+Contacts = MESSAGE_TYPES[Actions.CONTACTS]
+AddContact = MESSAGE_TYPES[Actions.ADD_CONTACT]
+DelContact = MESSAGE_TYPES[Actions.DEL_CONTACT]
+
+
+def parse_msg(msg: dict) -> JIMMessage:
+    """Проверяет словарь сообщения по схеме и возвращает типизированный объект сообщения"""
+    validate_msg(msg)
+    action = msg.get(Keys.ACTION)
+    if action is None:
+        return Response.from_dict(msg)
+    return MESSAGE_TYPES[action].from_dict(msg)
+
+
+def to_wire(obj) -> dict:
+    """Хук default для кодеков: типизированное сообщение сериализуется как словарь протокола"""
+    if isinstance(obj, JIMMessage):
+        return obj.to_dict()
+    raise TypeError(f"Объект типа {type(obj).__name__} не сериализуется")
@@ -1,4 +1,7 @@
 from dataclasses import dataclass
+from typing import Callable
+
+from .errors import IncorrectDataRecivedError, InvalidFieldError, ReqiuredFieldMissingError
 
 
 @dataclass
@@ -18,6 +21,8 @@ class Keys:
     RESPONSE = "response"
     ALERT = "alert"
     ERROR = "error"
+    FEATURES = "features"
+    TOKEN = "token"
 
 
 @dataclass
@@ -34,6 +39,14 @@ class Actions:
     LEAVE = "leave"
 
 
+@dataclass
+class Features:
+    FRAMING = "framing"
+    CODEC = "codec"
+    COMPRESSION = "compression"
+    OFFLINE_MSGS = "offline_msgs"
+
+
 @dataclass
 class JIMValidationSchema:
     msg_keys = {
@@ -51,7 +64,129 @@ class JIMValidationSchema:
 
     usr_keys = {Actions.AUTH: {Keys.ACCOUNT_NAME, Keys.PASSWORD}, Actions.PRESENCE: {Keys.ACCOUNT_NAME, Keys.STATUS}}
 
+    optional_keys = {Actions.AUTH: {Keys.FEATURES, Keys.TOKEN}}
+
     resp_keys = {
         Keys.ALERT: {Keys.RESPONSE, Keys.ALERT, Keys.TIME},
         Keys.ERROR: {Keys.RESPONSE, Keys.ERROR, Keys.TIME},
     }
+
+    # необязательные поля ответа: принятые возможности протокола и токен сессии после входа
+    resp_optional_keys = {Keys.FEATURES, Keys.TOKEN}
+
+    # допустимые типы значений полей (проверяется точный тип, как его возвращает кодек)
+    field_types = {
+        Keys.ACTION: (str,),
+        Keys.TIME: (float, int),
+        Keys.USER: (dict,),
+        Keys.CONTACT: (str,),
+        Keys.ACCOUNT_NAME: (str,),
+        Keys.PASSWORD: (str,),
+        Keys.STATUS: (str,),
+        Keys.FROM: (str,),
+        Keys.TO: (str,),
+        Keys.ROOM: (str,),
+        Keys.ENCODING: (str,),
+        Keys.MSG: (str,),
+        Keys.RESPONSE: (int,),
+        Keys.ALERT: (str, list),
+        Keys.ERROR: (str,),
+        Keys.FEATURES: (dict,),
+        Keys.TOKEN: (str,),
+    }
+
+    # максимальная длина строковых полей и списков
+    field_limits = {
+        Keys.CONTACT: 64,
+        Keys.ACCOUNT_NAME: 64,
+        Keys.PASSWORD: 256,
+        Keys.STATUS: 256,
+        Keys.FROM: 64,
+        Keys.TO: 64,
+        Keys.ROOM: 64,
+        Keys.ENCODING: 32,
+        Keys.MSG: 64 * 1024,
+        Keys.ERROR: 1024,
+        Keys.ALERT: 100_000,
+        Keys.TOKEN: 512,
+    }
+
+
+def _field_checks(source: str, keys: set, optional: set, required_name: str) -> list[str]:
+    """Строки кода проверки полей объекта source: наличие, точный тип и размер"""
+    schema = JIMValidationSchema
+    lines = []
+    for key in sorted(keys | optional):
+        types = schema.field_types[key]
+        limit = schema.field_limits.get(key)
+        lines.append(f"    value = {source}.get({key!r})")
+        if key in optional:
+            lines.append("    if value is not None:")
+            indent = "        "
+        else:
+            lines.append("    if value is None:")
+            lines.append(f"        raise ReqiuredFieldMissingError(missing_fields={required_name} - {source}.keys())")
+            indent = "    "
+        if len(types) == 1:
+            lines.append(f"{indent}if type(value) is not {types[0].__name__}:")
+        else:
+            lines.append(f"{indent}if type(value) not in ({', '.join(t.__name__ for t in types)}):")
+        lines.append(f"{indent}    raise InvalidFieldError({key!r})")
+        if limit is not None:
+            lines.append(f"{indent}if len(value) > {limit}:")
+            lines.append(f"{indent}    raise InvalidFieldError({key!r})")
+    return lines
+
+
+def _compile_validator(keys: set, user_keys: set | None = None, optional: set = set()) -> Callable[[dict], dict]:
+    """
+    Строит функцию проверки сообщения одного вида: наличие полей, их типы и размеры.
+    Код функции генерируется из схемы одной линейной последовательностью проверок, без циклов по схеме
+    """
+    lines = ["def validate(msg):"]
+    lines += _field_checks("msg", keys, optional, "required")
+    if user_keys:
+        lines.append("    user = msg[%r]" % Keys.USER)
+        lines += _field_checks("user", user_keys, set(), "user_required")
+    lines.append("    return msg")
+    namespace = {
+        "required": frozenset(keys),
+        "user_required": frozenset(user_keys or ()),
+        "ReqiuredFieldMissingError": ReqiuredFieldMissingError,
+        "InvalidFieldError": InvalidFieldError,
+    }
+    exec("\n".join(lines), namespace)
+    return namespace["validate"]
+
+
+def compile_validators(schema=JIMValidationSchema) -> tuple[dict[str, Callable], Callable, Callable]:
+    """
+    Компилирует схему в функции проверки: по одной на каждое действие и по одной на ответы с кодом успеха
+    и с кодом ошибки. Выполняется один раз при импорте модуля
+    """
+    msg_validators = {
+        action: _compile_validator(keys, schema.usr_keys.get(action), schema.optional_keys.get(action, set()))
+        for action, keys in schema.msg_keys.items()
+    }
+    return (
+        msg_validators,
+        _compile_validator(schema.resp_keys[Keys.ALERT], optional=schema.resp_optional_keys),
+        _compile_validator(schema.resp_keys[Keys.ERROR], optional=schema.resp_optional_keys),
+    )
+
+
+MSG_VALIDATORS, ALERT_VALIDATOR, ERROR_VALIDATOR = compile_validators()
+
+
+def validate_msg(msg: dict) -> dict:
+    """Проверяет сообщение скомпилированной функцией его вида и возвращает его же"""
+    action = msg.get(Keys.ACTION)
+    if action is not None:
+        validator = MSG_VALIDATORS.get(action)
+        if validator is None:
+            raise IncorrectDataRecivedError()
+        return validator(msg)
+    response = msg.get(Keys.RESPONSE)
+    if type(response) is not int:
+        raise IncorrectDataRecivedError()
+    return ERROR_VALIDATOR(msg) if 400 <= response < 600 else ALERT_VALIDATOR(msg)
@@ -0,0 +1,105 @@
+"""
+Бенчмарк перебора паролей: потоки непрерывно подключаются и входят на сервер с неверным паролем
+существующего пользователя или под несуществующими именами. Сравнивается сервер без ограничений
+(каждая попытка стоит PBKDF2 и запроса к БД) и с ограничением частоты попыток и отрицательным кешем имен.
+Печатает число попыток в секунду, задержку отказа, число проверок пароля и процессорное время на попытку.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_auth_bruteforce.py --threads 8 --duration 5``
+"""
+
+import argparse
+import itertools
+import threading
+import time
+from collections import Counter
+
+from common.schema import Keys
+from server.config import ServerConf
+from server.run_server_cli import ENGINES
+from utils import BenchClient, BenchServer, cpu_time, percentile, silence_server_logs, use_temp_database
+
+UNLIMITED = {"AUTH_IP_BURST": 10**9, "AUTH_USER_BURST": 10**9, "UNKNOWN_USER_TTL": 0.0}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Auth brute-force benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17810)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--mode", choices=("password", "unknown"), default="password")
+    return parser.parse_args()
+
+
+def attack(port: int, usernames: list[str], deadline: float, stats: dict):
+    for username in itertools.cycle(usernames):
+        if time.perf_counter() >= deadline:
+            break
+        started = time.perf_counter()
+        client = BenchClient(port, username)
+        try:
+            resp = client.authenticate(password="wrong_password")
+        except OSError:
+            stats["codes"]["error"] += 1
+            continue
+        finally:
+            client.close()
+        stats["codes"][resp.get(Keys.RESPONSE)] += 1
+        stats["latencies"].append(time.perf_counter() - started)
+
+
+def run(args, port: int, is_limited: bool) -> dict:
+    saved = {name: getattr(ServerConf, name) for name in UNLIMITED}
+    if not is_limited:
+        for name, value in UNLIMITED.items():
+            setattr(ServerConf, name, value)
+    bench = BenchServer(ENGINES[args.engine], port, users=["victim"]).start()
+    for name, value in saved.items():
+        setattr(ServerConf, name, value)
+    checks = itertools.count()
+    check_user_auth = bench.server.storage.check_user_auth
+
+    def counting_check(*check_args):
+        next(checks)
+        return check_user_auth(*check_args)
+
+    bench.server.storage.check_user_auth = counting_check
+    stats: dict = {"codes": Counter(), "latencies": []}
+    try:
+        cpu_started = cpu_time()
+        deadline = time.perf_counter() + args.duration
+        threads = []
+        for index in range(args.threads):
+            usernames = ["victim"] if args.mode == "password" else [f"ghost{index}_{n}" for n in range(4)]
+            threads.append(threading.Thread(target=attack, args=(port, usernames, deadline, stats)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats["cpu"] = cpu_time() - cpu_started
+    finally:
+        bench.stop()
+    stats["checks"] = next(checks)
+    return stats
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"engine={args.engine} mode={args.mode} threads={args.threads} duration={args.duration}s")
+    print(f"{'throttle':<9} {'tries/s':>8} {'p50, ms':>8} {'checks':>7} {'cpu/try, us':>12}  responses")
+    for offset, is_limited in enumerate((False, True)):
+        stats = run(args, args.port + offset, is_limited)
+        attempts = sum(stats["codes"].values())
+        codes = ", ".join(f"{code}: {count}" for code, count in sorted(stats["codes"].items(), key=str))
+        print(
+            f"{'on' if is_limited else 'off':<9} {attempts / args.duration:>8.0f} "
+            f"{percentile(stats['latencies'], 0.5) * 1000:>8.2f} {stats['checks']:>7} "
+            f"{stats['cpu'] / attempts * 1e6:>12.0f}  {codes}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Бенчмарк пути сообщения чата с учетом списка контактов: пары клиентов обмениваются сообщениями через сервер
+с настоящей базой данных. Сравнивается запись контакта в БД на каждое сообщение (кеш контактов отключен)
+и проверка связи в графе контактов в памяти. Печатает число сообщений в секунду, задержку доставки
+и число транзакций БД за замер.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_chat_contacts.py --pairs 4 --messages 500``
+"""
+
+import argparse
+import threading
+import time
+
+from sqlalchemy import event
+
+from common.schema import Actions
+from server.run_server_cli import ENGINES
+from utils import BenchClient, BenchServer, percentile, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chat contact graph benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17870)
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=500)
+    return parser.parse_args()
+
+
+def chat(port: int, index: int, messages: int, latencies: list[float]):
+    sender = BenchClient(port, f"sender{index}")
+    receiver = BenchClient(port, f"receiver{index}")
+    sender.authenticate()
+    receiver.authenticate()
+    for number in range(messages):
+        sent = time.perf_counter()
+        sender.send(sender.make_msg(to=receiver.username, text=f"ping {number}"))
+        receiver.recv_action(Actions.MSG)
+        latencies.append(time.perf_counter() - sent)
+        sender.recv()
+    sender.close()
+    receiver.close()
+
+
+def run(args, port: int, use_cache: bool) -> tuple[list[float], float, int]:
+    users = [f"{role}{index}" for index in range(args.pairs) for role in ("sender", "receiver")]
+    bench = BenchServer(ENGINES[args.engine], port, users=users).start()
+    if not use_cache:
+        bench.server.contacts.has = lambda username, contact_name: False
+    commits = [0]
+    event.listen(bench.server.storage.session, "after_commit", lambda session: commits.__setitem__(0, commits[0] + 1))
+    latencies: list[float] = []
+    try:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=chat, args=(port, i, args.messages, latencies)) for i in range(args.pairs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        bench.stop()
+    return latencies, elapsed, commits[0]
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"engine={args.engine} pairs={args.pairs} messages={args.messages}")
+    print(f"{'contacts':<9} {'msg/s':>7} {'p50, ms':>8} {'p99, ms':>8} {'commits':>8}")
+    for offset, use_cache in enumerate((False, True)):
+        latencies, elapsed, commits = run(args, args.port + offset, use_cache)
+        print(
+            f"{'memory' if use_cache else 'db':<9} {len(latencies) / elapsed:>7.0f} "
+            f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {commits:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
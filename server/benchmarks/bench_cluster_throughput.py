@@ -0,0 +1,82 @@
+"""
+Бенчмарк пропускной способности сервера в режиме pre-fork: N воркеров на одном порту (SO_REUSEPORT).
+Пары клиентов в отдельных процессах обмениваются сообщениями; получатель часто подключен
+к другому воркеру, поэтому в замер входит и пересылка через Unix-сокеты между воркерами.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_cluster_throughput.py -w 4 --pairs 8 --messages 2000``
+"""
+
+import argparse
+import time
+from multiprocessing import Barrier, Process, Queue
+
+from common.schema import Actions
+from server.cluster import run_cluster
+from server.config import ServerConf
+from server.storage import ServerStorage
+from utils import BENCH_PASSWORD, BenchClient, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pre-fork cluster throughput benchmark.")
+    parser.add_argument("-w", "--workers", type=int, default=2)
+    parser.add_argument("-p", "--port", type=int, default=17811)
+    parser.add_argument("--pairs", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=32, help="Messages in flight per pair")
+    return parser.parse_args()
+
+
+def run_pair(index: int, args, barrier, results: Queue):
+    sender = BenchClient(args.port, f"sender_{index}")
+    receiver = BenchClient(args.port, f"receiver_{index}")
+    sender.authenticate()
+    receiver.authenticate()
+    time.sleep(0.5)  # воркеры успевают разослать друг другу события о входе пользователей
+    barrier.wait()
+    started = time.perf_counter()
+    sent = received = 0
+    while received < args.messages:
+        while sent < args.messages and sent - received < args.window:
+            sender.send(sender.make_msg(to=receiver.username, text=f"message {sent}"))
+            sent += 1
+        receiver.recv_action(Actions.MSG)
+        received += 1
+    results.put(time.perf_counter() - started)
+    sender.close()
+    receiver.close()
+
+
+def main():
+    args = parse_args()
+    data_dir = use_temp_database()
+    ServerConf.CLUSTER_DIR = data_dir / "cluster"
+    silence_server_logs()
+    storage = ServerStorage()
+    for index in range(args.pairs):
+        for username in (f"sender_{index}", f"receiver_{index}"):
+            storage.add_user(username=username, password=BENCH_PASSWORD)
+    storage.session.close()
+
+    cluster = Process(target=run_cluster, args=("127.0.0.1", args.port, args.workers))
+    cluster.start()
+    time.sleep(1)
+    try:
+        barrier, results = Barrier(args.pairs), Queue()
+        pairs = [Process(target=run_pair, args=(index, args, barrier, results)) for index in range(args.pairs)]
+        for pair in pairs:
+            pair.start()
+        durations = [results.get() for _ in pairs]
+        for pair in pairs:
+            pair.join()
+        total = args.pairs * args.messages
+        print(f"workers={args.workers} pairs={args.pairs} messages={total}")
+        print(f"throughput: {total / max(durations):.0f} msg/s (slowest pair {max(durations):.2f} s)")
+    finally:
+        cluster.terminate()
+        cluster.join()
+
+
+if __name__ == "__main__":
+    main()
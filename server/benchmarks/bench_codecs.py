@@ -0,0 +1,79 @@
+"""
+Бенчмарк кодеков сообщений: скорость сериализации и разбора и размер на проводе
+для каждого действия из JIMValidationSchema.msg_keys и для ответа со списком контактов.
+JSON замеряется в обеих реализациях (стандартный модуль json и orjson, если установлен).
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_codecs.py --ops 50000``
+"""
+
+import argparse
+import time
+from http import HTTPStatus
+
+from common.codecs import CODECS, JSONCodec, OrjsonCodec, orjson
+from common.schema import Actions, JIMValidationSchema, Keys
+
+SAMPLE_USER = "some_user_name"
+SAMPLE_VALUES = {
+    Keys.TIME: 1700000000.123456,
+    Keys.USER: {Keys.ACCOUNT_NAME: SAMPLE_USER, Keys.PASSWORD: "password", Keys.STATUS: "На связи"},
+    Keys.ACCOUNT_NAME: SAMPLE_USER,
+    Keys.CONTACT: "contact_name",
+    Keys.FROM: SAMPLE_USER,
+    Keys.TO: "contact_name",
+    Keys.ROOM: "#room",
+    Keys.MSG: "Привет! Как дела? Это обычное сообщение средней длины для замера.",
+    Keys.ENCODING: "utf-8",
+}
+
+
+def make_samples() -> dict[str, dict]:
+    samples = dict()
+    for action, keys in JIMValidationSchema.msg_keys.items():
+        samples[action] = {key: action if key == Keys.ACTION else SAMPLE_VALUES[key] for key in keys}
+    samples["response (100 contacts)"] = {
+        Keys.RESPONSE: HTTPStatus.ACCEPTED.value,
+        Keys.ALERT: [f"contact_{index}" for index in range(100)],
+        Keys.TIME: SAMPLE_VALUES[Keys.TIME],
+    }
+    return samples
+
+
+def per_op_us(fnc, arg, ops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(ops):
+        fnc(arg)
+    return (time.perf_counter() - started) / ops * 1e6
+
+
+def codecs_to_compare() -> list:
+    codecs = [JSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    return codecs + [codec for name, codec in CODECS.items() if name != JSONCodec.name]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Message codecs benchmark.")
+    parser.add_argument("--ops", type=int, default=50000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    codecs = codecs_to_compare()
+    print(f"codecs: {', '.join(getattr(codec, 'backend', codec.name) for codec in codecs)}")
+    print(f"{'action':<24} {'codec':<8} {'bytes':>6} {'encode, us':>11} {'decode, us':>11} {'msg/s':>9}")
+    for action, msg in make_samples().items():
+        for codec in codecs:
+            data = codec.encode(msg)
+            encode = per_op_us(codec.encode, msg, args.ops)
+            decode = per_op_us(codec.decode, data, args.ops)
+            throughput = 1e6 / (encode + decode)
+            label = getattr(codec, "backend", codec.name)
+            print(f"{action:<24} {label:<8} {len(data):>6} {encode:>11.2f} {decode:>11.2f} {throughput:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
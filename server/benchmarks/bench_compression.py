@@ -0,0 +1,58 @@
+"""
+Бенчмарк сжатия кадров: размер на проводе и затраты CPU на упаковку и распаковку кадра
+для разных порогов сжатия на типичных сообщениях (списки контактов, короткие и длинные тексты).
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_compression.py --thresholds 0 256 1024 4096``
+"""
+
+import argparse
+import time
+from http import HTTPStatus
+
+from common.codecs import JSON_CODEC
+from common.framing import FrameDecoder, pack_frame
+from common.schema import Actions, Keys
+
+CHAT_TEXT = "Привет! Созвонимся вечером, обсудим планы на выходные и заодно проект. "
+
+
+def make_samples() -> dict[str, bytes]:
+    samples = dict()
+    for contacts in (10, 100, 1000):
+        msg = {Keys.RESPONSE: HTTPStatus.ACCEPTED.value, Keys.ALERT: [f"contact_{i}" for i in range(contacts)]}
+        samples[f"contacts x{contacts}"] = JSON_CODEC.encode(msg)
+    for length in (100, 1000, 10000):
+        text = (CHAT_TEXT * (length // len(CHAT_TEXT) + 1))[:length]
+        msg = {Keys.ACTION: Actions.MSG, Keys.FROM: "user", Keys.TO: "contact", Keys.MSG: text, Keys.ENCODING: "utf-8"}
+        samples[f"text {length} chars"] = JSON_CODEC.encode(msg)
+    return samples
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Frame compression benchmark.")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[0, 256, 1024, 4096], help="0 - без сжатия")
+    parser.add_argument("--ops", type=int, default=5000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    samples = make_samples()
+    print(f"{'payload':<18} {'threshold':>9} {'raw, B':>8} {'wire, B':>8} {'ratio':>6} {'pack+unpack, us':>16}")
+    for name, payload in samples.items():
+        for threshold in args.thresholds:
+            compress_threshold = threshold or None
+            frame = pack_frame(payload, compress_threshold)
+            decoder = FrameDecoder()
+            started = time.perf_counter()
+            for _ in range(args.ops):
+                decoder.feed(pack_frame(payload, compress_threshold))
+            cpu = (time.perf_counter() - started) / args.ops * 1e6
+            label = threshold or "off"
+            ratio = len(frame) / (len(payload) + 4)
+            print(f"{name:<18} {label:>9} {len(payload):>8} {len(frame):>8} {ratio:>6.2f} {cpu:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Бенчмарк цикла событий сервера: загрузка CPU при большом числе простаивающих соединений
+и задержка доставки сообщения между двумя клиентами на фоне этих соединений.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_idle_connections.py -n 5000 -e socket``
+"""
+
+import argparse
+import time
+
+from common.schema import Actions
+from server.run_server_cli import ENGINES
+from utils import (
+    BenchClient,
+    BenchServer,
+    cpu_time,
+    percentile,
+    raise_open_files_limit,
+    silence_server_logs,
+    use_temp_database,
+    wait_for,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Idle connections CPU and message latency benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-n", "--connections", type=int, default=5000)
+    parser.add_argument("-p", "--port", type=int, default=17801)
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    parser.add_argument("--messages", type=int, default=500)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    raise_open_files_limit(2 * args.connections + 256)
+    use_temp_database()
+    silence_server_logs()
+    bench = BenchServer(ENGINES[args.engine], args.port, users=["sender", "receiver"]).start()
+    try:
+        idle_clients = [BenchClient(args.port, f"idle_{index}") for index in range(args.connections)]
+        sender = BenchClient(args.port, "sender")
+        receiver = BenchClient(args.port, "receiver")
+        sender.authenticate()
+        receiver.authenticate()
+        expected = args.connections + 2
+        if not wait_for(lambda: len(bench.server.sessions) >= expected):
+            raise SystemExit(f"Сервер принял {len(bench.server.sessions)} из {expected} соединений")
+
+        wall_start, cpu_start = time.perf_counter(), cpu_time()
+        time.sleep(args.idle_seconds)
+        wall, cpu = time.perf_counter() - wall_start, cpu_time() - cpu_start
+
+        latencies = []
+        for index in range(args.messages):
+            started = time.perf_counter()
+            sender.send(sender.make_msg(to=receiver.username, text=f"ping {index}"))
+            receiver.recv_action(Actions.MSG)
+            latencies.append(time.perf_counter() - started)
+            sender.recv()
+
+        print(f"engine={args.engine} idle_connections={args.connections}")
+        print(f"idle CPU: {100 * cpu / wall:.2f}% ({cpu:.3f} s CPU over {wall:.1f} s)")
+        print(
+            "message latency: "
+            f"p50={percentile(latencies, 0.5) * 1000:.3f} ms, "
+            f"p99={percentile(latencies, 0.99) * 1000:.3f} ms, "
+            f"max={max(latencies) * 1000:.3f} ms"
+        )
+        for client in idle_clients + [sender, receiver]:
+            client.close()
+    finally:
+        bench.stop()
+
+
+if __name__ == "__main__":
+    main()
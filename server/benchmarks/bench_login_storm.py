@@ -0,0 +1,99 @@
+"""
+Бенчмарк лавины входов: несколько потоков непрерывно подключаются и входят на сервер (как после сетевого сбоя),
+а пара клиентов обменивается сообщениями. Измеряется задержка доставки сообщений и число входов в секунду
+с проверкой паролей в цикле событий (BLOCKING_WORKERS = 0) и в пуле потоков.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_login_storm.py --storm-threads 8 --messages 300``
+"""
+
+import argparse
+import threading
+import time
+
+from common.schema import Actions
+from server.config import ServerConf
+from server.run_server_cli import ENGINES
+from utils import BenchClient, BenchServer, percentile, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Login storm benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17806)
+    parser.add_argument("--storm-threads", type=int, default=8)
+    parser.add_argument("--storm-users", type=int, default=64)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=ServerConf.BLOCKING_WORKERS or 4)
+    return parser.parse_args()
+
+
+def storm(port: int, usernames: list[str], stop: threading.Event, counter: list[int]):
+    index = 0
+    while not stop.is_set():
+        client = BenchClient(port, usernames[index % len(usernames)])
+        try:
+            client.authenticate()
+            counter[0] += 1
+        except OSError:
+            pass
+        finally:
+            client.close()
+        index += 1
+
+
+def run(args, workers: int, port: int) -> tuple[list[float], float]:
+    ServerConf.BLOCKING_WORKERS = workers
+    storm_users = [f"storm{index}" for index in range(args.storm_users)]
+    bench = BenchServer(ENGINES[args.engine], port, users=["sender", "receiver"] + storm_users).start()
+    try:
+        sender = BenchClient(port, "sender")
+        receiver = BenchClient(port, "receiver")
+        sender.authenticate()
+        receiver.authenticate()
+
+        stop, logins = threading.Event(), [0]
+        threads = []
+        for index in range(args.storm_threads):
+            usernames = storm_users[index :: args.storm_threads]
+            threads.append(threading.Thread(target=storm, args=(port, usernames, stop, logins)))
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+
+        latencies = []
+        started = time.perf_counter()
+        logins_before = logins[0]
+        for index in range(args.messages):
+            sent = time.perf_counter()
+            sender.send(sender.make_msg(to=receiver.username, text=f"ping {index}"))
+            receiver.recv_action(Actions.MSG)
+            latencies.append(time.perf_counter() - sent)
+            sender.recv()
+        login_rate = (logins[0] - logins_before) / (time.perf_counter() - started)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=10)
+        sender.close()
+        receiver.close()
+    finally:
+        bench.stop()
+    return latencies, login_rate
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"engine={args.engine} storm threads={args.storm_threads} messages={args.messages}")
+    print(f"{'workers':<8} {'p50, ms':>8} {'p99, ms':>8} {'max, ms':>8} {'logins/s':>9}")
+    for offset, workers in enumerate((0, args.workers)):
+        latencies, login_rate = run(args, workers, args.port + offset)
+        print(
+            f"{workers:<8} {percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+            f"{max(latencies) * 1000:>8.2f} {login_rate:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
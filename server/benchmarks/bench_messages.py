@@ -0,0 +1,104 @@
+"""
+Бенчмарк типизированных сообщений против словарей: память на одно удерживаемое сообщение,
+число выделений памяти и время на построение и сериализацию сообщения.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_messages.py --count 100000``
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from http import HTTPStatus
+
+from common.codecs import CODECS
+from common.messages import ChatMsg, Presence, Response
+from common.schema import Actions, Keys
+
+TIMESTAMP = 1700000000.123456
+TEXT = "Привет! Как дела? Это обычное сообщение средней длины для замера."
+
+
+def make_variants(index: int = 0) -> dict:
+    user = f"user_{index}"
+    return {
+        "presence": (
+            lambda: {
+                Keys.ACTION: Actions.PRESENCE,
+                Keys.TIME: TIMESTAMP,
+                Keys.USER: {Keys.ACCOUNT_NAME: user, Keys.STATUS: ""},
+            },
+            lambda: Presence(account_name=user, status="", time=TIMESTAMP),
+        ),
+        "msg": (
+            lambda: {
+                Keys.ACTION: Actions.MSG,
+                Keys.TIME: TIMESTAMP,
+                Keys.FROM: user,
+                Keys.TO: "contact",
+                Keys.MSG: TEXT,
+                Keys.ENCODING: "utf-8",
+            },
+            lambda: ChatMsg(from_=user, to="contact", encoding="utf-8", message=TEXT, time=TIMESTAMP),
+        ),
+        "response": (
+            lambda: {Keys.RESPONSE: HTTPStatus.OK.value, Keys.ALERT: HTTPStatus.OK.phrase, Keys.TIME: TIMESTAMP},
+            lambda: Response(HTTPStatus.OK.value, alert=HTTPStatus.OK.phrase, time=TIMESTAMP),
+        ),
+    }
+
+
+def held_bytes(factory, count: int) -> float:
+    """Память на одно сообщение при удержании count сообщений (например, в очереди)"""
+    gc.collect()
+    tracemalloc.start()
+    held = [factory() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return size / count
+
+
+def allocations(fnc, ops: int) -> float:
+    """Число живых блоков памяти, выделенных за одну операцию, удерживающую свой результат"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    held = [fnc() for _ in range(ops)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del held
+    return blocks / ops
+
+
+def per_op_us(fnc, ops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(ops):
+        fnc()
+    return (time.perf_counter() - started) / ops * 1e6
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Typed messages vs dicts benchmark.")
+    parser.add_argument("--count", type=int, default=100000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(
+        f"{'message':<10} {'kind':<6} {'held, B':>8} {'blocks/op':>10} "
+        + " ".join(f"{f'{name}, us':>12}" for name in CODECS)
+    )
+    for name, (make_dict, make_typed) in make_variants().items():
+        for kind, factory in (("dict", make_dict), ("typed", make_typed)):
+            held = held_bytes(factory, args.count)
+            blocks = allocations(factory, args.count // 10)
+            timings = [per_op_us(lambda: codec.encode(factory()), args.count) for codec in CODECS.values()]
+            print(f"{name:<10} {kind:<6} {held:>8.1f} {blocks:>10.2f} " + " ".join(f"{t:>12.3f}" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
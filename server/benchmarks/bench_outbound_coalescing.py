@@ -0,0 +1,103 @@
+"""
+Бенчмарк объединения исходящих кадров: несколько отправителей присылают пачки сообщений одному получателю,
+сервер отвечает отправителям и пересылает сообщения получателю. Считаются системные вызовы send/sendmsg
+исходящих очередей на одно сообщение без объединения (кадр отправляется сразу) и с объединением
+кадров за итерацию цикла (ServerConf.OUTBOUND_COALESCE).
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_outbound_coalescing.py --senders 4 --burst 16 --rounds 20``
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from common.framing import pack_frame
+from common.schema import Actions
+from server.buffers import OutboundBuffer
+from server.config import ServerConf
+from server.transport import JIMServer
+from utils import BenchClient, BenchServer, silence_server_logs, use_temp_database
+
+
+class CountingSocket:
+    """Обертка сокета, считающая вызовы отправки"""
+
+    def __init__(self, sock, calls: Counter) -> None:
+        self.sock = sock
+        self.calls = calls
+
+    def send(self, data) -> int:
+        self.calls["send"] += 1
+        return self.sock.send(data)
+
+    def sendmsg(self, buffers) -> int:
+        self.calls["sendmsg"] += 1
+        return self.sock.sendmsg(buffers)
+
+
+def count_send_calls(calls: Counter):
+    flush = OutboundBuffer.flush
+
+    def counted_flush(buffer, sock):
+        return flush(buffer, CountingSocket(sock, calls))
+
+    OutboundBuffer.flush = counted_flush  # type: ignore
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Outbound frames coalescing benchmark.")
+    parser.add_argument("-p", "--port", type=int, default=17805)
+    parser.add_argument("--senders", type=int, default=4)
+    parser.add_argument("--burst", type=int, default=16, help="Сообщений в одной пачке отправителя")
+    parser.add_argument("--rounds", type=int, default=20)
+    return parser.parse_args()
+
+
+def run_rounds(senders: list[BenchClient], receiver: BenchClient, args) -> float:
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for sender in senders:
+            msgs = (sender.make_msg(to=receiver.username, text=f"msg {index}") for index in range(args.burst))
+            sender.sock.sendall(b"".join(pack_frame(sender._dump_msg(msg)) for msg in msgs))
+        for _ in range(len(senders) * args.burst):
+            receiver.recv_action(Actions.MSG)
+        for sender in senders:
+            for _ in range(args.burst):
+                sender.recv()
+    return time.perf_counter() - started
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    calls: Counter = Counter()
+    count_send_calls(calls)
+    users = [f"sender{index}" for index in range(args.senders)] + ["receiver"]
+    bench = BenchServer(JIMServer, args.port, users=users).start()
+    try:
+        senders = [BenchClient(args.port, username) for username in users[:-1]]
+        receiver = BenchClient(args.port, users[-1])
+        for client in senders + [receiver]:
+            client.authenticate()
+        messages = args.rounds * args.senders * args.burst
+        print(f"{'coalesce':<9} {'send':>8} {'sendmsg':>8} {'calls/msg':>10} {'msg/s':>9}")
+        for coalesce in (False, True):
+            ServerConf.OUTBOUND_COALESCE = coalesce
+            run_rounds(senders, receiver, args)  # прогрев и переключение режима на стороне сервера
+            calls.clear()
+            elapsed = run_rounds(senders, receiver, args)
+            total = calls["send"] + calls["sendmsg"]
+            print(
+                f"{str(coalesce):<9} {calls['send']:>8} {calls['sendmsg']:>8} "
+                f"{total / messages:>10.3f} {messages / elapsed:>9.0f}"
+            )
+        for client in senders + [receiver]:
+            client.close()
+    finally:
+        bench.stop()
+
+
+if __name__ == "__main__":
+    main()
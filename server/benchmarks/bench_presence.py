@@ -0,0 +1,70 @@
+"""
+Микробенчмарк присутствия: смена статуса и запрос списка пользователей в сети через строки таблицы users
+(SELECT + COMMIT на каждое изменение, полный просмотр таблицы на запрос) и через таблицу присутствия в памяти.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_presence.py --users 1000 10000 --online 0.1``
+"""
+
+import argparse
+import time
+
+from server.model import User
+from server.presence import PresenceRegistry
+from server.storage import ServerStorage
+from utils import NullConnection, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Presence registry benchmark.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--online", type=float, default=0.1, help="доля пользователей в сети")
+    parser.add_argument("--ops", type=int, default=200)
+    return parser.parse_args()
+
+
+def per_op_us(fnc, ops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(ops):
+        fnc()
+    return (time.perf_counter() - started) / ops * 1e6
+
+
+def bench(storage: ServerStorage, users: int, online: int, ops: int) -> tuple[float, ...]:
+    existing = storage.session.query(User).count()
+    # пароль не нужен для замера, поэтому пользователи добавляются без PBKDF2
+    mappings = [{"username": f"user{index}", "password": ""} for index in range(existing, users)]
+    storage.session.bulk_insert_mappings(User, mappings)
+    storage.session.commit()
+    presence = PresenceRegistry()
+    for index in range(online):
+        storage.change_user_status(f"user{index}", is_active=True)
+        presence.set_online(f"user{index}", NullConnection())
+    username = f"user{online - 1}"
+    return (
+        per_op_us(lambda: storage.change_user_status(username, is_active=True, status="busy"), ops),
+        per_op_us(lambda: presence.set_status(username, "busy"), ops * 100),
+        per_op_us(storage.get_active_users, ops),
+        per_op_us(presence.active_users, ops * 100),
+    )
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    storage = ServerStorage()
+    print(
+        f"{'users':>7} {'online':>7} {'status DB, us':>14} {'status mem, us':>15} {'online DB, us':>14} {'online mem, us':>15}"
+    )
+    for users in args.users:
+        online = max(1, int(users * args.online))
+        results = bench(storage, users, online, args.ops)
+        print(
+            f"{users:>7} {online:>7} "
+            + " ".join(f"{value:>{width}.2f}" for value, width in zip(results, (14, 15, 14, 15)))
+        )
+
+
+if __name__ == "__main__":
+    main()
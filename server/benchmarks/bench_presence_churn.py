@@ -0,0 +1,109 @@
+"""
+Бенчмарк смены присутствия: потоки клиентов непрерывно входят на сервер по токену сессии, отправляют presence
+и отключаются - каждый цикл дает запись в историю входов и две смены статуса в БД.
+Сравнивается запись в БД сразу (WRITE_BEHIND_MAX_DELAY = 0, транзакция на каждую запись)
+и отложенная запись пачками. Печатает число циклов в секунду, задержку цикла и метрики очереди записи.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_presence_churn.py --threads 8 --users 64 --duration 5``
+"""
+
+import argparse
+import threading
+import time
+from http import HTTPStatus
+
+from common.schema import Actions, Keys
+from server.config import ServerConf
+from server.run_server_cli import ENGINES
+from utils import BenchClient, BenchServer, percentile, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Presence churn benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17850)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--delay", type=float, default=ServerConf.WRITE_BEHIND_MAX_DELAY or 0.05)
+    return parser.parse_args()
+
+
+def churn(port: int, usernames: list[str], deadline: float | None, stats: dict):
+    """Цикл входа и выхода; без deadline - один проход по именам, чтобы получить токены сессий"""
+    tokens = stats["tokens"]
+    index = 0
+    while (time.perf_counter() < deadline) if deadline else index < len(usernames):
+        username = usernames[index % len(usernames)]
+        index += 1
+        started = time.perf_counter()
+        client = BenchClient(port, username)
+        try:
+            resp = client.authenticate(token=tokens.get(username))
+            if resp.get(Keys.RESPONSE) != HTTPStatus.OK:
+                stats["failed"] += 1
+                continue
+            tokens[username] = resp.get(Keys.TOKEN)
+            client.send({Keys.ACTION: Actions.PRESENCE, Keys.USER: {Keys.ACCOUNT_NAME: username, Keys.STATUS: ""}})
+            client.recv()
+        except OSError:
+            stats["failed"] += 1
+            continue
+        finally:
+            client.close()
+        stats["latencies"].append(time.perf_counter() - started)
+
+
+def run_threads(args, port: int, users: list[str], deadline: float | None, stats: dict):
+    threads = [
+        threading.Thread(target=churn, args=(port, users[i :: args.threads], deadline, stats))
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(args, port: int, delay: float) -> tuple[dict, object]:
+    ServerConf.WRITE_BEHIND_MAX_DELAY = delay
+    users = [f"user{index}" for index in range(args.users)]
+    bench = BenchServer(ENGINES[args.engine], port, users=users).start()
+    stats: dict = {"tokens": dict(), "latencies": [], "failed": 0}
+    try:
+        run_threads(args, port, users, None, stats)
+        stats.update(latencies=[], failed=0)
+        run_threads(args, port, users, time.perf_counter() + args.duration, stats)
+        writer = bench.server.writer
+    finally:
+        bench.stop()
+    return stats, writer
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"engine={args.engine} threads={args.threads} users={args.users} duration={args.duration}s")
+    print(
+        f"{'delay, ms':<10} {'cycles/s':>9} {'p50, ms':>8} {'p99, ms':>8} {'failed':>7} "
+        f"{'commits':>8} {'records':>8} {'depth':>6} {'max commit, ms':>15}"
+    )
+    for offset, delay in enumerate((0.0, args.delay)):
+        stats, writer = run(args, args.port + offset, delay)
+        latencies = stats["latencies"]
+        line = (
+            f"{delay * 1000:<10.0f} {len(latencies) / args.duration:>9.0f} {percentile(latencies, 0.5) * 1000:>8.2f} "
+            f"{percentile(latencies, 0.99) * 1000:>8.2f} {stats['failed']:>7}"
+        )
+        if writer is not None:
+            line += (
+                f" {writer.batches:>8} {writer.records:>8} {writer.max_depth:>6} "
+                f"{writer.commit_time_max * 1000:>15.2f}"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
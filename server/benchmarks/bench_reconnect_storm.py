@@ -0,0 +1,105 @@
+"""
+Бенчмарк лавины переподключений: потоки клиентов непрерывно переподключаются и входят на сервер
+по паролю (PBKDF2 и запросы к БД) или по токену сессии из предыдущего входа.
+Печатает число входов в секунду, задержку входа, а также стоимость проверки токена и хеширования пароля.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_reconnect_storm.py --threads 8 --users 64 --duration 5``
+"""
+
+import argparse
+import threading
+import time
+import timeit
+from http import HTTPStatus
+
+from common.schema import Keys
+from server.run_server_cli import ENGINES
+from server.storage import ServerStorage
+from server.tokens import SessionTokens
+from utils import BENCH_PASSWORD, BenchClient, BenchServer, percentile, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reconnect storm benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17808)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0)
+    return parser.parse_args()
+
+
+def reconnect_loop(port: int, usernames: list[str], use_token: bool, deadline: float, stats: dict):
+    tokens: dict[str, str | None] = dict.fromkeys(usernames)
+    index = 0
+    while time.perf_counter() < deadline:
+        username = usernames[index % len(usernames)]
+        index += 1
+        started = time.perf_counter()
+        client = BenchClient(port, username)
+        try:
+            resp = client.authenticate(token=tokens[username] if use_token else None)
+        except OSError:
+            stats["failed"] += 1
+            continue
+        finally:
+            client.close()
+        if resp.get(Keys.RESPONSE) != HTTPStatus.OK:
+            stats["failed"] += 1
+            continue
+        tokens[username] = resp.get(Keys.TOKEN)
+        stats["latencies"].append(time.perf_counter() - started)
+
+
+def run(args, use_token: bool, users: list[str]) -> tuple[list[float], int]:
+    stats: dict = dict()
+    # первый проход получает токены, замер идет по повторным входам
+    for duration in (args.duration / 5, args.duration):
+        stats.update(latencies=[], failed=0)
+        deadline = time.perf_counter() + duration
+        threads = [
+            threading.Thread(
+                target=reconnect_loop, args=(args.port, users[i :: args.threads], use_token, deadline, stats)
+            )
+            for i in range(args.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return stats["latencies"], stats["failed"]
+
+
+def check_costs_us(ops: int = 200) -> tuple[float, float]:
+    tokens = SessionTokens(b"\0" * 32, ttl=60)
+    token = tokens.issue("user", "hash")
+    verify = timeit.timeit(lambda: tokens.verify(token, "user", "hash"), number=ops * 100) / (ops * 100)
+    make_hash = ServerStorage.make_passwd_hash
+    pbkdf2 = timeit.timeit(lambda: make_hash(None, "user", BENCH_PASSWORD), number=ops) / ops  # type: ignore
+    return verify * 1e6, pbkdf2 * 1e6
+
+
+def main():
+    args = parse_args()
+    verify_us, pbkdf2_us = check_costs_us()
+    print(f"token verify: {verify_us:.1f} us, password hash (PBKDF2): {pbkdf2_us:.0f} us")
+    use_temp_database()
+    silence_server_logs()
+    users = [f"user{index}" for index in range(args.users)]
+    bench = BenchServer(ENGINES[args.engine], args.port, users=users).start()
+    try:
+        print(f"engine={args.engine} threads={args.threads} users={args.users} duration={args.duration}s")
+        print(f"{'login':<9} {'logins/s':>9} {'p50, ms':>8} {'p99, ms':>8} {'failed':>7}")
+        for use_token in (False, True):
+            latencies, failed = run(args, use_token, users)
+            print(
+                f"{'token' if use_token else 'password':<9} {len(latencies) / args.duration:>9.0f} "
+                f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {failed:>7}"
+            )
+    finally:
+        bench.stop()
+
+
+if __name__ == "__main__":
+    main()
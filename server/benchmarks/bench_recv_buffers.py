@@ -0,0 +1,72 @@
+"""
+Бенчмарк чтения кадров из сокета: recv() с копированием принятых байтов в декодер (FrameDecoder.feed)
+против чтения прямо в буфер из пула (FrameDecoder.recv_from, recv_into + memoryview).
+Печатает время на сообщение, пиковый прирост памяти по tracemalloc и счетчики пула буферов:
+в установившемся режиме число созданных буферов не растет с числом чтений.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_recv_buffers.py --rounds 2000 --batch 32 --size 200``
+"""
+
+import argparse
+import socket
+import time
+import tracemalloc
+
+from common.buffers import BufferPool
+from common.framing import FrameDecoder, pack_frame
+from server.config import ServerConf
+
+
+def read_with_recv(sock: socket.socket, decoder: FrameDecoder, count: int):
+    received = 0
+    while received < count:
+        received += len(decoder.feed(sock.recv(ServerConf.RECV_BUFFER_SIZE)))
+
+
+def read_with_recv_into(sock: socket.socket, decoder: FrameDecoder, count: int):
+    received = 0
+    while received < count:
+        received += len(decoder.recv_from(sock))
+        decoder.reclaim()
+
+
+def run(reader, args) -> tuple[float, int, dict]:
+    pool = BufferPool()
+    decoder = FrameDecoder(pool=pool)
+    writer, sock = socket.socketpair()
+    batch = pack_frame(b"x" * args.size) * args.batch
+    # прогрев: первый буфер пула создается до замера
+    writer.sendall(batch)
+    reader(sock, decoder, args.batch)
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        writer.sendall(batch)
+        reader(sock, decoder, args.batch)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    writer.close()
+    sock.close()
+    return elapsed / (args.rounds * args.batch) * 1e6, peak, pool.stats()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Receive buffers benchmark.")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--size", type=int, default=200)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(f"{'reader':<12} {'us/msg':>8} {'peak, KiB':>10} {'allocated':>10} {'reused':>8}")
+    for name, reader in (("recv+feed", read_with_recv), ("recv_into", read_with_recv_into)):
+        per_msg, peak, stats = run(reader, args)
+        print(f"{name:<12} {per_msg:>8.3f} {peak / 1024:>10.1f} {stats['allocated']:>10} {stats['reused']:>8}")
+
+
+if __name__ == "__main__":
+    main()
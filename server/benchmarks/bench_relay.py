@@ -0,0 +1,77 @@
+"""
+Бенчмарк пересылки сообщений чата: процессорное время на одно сообщение от приема байтов кадра
+до записи кадра получателю - с пересылкой исходных байтов (в них дописывается только время сервера)
+и, для сравнения, с повторной сериализацией разобранного сообщения.
+Сеть не используется (сокеты-заглушки), запись контакта в базу данных отключена,
+чтобы замер показывал только разбор, маршрутизацию и сериализацию. JSON замеряется в обеих реализациях.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_relay.py --messages 20000``
+"""
+
+import argparse
+import time
+
+from common.codecs import CODECS, JSONCodec, OrjsonCodec, orjson
+from common.framing import FrameDecoder
+from common.schema import Actions, Keys
+from server.transport import JIMServer
+from utils import NullConnection, silence_server_logs, use_temp_database
+
+TEXT = "Привет! Как дела? Это обычное сообщение средней длины для замера пересылки."
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chat message relay benchmark.")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    return parser.parse_args()
+
+
+def make_server(codec) -> tuple[JIMServer, NullConnection]:
+    server = JIMServer("127.0.0.1", 7777)
+    server.close()
+    server.storage.check_user_exists = lambda username: True  # type: ignore
+    for username in ("sender", "recipient"):
+        session = server.sessions.open(NullConnection())
+        session.frame_decoder = FrameDecoder()
+        session.codec = codec
+        server.sessions.login(session, username)
+    return server, server.sessions.get_by_user("sender").conn  # type: ignore
+
+
+def per_message_us(server: JIMServer, sender, codec, payload: bytes, relay: bool, messages: int) -> float:
+    started = time.process_time()
+    for _ in range(messages):
+        server._process_msg(codec.decode(payload), sender, payload if relay else None)
+    return (time.process_time() - started) / messages * 1e6
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    codecs = (
+        [JSONCodec()] + ([OrjsonCodec()] if orjson is not None else []) + [CODECS["msgpack"]] * ("msgpack" in CODECS)
+    )
+    print(f"{'codec':<8} {'re-serialize, us':>17} {'relay bytes, us':>16} {'saved':>6}")
+    for codec in codecs:
+        server, sender = make_server(codec)
+        msg = {Keys.ACTION: Actions.MSG, Keys.TIME: time.time(), Keys.FROM: "sender", Keys.TO: "recipient"}
+        msg.update({Keys.MSG: TEXT, Keys.ENCODING: "utf-8"})
+        payload = codec.encode(msg)
+        # режимы чередуются, берется лучший из нескольких замеров: так меньше влияние шума планировщика
+        rounds = [
+            (
+                per_message_us(server, sender, codec, payload, False, args.messages),
+                per_message_us(server, sender, codec, payload, True, args.messages),
+            )
+            for _ in range(args.rounds)
+        ]
+        reserialize, relay = min(r[0] for r in rounds), min(r[1] for r in rounds)
+        label = getattr(codec, "backend", codec.name)
+        print(f"{label:<8} {reserialize:>17.2f} {relay:>16.2f} {1 - relay / reserialize:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Бенчмарк рассылки сообщения в комнату: время рассылки одного сообщения всем участникам комнаты
+при сериализации один раз на рассылку и, для сравнения, при сериализации для каждого получателя.
+Сеть и база данных не используются: участники подключены через сокеты-заглушки.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_room_fan_out.py --members 10 1000 10000``
+"""
+
+import argparse
+import time
+
+from common.framing import FrameDecoder
+from common.schema import Actions, Keys
+from server.rooms import RoomRegistry
+from server.transport import JIMServer
+from utils import NullConnection, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Room fan-out benchmark.")
+    parser.add_argument("--members", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--messages", type=int, default=20)
+    return parser.parse_args()
+
+
+def make_server(members: int) -> tuple[JIMServer, NullConnection]:
+    server = JIMServer("127.0.0.1", 7777)
+    server.close()
+    usernames = [f"member_{index}" for index in range(members)]
+    for username in usernames:
+        session = server.sessions.open(NullConnection())
+        session.frame_decoder = FrameDecoder()
+        server.sessions.login(session, username)
+    server.rooms = RoomRegistry({"#bench": set(usernames)})
+    return server, server.sessions.get_by_user(usernames[0]).conn  # type: ignore
+
+
+def per_message_ms(fnc, messages: int) -> float:
+    started = time.perf_counter()
+    for _ in range(messages):
+        fnc()
+    return (time.perf_counter() - started) / messages * 1000
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"{'members':>8} {'serialize once, ms':>19} {'per recipient, ms':>18} {'speedup':>8}")
+    for members in args.members:
+        server, sender = make_server(members)
+        msg = {Keys.ACTION: Actions.MSG, Keys.FROM: "member_0", Keys.TO: "#bench", Keys.MSG: "x" * 200}
+        msg[Keys.ENCODING] = "utf-8"
+
+        def per_recipient():
+            for member in server.rooms.members("#bench"):
+                if member != "member_0":
+                    server._deliver_msg(member, msg)
+
+        fan_out = per_message_ms(lambda: server._fan_out_msg("#bench", msg, sender), args.messages)
+        naive = per_message_ms(per_recipient, args.messages)
+        print(f"{members:>8} {fan_out:>19.3f} {naive:>18.3f} {naive / fan_out:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
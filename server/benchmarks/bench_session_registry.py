@@ -0,0 +1,71 @@
+"""
+Микробенчмарк реестра сессий: стоимость проверки входа (login_required), доставки сообщения
+и отключения клиента при разном числе вошедших пользователей. Сеть и база данных не используются,
+поэтому замер показывает только накладные расходы поиска сессий, которые не должны расти с числом клиентов.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_session_registry.py --users 10 1000 100000``
+"""
+
+import argparse
+import time
+
+from common.schema import Actions, Keys
+from server.transport import JIMServer
+from utils import NullConnection, silence_server_logs, use_temp_database
+
+
+class NullStorage:
+    def change_user_status(self, **kwargs):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Session registry lookup cost benchmark.")
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    parser.add_argument("--ops", type=int, default=100000)
+    return parser.parse_args()
+
+
+def per_op_ns(fnc, ops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(ops):
+        fnc()
+    return (time.perf_counter() - started) / ops * 1e9
+
+
+def bench(users: int, ops: int) -> tuple[float, float, float]:
+    server = JIMServer("127.0.0.1", 7777)
+    server.close()
+    server.storage = NullStorage()
+    conns = [NullConnection() for _ in range(users)]
+    for index, conn in enumerate(conns):
+        server.sessions.login(server.sessions.open(conn), f"user_{index}")
+    # худший случай для линейного поиска: последний вошедший пользователь
+    conn, username = conns[-1], f"user_{users - 1}"
+    route_msg = {Keys.ACTION: Actions.PROBE}
+    msg = {Keys.ACTION: Actions.MSG, Keys.FROM: "user_0", Keys.TO: username, Keys.MSG: "ping", Keys.ENCODING: "utf-8"}
+
+    def reconnect():
+        server._disconnect_client(conn)
+        server.sessions.login(server.sessions.open(conn), username)
+
+    return (
+        per_op_ns(lambda: server._route_msg(route_msg, conn), ops),
+        per_op_ns(lambda: server._deliver_msg(username, msg), ops // 10),
+        per_op_ns(reconnect, ops),
+    )
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    print(f"{'users':>8} {'login check, ns':>16} {'deliver, ns':>12} {'disconnect+login, ns':>21}")
+    for users in args.users:
+        route, deliver, reconnect = bench(users, args.ops)
+        print(f"{users:>8} {route:>16.0f} {deliver:>12.0f} {reconnect:>21.0f}")
+
+
+if __name__ == "__main__":
+    main()
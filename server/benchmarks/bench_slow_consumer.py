@@ -0,0 +1,97 @@
+"""
+Бенчмарк медленного получателя: один клиент не читает входящие сообщения, другой засыпает его сообщениями,
+а задержка доставки измеряется для обычной пары клиентов. Показывает, сколько байт накоплено
+в исходящей очереди медленного клиента и как выбранная политика переполнения влияет на остальных.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_slow_consumer.py -e socket --policy defer``
+"""
+
+import argparse
+import threading
+import time
+
+from common.schema import Actions
+from server.buffers import OverflowPolicy
+from server.config import ServerConf
+from server.run_server_cli import ENGINES
+from utils import BenchClient, BenchServer, percentile, silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Slow consumer backpressure benchmark.")
+    parser.add_argument("-e", "--engine", choices=ENGINES.keys(), default="socket")
+    parser.add_argument("-p", "--port", type=int, default=17803)
+    parser.add_argument(
+        "--policy",
+        choices=(OverflowPolicy.DROP, OverflowPolicy.DEFER, OverflowPolicy.DISCONNECT),
+        default=ServerConf.OUTBOUND_OVERFLOW_POLICY,
+    )
+    parser.add_argument("--flood-size", type=int, default=32 * 1024, help="Размер сообщения флудера, байт")
+    parser.add_argument("--messages", type=int, default=300)
+    return parser.parse_args()
+
+
+def flood(port: int, target: str, text: str, stop: threading.Event, counter: list[int]):
+    flooder = BenchClient(port, "flooder")
+    flooder.authenticate()
+    try:
+        while not stop.is_set():
+            flooder.send(flooder.make_msg(to=target, text=text))
+            counter[0] += 1
+    except OSError:
+        pass
+    finally:
+        flooder.close()
+
+
+def main():
+    args = parse_args()
+    ServerConf.OUTBOUND_OVERFLOW_POLICY = args.policy
+    use_temp_database()
+    silence_server_logs()
+    users = ["sender", "receiver", "slow", "flooder"]
+    bench = BenchServer(ENGINES[args.engine], args.port, users=users).start()
+    try:
+        slow = BenchClient(args.port, "slow")
+        slow.authenticate()
+        sender = BenchClient(args.port, "sender")
+        receiver = BenchClient(args.port, "receiver")
+        sender.authenticate()
+        receiver.authenticate()
+
+        stop, flooded = threading.Event(), [0]
+        flooder = threading.Thread(target=flood, args=(args.port, "slow", "x" * args.flood_size, stop, flooded))
+        flooder.start()
+        time.sleep(1.0)
+
+        latencies = []
+        for index in range(args.messages):
+            started = time.perf_counter()
+            sender.send(sender.make_msg(to=receiver.username, text=f"ping {index}"))
+            receiver.recv_action(Actions.MSG)
+            latencies.append(time.perf_counter() - started)
+            sender.recv()
+        stop.set()
+        slow_session = bench.server.sessions.get_by_user("slow")
+        queued = len(slow_session.outbound or ()) if slow_session else 0
+        slow_online = slow_session is not None
+        slow.close()
+        flooder.join(timeout=5)
+
+        print(f"engine={args.engine} policy={args.policy} flood messages={flooded[0]} x {args.flood_size} B")
+        print(f"queued for slow consumer: {queued / 1024:.0f} KiB, slow consumer online: {slow_online}")
+        print(
+            "message latency: "
+            f"p50={percentile(latencies, 0.5) * 1000:.3f} ms, "
+            f"p99={percentile(latencies, 0.99) * 1000:.3f} ms, "
+            f"max={max(latencies) * 1000:.3f} ms"
+        )
+        sender.close()
+        receiver.close()
+    finally:
+        bench.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Микробенчмарк кеша пользователей хранилища: операции ServerStorage, которые начинаются с поиска пользователя
+по имени (проверка существования, хеш пароля для входа, сообщение для пользователя не в сети, вход в комнату),
+с отключенным кешем (SELECT на каждую операцию) и с LRU-кешем имя -> идентификатор. Печатает время операции,
+число SQL-запросов на операцию и долю попаданий в кеш.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_user_cache.py --users 1000 --ops 5000``
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import event
+
+from server.config import ServerConf
+from server.model import User
+from server.storage import ServerStorage
+from server.user_cache import UserCache
+from utils import silence_server_logs, use_temp_database
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Storage user cache benchmark.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=5000)
+    return parser.parse_args()
+
+
+def bench(storage: ServerStorage, fnc, usernames: list[str], statements: list[int]) -> tuple[float, float]:
+    statements[0] = 0
+    started = time.perf_counter()
+    for username in usernames:
+        fnc(username)
+    elapsed = time.perf_counter() - started
+    return elapsed / len(usernames) * 1e6, statements[0] / len(usernames)
+
+
+def main():
+    args = parse_args()
+    use_temp_database()
+    silence_server_logs()
+    storage = ServerStorage()
+    # пароль не нужен для замера, поэтому пользователи добавляются без PBKDF2
+    storage.session.bulk_insert_mappings(User, [{"username": f"user{i}", "password": ""} for i in range(args.users)])
+    storage.session.commit()
+    statements = [0]
+    event.listen(
+        storage.session.get_bind(),
+        "before_cursor_execute",
+        lambda *_: statements.__setitem__(0, statements[0] + 1),
+    )
+    operations = {
+        "exists": storage.check_user_exists,
+        "passwd hash": storage.get_user_password_hash,
+        "pending msg": lambda username: storage.store_pending_msg(username, "{}"),
+        "join room": lambda username: storage.add_room_member("room", username),
+    }
+    usernames = random.Random(0).choices([f"user{i}" for i in range(args.users)], k=args.ops)
+    print(f"users={args.users} ops={args.ops}")
+    print(f"{'operation':<12} {'cache':<6} {'us/op':>8} {'sql/op':>7} {'hit rate':>9}")
+    for name, fnc in operations.items():
+        for size in (0, ServerConf.USER_CACHE_SIZE):
+            storage.users = UserCache(size, ServerConf.USER_CACHE_TTL, ServerConf.USER_CACHE_MISS_TTL)
+            us_per_op, sql_per_op = bench(storage, fnc, usernames, statements)
+            print(
+                f"{name:<12} {'on' if size else 'off':<6} {us_per_op:>8.1f} {sql_per_op:>7.2f} "
+                f"{storage.users.hit_rate:>9.1%}"
+            )
+    storage.session.remove()
+
+
+if __name__ == "__main__":
+    main()
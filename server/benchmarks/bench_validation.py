@@ -0,0 +1,47 @@
+"""
+Бенчмарк проверки сообщений: скомпилированные функции проверки из common.schema против прежней проверки
+множествами ключей по JIMValidationSchema для каждого действия и для ответа со списком контактов.
+
+Использование (из каталога server):
+``poetry run python benchmarks/bench_validation.py --ops 200000``
+"""
+
+import argparse
+
+from bench_codecs import make_samples, per_op_us
+from common.schema import JIMValidationSchema, Keys, validate_msg
+
+SCHEMA = JIMValidationSchema()
+
+
+def set_based_validate(msg: dict):
+    """Прежняя проверка: разность множеств ключей для сообщения и вложенного объекта пользователя"""
+    if action := msg.get(Keys.ACTION):
+        if SCHEMA.msg_keys[action] - msg.keys():
+            raise ValueError(action)
+        if user_keys := SCHEMA.usr_keys.get(action):
+            if user_keys - msg[Keys.USER].keys():
+                raise ValueError(action)
+    elif response := msg[Keys.RESPONSE]:
+        resp_keys = SCHEMA.resp_keys[Keys.ERROR if 400 <= response < 600 else Keys.ALERT]
+        if resp_keys - msg.keys():
+            raise ValueError(response)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Message validation benchmark.")
+    parser.add_argument("--ops", type=int, default=200000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(f"{'action':<24} {'sets, us':>9} {'compiled, us':>13}")
+    for action, msg in make_samples().items():
+        sets = per_op_us(set_based_validate, msg, args.ops)
+        compiled = per_op_us(validate_msg, msg, args.ops)
+        print(f"{action:<24} {sets:>9.3f} {compiled:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
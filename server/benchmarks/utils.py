@@ -0,0 +1,178 @@
+"""
+Общие утилиты бенчмарков сервера: запуск движка сервера во временном окружении
+и минимальный клиент протокола JIM без графического интерфейса
+"""
+
+import logging
+import resource
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from common.base import JIMBase
+from common.codecs import get_codec
+from common.framing import FrameDecoder, pack_frame
+from common.schema import Actions, Features, Keys
+from server.config import ServerConf
+from server.logger_conf import main_logger
+
+BENCH_PASSWORD = "bench_password"
+
+
+def use_temp_database() -> Path:
+    """Перенаправляет базу данных сервера во временный каталог, чтобы не трогать рабочую БД"""
+    data_dir = Path(tempfile.mkdtemp(prefix="jim_bench_"))
+    ServerConf.DB_PATH = data_dir / ServerConf.DB_NAME
+    ServerConf.DB_CONFIG["URL"] = f"sqlite:///{ServerConf.DB_PATH}"
+    return data_dir
+
+
+def silence_server_logs():
+    """Отключает отладочный вывод сервера: запись лога на каждое сообщение искажает замеры"""
+    main_logger.setLevel(logging.WARNING)
+
+
+def raise_open_files_limit(required: int):
+    """Поднимает мягкий лимит открытых файлов до жесткого, если его не хватает для теста"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < required:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        soft = hard
+    if soft < required:
+        raise SystemExit(f"Недостаточный лимит открытых файлов: {soft} < {required} (ulimit -n)")
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class BenchServer:
+    """
+    Запускает выбранный движок сервера в отдельном потоке.
+    Сервер и его хранилище создаются внутри потока, так как сессия SQLite привязана к потоку
+    """
+
+    def __init__(self, engine_cls, port: int, users: list[str]) -> None:
+        self.engine_cls = engine_cls
+        self.port = port
+        self.users = users
+        self.server = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self.server = self.engine_cls("127.0.0.1", self.port)
+        for username in self.users:
+            if not self.server.storage.check_user_exists(username):
+                self.server.storage.add_user(username=username, password=BENCH_PASSWORD)
+        self.server._listen()
+        self._ready.set()
+        self.server._mainloop()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.stop()
+        self._thread.join(timeout=5)
+        if self.server:
+            self.server.close()
+
+
+class NullConnection:
+    """Заглушка сокета: принимает любые данные и ничего не отправляет"""
+
+    def send(self, data: bytes) -> int:
+        return len(data)
+
+    def getpeername(self):
+        return ("127.0.0.1", 0)
+
+    def fileno(self) -> int:
+        return -1
+
+    def close(self):
+        pass
+
+
+class BenchClient(JIMBase):
+    """Синхронный клиент для бенчмарков: аутентификация с согласованием кадров, отправка и прием сообщений"""
+
+    def __init__(self, port: int, username: str) -> None:
+        super().__init__()
+        self.username = username
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.decoder = FrameDecoder()
+        self.framed = False
+        self.inbox: list[bytes] = []
+
+    def close(self):
+        self.sock.close()
+
+    def authenticate(
+        self, features: dict | None = None, token: str | None = None, password: str = BENCH_PASSWORD
+    ) -> dict:
+        msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: self.username, Keys.PASSWORD: password},
+            Keys.FEATURES: {Features.FRAMING: True} if features is None else features,
+        }
+        if token:
+            msg[Keys.TOKEN] = token
+        self.send(msg)
+        resp = self.recv()
+        accepted = resp.get(Keys.FEATURES) or {}
+        self.framed = bool(accepted.get(Features.FRAMING))
+        self.codec = get_codec(accepted.get(Features.CODEC))
+        return resp
+
+    def make_msg(self, to: str, text: str) -> dict:
+        return {
+            Keys.ACTION: Actions.MSG,
+            Keys.FROM: self.username,
+            Keys.TO: to,
+            Keys.MSG: text,
+            Keys.ENCODING: self.encoding,
+        }
+
+    def send(self, msg: dict):
+        data = self._dump_msg(msg)
+        self.sock.sendall(pack_frame(data) if self.framed else data)
+
+    def recv(self) -> dict:
+        if not self.framed:
+            return self._load_msg(self.sock.recv(self.package_length))
+        while not self.inbox:
+            data = self.sock.recv(ServerConf.RECV_BUFFER_SIZE)
+            if not data:
+                raise ConnectionError("Сервер закрыл соединение")
+            self.inbox.extend(self.decoder.feed(data))
+        return self._load_msg(self.inbox.pop(0))
+
+    def recv_action(self, action: str) -> dict:
+        """Принимает сообщения до первого сообщения с указанным действием, пропуская ответы сервера"""
+        while True:
+            msg = self.recv()
+            if msg.get(Keys.ACTION) == action:
+                return msg
+
+
+def percentile(values: list[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def wait_for(predicate, timeout: float = 30.0, interval: float = 0.05) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
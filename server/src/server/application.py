@@ -1,6 +1,7 @@
 import pathlib
 import platform
 import sys
+from datetime import datetime
 from threading import Thread
 from subprocess import Popen
 
@@ -10,6 +11,7 @@ from server.config import ServerConf
 from server.gui.clients_window import Ui_ClientsWindow
 from server.gui.history_window import Ui_HistoryWindow
 from server.gui.main_window import Ui_MainWindow
+from server.presence import read_snapshots
 from server.storage import ServerStorage
 from server.transport import JIMServer
 
@@ -164,11 +166,10 @@ class HistoryWindow:
 
 class ClientsWindow:
     """
-    Класс окна просмотра активных клиентов
+    Класс окна просмотра активных клиентов: данные берутся из снимков присутствия процессов сервера
     """
 
     def __init__(self) -> None:
-        self.server_storage = ServerStorage()
         self.window = QtWidgets.QWidget()
         self.ui = Ui_ClientsWindow()
         self.ui.setupUi(self.window)
@@ -179,16 +180,20 @@ class ClientsWindow:
         self.ui.tableWidget.show()
 
     def update_data(self):
-        active_users = self.server_storage.get_active_users()
-        header_labels = ["Имя пользователя"]
+        active_users = read_snapshots(ServerConf.PRESENCE_DIR, ServerConf.PRESENCE_SNAPSHOT_MAX_AGE)
+        header_labels = ["Имя пользователя", "Статус", "Последняя активность"]
         self.ui.tableWidget.setRowCount(len(active_users))
         self.ui.tableWidget.setColumnCount(len(header_labels))
         self.ui.tableWidget.setHorizontalHeaderLabels(header_labels)
         header = self.ui.tableWidget.horizontalHeader()
-        header.setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.Stretch)
-        for index, user in enumerate(active_users):
-            item_user = QtWidgets.QTableWidgetItem(user)
-            self.ui.tableWidget.setItem(index, 0, item_user)
+        header.setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(1, QtWidgets.QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(2, QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
+        for index, (user, presence) in enumerate(sorted(active_users.items())):
+            last_seen = datetime.fromtimestamp(presence["last_seen"]).replace(microsecond=0)
+            self.ui.tableWidget.setItem(index, 0, QtWidgets.QTableWidgetItem(user))
+            self.ui.tableWidget.setItem(index, 1, QtWidgets.QTableWidgetItem(presence["status"]))
+            self.ui.tableWidget.setItem(index, 2, QtWidgets.QTableWidgetItem(str(last_seen)))
 
 
 class AddUserDialog(QtWidgets.QDialog):
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from socket import AF_INET, SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket
+
+from common.errors import IncorrectDataRecivedError
+from common.messages import Auth
+from server.buffers import OverflowPolicy
+from server.config import ServerConf
+from server.logger_conf import main_logger
+from server.sessions import Session
+from server.transport import JIMServer
+
+
+class StreamConnection:
+    """
+    Адаптер пары потоков asyncio к интерфейсу сокета, который используют методы роутинга сервера
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        writer.transport.set_write_buffer_limits(
+            high=ServerConf.OUTBOUND_HIGH_WATERMARK, low=ServerConf.OUTBOUND_LOW_WATERMARK
+        )
+
+    def __str__(self):
+        return f"StreamConnection({self.writer.get_extra_info('peername')})"
+
+    def send(self, data: bytes) -> int:
+        self.writer.write(data)
+        return len(data)
+
+    def getpeername(self):
+        peername = self.writer.get_extra_info("peername")
+        if peername is None or self.writer.is_closing():
+            raise OSError("Соединение закрыто.")
+        return peername
+
+    def get_write_buffer_size(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+
+class JIMAsyncServer(JIMServer):
+    """
+    Движок сервера на основе потоков asyncio: соединения обслуживаются корутинами в одном цикле событий,
+    роутинг сообщений выполняется теми же методами, что и в JIMServer.
+    Проверка пароля и чтение отложенных сообщений идут в пуле потоков, записи о входах, статусах, комнатах
+    и контактах - через очередь отложенной записи. В цикле событий синхронно остаются обращения к SQLAlchemy
+    при промахе кеша пользователей (check_user_exists и get_user_password_hash при входе по токену)
+    и сохранение сообщения для пользователя не в сети (store_pending_msg)
+    """
+
+    def __init__(self, ip: str, port: int | str) -> None:
+        super().__init__(ip, port)
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._stop_event: asyncio.Event | None = None
+        self._handlers: set[asyncio.Task] = set()
+        # входы, ожидающие проверки пароля в пуле потоков: соединение -> future завершения входа
+        self._logins: dict[StreamConnection, asyncio.Future] = dict()
+
+    def __str__(self):
+        return "JIM_async_server_object"
+
+    def _listen(self):
+        self.sock.close()
+        self.sock = socket(AF_INET, SOCK_STREAM)
+        self.sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.sock.bind((str(self.ip), self.port))
+        self.sock.setblocking(False)
+        self.sock.listen(ServerConf.LISTEN_BACKLOG)
+        main_logger.info(f"Сервер (asyncio) запущен на {self.ip}:{self.port}.")
+        self.is_running = True
+        self._remove_stale_snapshot()
+
+    def _mainloop(self):
+        asyncio.run(self._serve())
+        self.storage.session.remove()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self.executor = self._make_executor()
+        if self.executor:
+            self.loop.add_reader(self.executor.wakeup_sock, self.executor.run_callbacks)
+        self.writer = self._make_writer()
+        listener = await asyncio.start_server(self._handle_connection, sock=self.sock)
+        watchdog = asyncio.create_task(self._watch_idle_sessions())
+        async with listener:
+            await self._stop_event.wait()
+        watchdog.cancel()
+        for waiter in self._logins.values():
+            waiter.cancel()
+        if self.executor:
+            self.loop.remove_reader(self.executor.wakeup_sock)
+        for session in self.sessions:
+            session.conn.close()
+        if self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = StreamConnection(reader, writer)
+        handler = asyncio.current_task()
+        if handler:
+            self._handlers.add(handler)
+        main_logger.info(f"Подключился клиент {':'.join(map(str, writer.get_extra_info('peername') or ()))}")
+        session = self._open_session(conn)
+        try:
+            while self.is_running:
+                decoder = session.frame_decoder
+                raw_data = await reader.read(ServerConf.RECV_BUFFER_SIZE if decoder else self.package_length)
+                if not raw_data:
+                    break
+                session.last_seen = time.monotonic()
+                payloads = decoder.feed(raw_data) if decoder else [raw_data]
+                for payload in payloads:
+                    if conn.is_closing():
+                        break
+                    self._process_msg(self._load_msg(payload, session.codec), conn, payload if decoder else None)
+                waiter = self._logins.get(conn)
+                if waiter:
+                    # от ответа на вход зависит формат следующего чтения (кадры), поэтому чтение ждет его отправки
+                    await waiter
+                if conn.is_closing():
+                    break
+                # при остальных политиках очередь ограничивает _write, поэтому ожидание отправки не нужно
+                if ServerConf.OUTBOUND_OVERFLOW_POLICY == OverflowPolicy.DEFER:
+                    # не читаем новые запросы клиента, пока его очередь не опустится до нижнего знака
+                    await writer.drain()
+        except (IncorrectDataRecivedError, OSError):
+            pass
+        finally:
+            if conn in self.sessions:
+                self._disconnect_client(conn)
+            self._handlers.discard(handler)  # type: ignore
+
+    def _register_user(self, msg: Auth, client_conn):
+        result = super()._register_user(msg, client_conn)
+        if result is None and client_conn in self.sessions and self._get_username(client_conn) is None:
+            # пароль проверяется в пуле потоков (вход по токену к этому моменту уже завершен)
+            self._logins[client_conn] = self.loop.create_future()  # type: ignore
+        return result
+
+    def _complete_login(self, msg: Auth, client_conn, session: Session, future):
+        super()._complete_login(msg, client_conn, session, future)
+        waiter = self._logins.pop(client_conn, None)
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+    async def _watch_idle_sessions(self):
+        while True:
+            await asyncio.sleep(ServerConf.TIMER_TICK)
+            now = time.monotonic()
+            self._check_idle_sessions(now)
+            self._persist_presence(now)
+
+    def _write(self, client, data: bytes):
+        buffered = client.get_write_buffer_size()
+        if buffered >= ServerConf.OUTBOUND_HIGH_WATERMARK and not self._apply_overflow_policy(client, buffered):
+            return
+        client.send(data)
+
+    def stop(self):
+        self.is_running = False
+        if self.loop and self._stop_event and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._stop_event.set)
@@ -0,0 +1,75 @@
+import socket
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+
+# sendmsg (writev) есть не на всех платформах; без него кадры отправляются по одному через send
+HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+IOV_MAX = 1024  # число буферов за один вызов sendmsg (предел IOV_MAX в Linux)
+
+
+@dataclass
+class OverflowPolicy:
+    DROP = "drop"
+    DEFER = "defer"
+    DISCONNECT = "disconnect"
+
+
+class OutboundBuffer:
+    """
+    Очередь исходящих кадров одного соединения с верхним и нижним водяными знаками.
+    После превышения верхнего знака соединение считается перегруженным,
+    пока очередь не опустится до нижнего знака (гистерезис)
+    """
+
+    def __init__(self, high_watermark: int, low_watermark: int) -> None:
+        self.chunks: deque[bytes] = deque()
+        self.offset = 0
+        self.size = 0
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.is_overloaded = False
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    def append(self, data: bytes):
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.high_watermark:
+            self.is_overloaded = True
+
+    def flush(self, sock) -> int:
+        """
+        Отправляет в неблокирующий сокет сколько получится; возвращает число отправленных байт.
+        Несколько накопленных кадров уходят одним вызовом sendmsg (writev)
+        """
+        total = 0
+        while self.chunks:
+            try:
+                chunks = list(islice(self.chunks, IOV_MAX if HAS_SENDMSG else 1))
+                if self.offset:
+                    chunks[0] = memoryview(chunks[0])[self.offset :]
+                sent = sock.sendmsg(chunks) if len(chunks) > 1 else sock.send(chunks[0])
+            except BlockingIOError:
+                break
+            total += sent
+            self._consume(sent)
+            if sent < sum(map(len, chunks)):
+                break
+        self.size -= total
+        if self.is_overloaded and self.size <= self.low_watermark:
+            self.is_overloaded = False
+        return total
+
+    def _consume(self, sent: int):
+        """Убирает из очереди отправленные байты, последний кадр может остаться отправленным частично"""
+        while self.chunks and sent >= len(self.chunks[0]) - self.offset:
+            sent -= len(self.chunks[0]) - self.offset
+            self.chunks.popleft()
+            self.offset = 0
+        self.offset += sent
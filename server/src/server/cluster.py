@@ -0,0 +1,281 @@
+import json
+import os
+import signal
+from collections import defaultdict
+from dataclasses import dataclass
+from http import HTTPStatus
+from multiprocessing import Process
+from pathlib import Path
+from selectors import EVENT_READ
+from socket import AF_UNIX, SO_RCVBUF, SO_REUSEPORT, SO_SNDBUF, SOCK_DGRAM, SOL_SOCKET, socket
+
+from common.messages import Auth, JIMMessage, to_wire
+from common.schema import Keys
+from server.config import ServerConf
+from server.logger_conf import main_logger
+from server.rooms import is_room_name
+from server.sessions import Session
+from server.storage import ServerStorage
+from server.transport import JIMServer
+
+
+@dataclass
+class ClusterEvents:
+    HELLO = "hello"
+    ONLINE = "online"
+    OFFLINE = "offline"
+    DELIVER = "deliver"
+    JOIN = "join"
+    LEAVE = "leave"
+    REVOKE = "revoke"
+    CONTACT_ADD = "contact_add"
+    CONTACT_DEL = "contact_del"
+
+
+class ClusterRouter:
+    """
+    Локальная маршрутизация между воркерами кластера через датаграммные Unix-сокеты:
+    каждый воркер слушает свой сокет и рассылает остальным события о входе и выходе пользователей,
+    а также пересылает сообщения пользователям, подключенным к другим воркерам
+    """
+
+    def __init__(self, worker_id: int, workers: int, run_dir: Path = ServerConf.CLUSTER_DIR) -> None:
+        self.worker_id = worker_id
+        self.workers = workers
+        self.run_dir = run_dir
+        self.remote_clients: dict[str, int] = dict()
+        os.makedirs(run_dir, exist_ok=True)
+        self.path = self._get_path(worker_id)
+        self.path.unlink(missing_ok=True)
+        self.sock = socket(AF_UNIX, SOCK_DGRAM)
+        self.sock.setsockopt(SOL_SOCKET, SO_RCVBUF, ServerConf.CLUSTER_SOCKET_BUFFER)
+        self.sock.bind(str(self.path))
+        self.sock.setblocking(False)
+        self.out_sock = socket(AF_UNIX, SOCK_DGRAM)
+        self.out_sock.setsockopt(SOL_SOCKET, SO_SNDBUF, ServerConf.CLUSTER_SOCKET_BUFFER)
+        self.out_sock.settimeout(ServerConf.CLUSTER_SEND_TIMEOUT)
+
+    def _get_path(self, worker_id: int) -> Path:
+        return self.run_dir / f"worker-{worker_id}.sock"
+
+    def _peers(self):
+        return (worker_id for worker_id in range(self.workers) if worker_id != self.worker_id)
+
+    def send_to(self, worker_id: int, event: dict) -> bool:
+        """
+        Отправляет событие воркеру одной датаграммой. Событие больше CLUSTER_MAX_EVENT_SIZE получатель
+        принял бы обрезанным, поэтому оно не отправляется, и вызывающий код считает доставку неудачной
+        """
+        event["worker"] = self.worker_id
+        data = json.dumps(event, default=to_wire, ensure_ascii=False).encode(ServerConf.ENCODING)
+        if len(data) > ServerConf.CLUSTER_MAX_EVENT_SIZE:
+            main_logger.error(
+                f"Воркер {self.worker_id}: событие {event.get('event')} для воркера {worker_id} "
+                f"слишком велико ({len(data)} байт)"
+            )
+            return False
+        try:
+            self.out_sock.sendto(data, str(self._get_path(worker_id)))
+            return True
+        except (FileNotFoundError, ConnectionRefusedError):
+            main_logger.info(f"Воркер {self.worker_id}: воркер {worker_id} недоступен")
+            return False
+        except OSError as ex:
+            main_logger.error(f"Воркер {self.worker_id}: не удалось отправить событие воркеру {worker_id} ({ex})")
+            return False
+
+    def broadcast(self, event: dict):
+        for worker_id in self._peers():
+            self.send_to(worker_id, dict(event))
+
+    def announce(self):
+        self.broadcast({"event": ClusterEvents.HELLO})
+
+    def user_online(self, username: str):
+        self.broadcast({"event": ClusterEvents.ONLINE, "user": username})
+
+    def user_offline(self, username: str):
+        self.broadcast({"event": ClusterEvents.OFFLINE, "user": username})
+
+    def forward(self, target_user: str, msg: dict | JIMMessage) -> bool:
+        worker_id = self.remote_clients.get(target_user)
+        if worker_id is None:
+            return False
+        return self.send_to(worker_id, {"event": ClusterEvents.DELIVER, "users": [target_user], "msg": msg})
+
+    def forward_many(self, usernames: list[str], msg: dict | JIMMessage):
+        """Пересылает сообщение нескольким пользователям других воркеров: одно событие на каждый воркер"""
+        users_by_worker = defaultdict(list)
+        for username in usernames:
+            worker_id = self.remote_clients.get(username)
+            if worker_id is not None:
+                users_by_worker[worker_id].append(username)
+        for worker_id, users in users_by_worker.items():
+            self.send_to(worker_id, {"event": ClusterEvents.DELIVER, "users": users, "msg": msg})
+
+    def recv_events(self) -> list[dict]:
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(ServerConf.CLUSTER_MAX_EVENT_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            try:
+                events.append(json.loads(data.decode(ServerConf.ENCODING)))
+            except ValueError:
+                main_logger.error(f"Воркер {self.worker_id}: принято некорректное событие кластера")
+        return events
+
+    def close(self):
+        self.sock.close()
+        self.out_sock.close()
+        self.path.unlink(missing_ok=True)
+
+
+class JIMClusterWorker(JIMServer):
+    """
+    Воркер многопроцессного сервера: слушает общий порт с SO_REUSEPORT,
+    а сообщения пользователям других воркеров доставляет через ClusterRouter
+    """
+
+    def __init__(self, ip: str, port: int | str, worker_id: int, workers: int) -> None:
+        super().__init__(ip, port)
+        self.router = ClusterRouter(worker_id, workers)
+
+    def __str__(self):
+        return f"JIM_cluster_worker_{self.router.worker_id}"
+
+    def _make_storage(self) -> ServerStorage:
+        # статусы пользователей сбрасывает run_cluster до запуска воркеров: иначе воркер, запущенный позже,
+        # снял бы отметку "в сети" с пользователей, уже вошедших через другие воркеры
+        return ServerStorage(reset_status=False)
+
+    def _listen(self):
+        self.sock.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+        super()._listen()
+
+    def _mainloop(self):
+        self.selector.register(self.router.sock, EVENT_READ, self._accept_cluster_events)
+        self.router.announce()
+        super()._mainloop()
+
+    def _accept_cluster_events(self):
+        for event in self.router.recv_events():
+            worker_id = event.get("worker")
+            match event.get("event"):
+                case ClusterEvents.HELLO:
+                    for username in self.sessions.usernames():
+                        self.router.send_to(worker_id, {"event": ClusterEvents.ONLINE, "user": username})
+                case ClusterEvents.ONLINE:
+                    self.router.remote_clients[event["user"]] = worker_id
+                case ClusterEvents.OFFLINE:
+                    if self.router.remote_clients.get(event["user"]) == worker_id:
+                        self.router.remote_clients.pop(event["user"])
+                case ClusterEvents.JOIN:
+                    self.rooms.join(event["room"], event["user"])
+                case ClusterEvents.LEAVE:
+                    self.rooms.leave(event["room"], event["user"])
+                case ClusterEvents.REVOKE:
+                    self.tokens.revoke(event["token"], persist=False)
+                case ClusterEvents.CONTACT_ADD:
+                    self.contacts.add(event["user"], event["contact"])
+                case ClusterEvents.CONTACT_DEL:
+                    self.contacts.remove(event["user"], event["contact"])
+                case ClusterEvents.DELIVER:
+                    missed = self._deliver_local_many(event["users"], event["msg"])
+                    if missed and not is_room_name(event["msg"].get(Keys.TO)):
+                        self._store_forwarded_msg(missed, event["msg"])
+
+    def _store_forwarded_msg(self, usernames: list[str], msg: dict):
+        """
+        Сохраняет пересланное сообщение пользователю, который отключился от воркера до его получения:
+        отправитель уже получил ответ о доставке, поэтому сообщение ждет входа получателя в БД
+        """
+        payload = self._dump_msg(msg).decode(self.encoding)
+        for username in usernames:
+            main_logger.info(f"Пересланное сообщение сохранено до входа пользователя {username}")
+            if not self._run_blocking(None, self.storage.store_pending_msg, username, payload):
+                self.storage.store_pending_msg(username, payload)
+
+    def _register_user(self, msg: Auth, client_conn):
+        username = msg.account_name
+        if username in self.router.remote_clients:
+            return HTTPStatus.FORBIDDEN, "Клиент с таким именем уже зарегистрирован на сервере", True
+        return super()._register_user(msg, client_conn)
+
+    def _login_user(self, session: Session, msg: Auth):
+        super()._login_user(session, msg)
+        self.router.user_online(msg.account_name)
+
+    def _revoke_token(self, token: str):
+        super()._revoke_token(token)
+        self.router.broadcast({"event": ClusterEvents.REVOKE, "token": token})
+
+    def _disconnect_client(self, conn):
+        user = self._get_username(conn)
+        super()._disconnect_client(conn)
+        if user:
+            self.router.user_offline(user)
+
+    def _deliver_remote(self, target_user: str, msg: dict | JIMMessage) -> bool:
+        return self.router.forward(target_user, msg)
+
+    def _deliver_remote_many(self, usernames: list[str], msg: dict | JIMMessage):
+        self.router.forward_many(usernames, msg)
+
+    def _join_room(self, room: str, username: str) -> bool:
+        if not super()._join_room(room, username):
+            return False
+        self.router.broadcast({"event": ClusterEvents.JOIN, "room": room, "user": username})
+        return True
+
+    def _leave_room(self, room: str, username: str) -> bool:
+        if not super()._leave_room(room, username):
+            return False
+        self.router.broadcast({"event": ClusterEvents.LEAVE, "room": room, "user": username})
+        return True
+
+    def _add_contact(self, username: str, contact_name: str) -> bool:
+        if self.contacts.has(username, contact_name):
+            return True
+        if not super()._add_contact(username, contact_name):
+            return False
+        self.router.broadcast({"event": ClusterEvents.CONTACT_ADD, "user": username, "contact": contact_name})
+        return True
+
+    def _delete_contact(self, username: str, contact_name: str) -> bool:
+        if not super()._delete_contact(username, contact_name):
+            return False
+        self.router.broadcast({"event": ClusterEvents.CONTACT_DEL, "user": username, "contact": contact_name})
+        return True
+
+    def close(self):
+        super().close()
+        self.router.close()
+
+
+def _run_worker(worker_id: int, workers: int, ip: str, port: int):
+    worker = JIMClusterWorker(ip, port, worker_id, workers)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+    with worker:
+        main_logger.info(f"Воркер {worker_id} запущен (pid {os.getpid()}).")
+        worker.start_server()
+
+
+def run_cluster(ip: str, port: int, workers: int):
+    """Запускает сервер в режиме pre-fork: N процессов-воркеров на одном порту"""
+    storage = ServerStorage()
+    storage.session.remove()
+    storage.session.bind.dispose()
+    processes = [Process(target=_run_worker, args=(worker_id, workers, ip, port)) for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -23,10 +23,49 @@ class ServerConf(CommonConf):
     }
 
     DEFAULT_LISTENER_ADDRESS = "0.0.0.0"
-    MAX_CONNECTIONS = 5
+    LISTEN_BACKLOG = 1024
+    SELECT_TIMEOUT = 1.0
+    IDLE_TIMEOUT = 60.0  # секунд тишины до отправки клиенту probe
+    PROBE_TIMEOUT = 20.0  # секунд ожидания любого ответа на probe до отключения
+    TIMER_TICK = 1.0
+    TIMER_SLOTS = 128
+    OUTBOUND_HIGH_WATERMARK = 256 * 1024
+    OUTBOUND_LOW_WATERMARK = 64 * 1024
+    OUTBOUND_HARD_LIMIT = 8 * 1024 * 1024
+    OUTBOUND_OVERFLOW_POLICY = "defer"  # "drop", "defer" или "disconnect"
+    OUTBOUND_COALESCE = True  # копить исходящие кадры за итерацию цикла и отправлять их одним sendmsg
+    BLOCKING_WORKERS = 4  # потоков для хеширования паролей и запросов к БД; 0 - выполнять в цикле событий
+    BLOCKING_MAX_PENDING = 256  # задач в пуле потоков сверх этого числа отклоняются (вход получает 503)
+    WRITE_BEHIND_MAX_DELAY = 0.05  # секунд накопления входов и смен статуса перед записью в БД; 0 - писать сразу
+    WRITE_BEHIND_MAX_BATCH = 512  # записей в одной транзакции отложенной записи
+    PRESENCE_PERSIST_INTERVAL = 1.0  # секунд между сохранениями изменений присутствия в БД и в файл снимка
+    PRESENCE_DIR = DATA_DIR / "presence"  # снимки присутствия процессов сервера для окна клиентов
+    PRESENCE_SNAPSHOT_MAX_AGE = 60.0  # секунд без обновления, после которых снимок считается оставленным
+    USER_CACHE_SIZE = 10_000  # пользователей в LRU-кеше хранилища (имя -> идентификатор, хеш пароля, статус)
+    USER_CACHE_TTL = 30.0  # секунд жизни записи кеша: пользователей меняет и графический интерфейс в другом процессе
+    USER_CACHE_MISS_TTL = 2.0  # секунд жизни отметки "пользователя нет": входы под несуществующим именем не идут в БД
+    TOKEN_TTL = 24 * 60 * 60.0  # секунд действия токена сессии для повторного входа без пароля
+    TOKEN_SECRET_PATH = DATA_DIR / "token.key"
+    TOKEN_REVOKED_DIR = DATA_DIR / "revoked_tokens"  # отозванные токены сессии, чтобы отзыв пережил перезапуск
+    AUTH_IP_BURST = 20  # неудачных попыток входа с одного IP-адреса подряд до ответа 429
+    AUTH_IP_RATE = 1.0  # попыток в секунду, на которые пополняется лимит IP-адреса
+    AUTH_USER_BURST = 5  # неудачных попыток входа под одним именем подряд до ответа 429
+    AUTH_USER_RATE = 0.2  # попыток в секунду, на которые пополняется лимит имени пользователя
+    AUTH_THROTTLE_MAX_KEYS = 100_000  # отслеживаемых IP-адресов и имен (по отдельности)
+    UNKNOWN_USER_TTL = 60.0  # секунд, в течение которых несуществующее имя отклоняется без запроса к БД
+    MSG_RELAY = True  # пересылать сообщения чата в исходных байтах кадра, дописывая только время сервера
+    DEFAULT_WORKERS = 1
+    CLUSTER_DIR = DATA_DIR / "cluster"
+    CLUSTER_SOCKET_BUFFER = 4 * 1024 * 1024
+    CLUSTER_MAX_EVENT_SIZE = 256 * 1024
+    CLUSTER_SEND_TIMEOUT = 0.5
+    ENGINES = ("socket", "asyncio")
+    DEFAULT_ENGINE = "socket"
     MAIN_LOG_FILE_PATH = LOGS_DIR / "server.error.log"
     CALL_LOG_FILE_PATH = LOGS_DIR / "server.calls.log"
 
 
 os.makedirs(ServerConf.LOGS_DIR, exist_ok=True)
 os.makedirs(ServerConf.DATA_DIR, exist_ok=True)
+os.makedirs(ServerConf.PRESENCE_DIR, exist_ok=True)
+os.makedirs(ServerConf.TOKEN_REVOKED_DIR, exist_ok=True)
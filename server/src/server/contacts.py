@@ -0,0 +1,34 @@
+class ContactGraph:
+    """
+    Списки контактов, хранимые в памяти сервера: имя пользователя -> множество имен его контактов.
+    Загружается из базы данных при старте; сервер записывает в базу только действительные изменения
+    (write-through), поэтому повторное добавление существующего контакта обходится без запросов к БД
+    """
+
+    def __init__(self, contacts: dict[str, set[str]] | None = None) -> None:
+        self._contacts: dict[str, set[str]] = contacts or dict()
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def contacts(self, username: str) -> set[str]:
+        return self._contacts.get(username, set())
+
+    def has(self, username: str, contact_name: str) -> bool:
+        return contact_name in self._contacts.get(username, ())
+
+    def add(self, username: str, contact_name: str) -> bool:
+        contacts = self._contacts.setdefault(username, set())
+        if contact_name in contacts:
+            return False
+        contacts.add(contact_name)
+        return True
+
+    def remove(self, username: str, contact_name: str) -> bool:
+        contacts = self._contacts.get(username)
+        if not contacts or contact_name not in contacts:
+            return False
+        contacts.discard(contact_name)
+        if not contacts:
+            del self._contacts[username]
+        return True
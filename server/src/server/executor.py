@@ -0,0 +1,82 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from socket import socketpair
+
+
+class BlockingExecutor:
+    """
+    Пул потоков для блокирующей работы сервера: хеширования паролей и запросов к базе данных.
+    Задачи ставятся из цикла событий, а обработчики их результатов выполняются снова в цикле событий:
+    завершенные задачи копятся в очереди, и цикл будится записью байта в служебный сокет wakeup_sock.
+    Число задач в работе ограничено max_pending: сверх лимита submit отказывает, а не копит очередь
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jim_blocking")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed: deque[tuple] = deque()
+        self.wakeup_sock, self._notify_sock = socketpair()
+        self.wakeup_sock.setblocking(False)
+        self._notify_sock.setblocking(False)
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, callback, func, *args) -> bool:
+        """
+        Запускает func(*args) в пуле; callback(future) будет вызван в цикле событий из run_callbacks.
+        Возвращает False, если лимит задач в работе исчерпан
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        self.submitted += 1
+        future = self.pool.submit(func, *args)
+        future.add_done_callback(lambda future: self._complete(callback, future))
+        return True
+
+    def _complete(self, callback, future: Future):
+        # выполняется в потоке пула: deque.append потокобезопасен, цикл будится через сокет
+        self.completed.append((callback, future))
+        try:
+            self._notify_sock.send(b"\0")
+        except OSError:
+            # буфер сокета полон (цикл уже будет разбужен) или исполнитель закрыт
+            pass
+
+    def run_callbacks(self):
+        """Обработчик события чтения wakeup_sock: вызывает обработчики всех завершенных задач"""
+        try:
+            while self.wakeup_sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.completed:
+            callback, future = self.completed.popleft()
+            self.pending -= 1
+            if callback is not None:
+                callback(future)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.wakeup_sock.close()
+        self._notify_sock.close()
+
+
+def done_future(result) -> Future:
+    """Завершенный future с готовым результатом: для обработчиков, когда блокирующая работа не нужна"""
+    future: Future = Future()
+    future.set_result(result)
+    return future
+
+
+def run_inline(callback, func, *args):
+    """Выполняет задачу сразу в текущем потоке и передает обработчику готовый future (сервер без пула потоков)"""
+    try:
+        future = done_future(func(*args))
+    except Exception as ex:
+        future = Future()
+        future.set_exception(ex)
+    if callback is not None:
+        callback(future)
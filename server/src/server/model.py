@@ -1,7 +1,18 @@
 import sqlite3
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint, create_engine
-from sqlalchemy.orm import backref, declarative_base, relationship, sessionmaker
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    create_engine,
+    inspect,
+)
+from sqlalchemy.orm import backref, declarative_base, relationship, scoped_session, sessionmaker
 from sqlalchemy.sql import func
 from sqlalchemy.sql import default_comparator
 
@@ -48,6 +59,47 @@ class User(Base):
     )
 
 
+class RoomMember(Base):
+    """
+    Таблица участников комнат, связывающая комнаты и пользователей в отношении "многие ко многим"
+    """
+
+    __tablename__ = "room_member"
+
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, ForeignKey("room.id", onupdate="CASCADE", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id", onupdate="CASCADE", ondelete="CASCADE"), nullable=False)
+
+    __table_args__ = (UniqueConstraint(room_id, user_id),)
+
+
+class Room(Base):
+    """
+    Таблица комнат (групповых чатов); имя комнаты начинается с символа "#"
+    """
+
+    __tablename__ = "room"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, index=True, unique=True)
+
+
+class PendingMessage(Base):
+    """
+    Таблица сообщений, ожидающих доставки пользователям не в сети (очередь store-and-forward).
+    Сообщение хранится в сериализованном виде и отправляется получателю без изменений при его входе
+    """
+
+    __tablename__ = "pending_message"
+
+    id = Column(Integer, primary_key=True)
+    recipient_id = Column(
+        Integer, ForeignKey("user.id", onupdate="CASCADE", ondelete="CASCADE"), nullable=False, index=True
+    )
+    payload = Column(Text, nullable=False)
+    created = Column(DateTime, default=func.now())
+
+
 class History(Base):
     """
     Таблица с историей входов пользователей на сервер
@@ -65,8 +117,9 @@ def init_db():
     """Функция инициализации сессии ORM и базы данных при её отсутствии"""
     conn_str = ServerConf.DB_CONFIG["URL"]
     engine = create_engine(conn_str, future=True, echo=False, pool_recycle=7200)
-    if not ServerConf.DB_PATH.exists():
+    # схема создается только для новой (пустой) базы; существующая обновляется миграциями alembic
+    if not inspect(engine).get_table_names():
         Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    return session    
+    # сессия привязана к потоку: пул потоков сервера работает с БД через собственные сессии
+    Session = scoped_session(sessionmaker(bind=engine))
+    return Session    
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from time import time
+
+
+class PresenceEntry:
+    """Присутствие пользователя в сети: соединение, текст статуса и время последнего изменения (unix time)"""
+
+    __slots__ = ("conn", "status", "last_seen")
+
+    def __init__(self, conn, status: str, last_seen: float) -> None:
+        self.conn = conn
+        self.status = status
+        self.last_seen = last_seen
+
+
+class PresenceRegistry:
+    """
+    Таблица присутствия в памяти сервера - источник истины о том, кто в сети: вход, смена статуса, выход
+    и запросы выполняются за O(1) без обращения к БД. Изменения копятся по пользователям (важно только
+    последнее состояние) и периодически забираются pop_changes для сохранения в БД, а snapshot отдает
+    снимок для окна клиентов графического интерфейса
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, PresenceEntry] = dict()
+        self._changes: dict[str, tuple[bool, str]] = dict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, username: str):
+        return username in self._entries
+
+    def get(self, username: str) -> PresenceEntry | None:
+        return self._entries.get(username)
+
+    def set_online(self, username: str, conn, now: float | None = None):
+        self._entries[username] = PresenceEntry(conn, "", time() if now is None else now)
+        self._changes[username] = (True, "")
+
+    def set_status(self, username: str, status: str, now: float | None = None):
+        entry = self._entries.get(username)
+        if entry is None:
+            return
+        if status:
+            entry.status = status
+        entry.last_seen = time() if now is None else now
+        self._changes[username] = (True, status)
+
+    def set_offline(self, username: str, conn):
+        """Отмечает выход пользователя, если он все еще в сети через это соединение (а не вошел заново)"""
+        entry = self._entries.get(username)
+        if entry is None or entry.conn is not conn:
+            return
+        del self._entries[username]
+        self._changes[username] = (False, "")
+
+    def active_users(self) -> list[str]:
+        return list(self._entries)
+
+    def pop_changes(self) -> dict[str, tuple[bool, str]]:
+        """Изменения с прошлого вызова: имя пользователя -> (в сети ли, новый текст статуса или пустая строка)"""
+        changes, self._changes = self._changes, dict()
+        return changes
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            username: {"status": entry.status, "last_seen": entry.last_seen}
+            for username, entry in self._entries.items()
+        }
+
+
+def write_snapshot(path: Path, snapshot: dict):
+    """
+    Записывает снимок присутствия вместе с pid процесса сервера атомарно: читатель видит либо прежний файл,
+    либо новый целиком. У каждой записи свой временный файл, поэтому записи из пула потоков не мешают друг другу
+    """
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as file:
+        try:
+            json.dump({"pid": os.getpid(), "users": snapshot}, file)
+        except Exception:
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+
+
+def _is_process_alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # os.kill с сигналом 0 проверяет процесс только в POSIX
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # процесс есть, но принадлежит другому пользователю
+    return True
+
+
+def read_snapshots(directory: Path, max_age: float | None = None) -> dict[str, dict]:
+    """
+    Объединяет снимки присутствия всех процессов сервера (воркеров кластера): имя -> статус и время.
+    Снимки завершившихся процессов (например, остановленных без закрытия сервера) и снимки,
+    не обновлявшиеся дольше max_age секунд, пропускаются
+    """
+    users = dict()
+    now = time()
+    for path in sorted(directory.glob("*.json")):
+        try:
+            if max_age is not None and now - path.stat().st_mtime > max_age:
+                continue
+            snapshot = json.loads(path.read_text())
+            if _is_process_alive(snapshot["pid"]):
+                users.update(snapshot["users"])
+        except (OSError, ValueError, KeyError, TypeError):
+            continue  # процесс сервера остановлен и удалил снимок
+    return users
@@ -0,0 +1,43 @@
+ROOM_PREFIX = "#"
+
+
+def is_room_name(name: str) -> bool:
+    return isinstance(name, str) and len(name) > len(ROOM_PREFIX) and name.startswith(ROOM_PREFIX)
+
+
+class RoomRegistry:
+    """
+    Членство в комнатах, хранимое в памяти сервера: имя комнаты -> множество имен участников.
+    Загружается из базы данных при старте, изменения записываются в базу сервером (write-through)
+    """
+
+    def __init__(self, rooms: dict[str, set[str]] | None = None) -> None:
+        self._members: dict[str, set[str]] = rooms or dict()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, room: str):
+        return room in self._members
+
+    def members(self, room: str) -> set[str]:
+        return self._members.get(room, set())
+
+    def is_member(self, room: str, username: str) -> bool:
+        return username in self._members.get(room, ())
+
+    def join(self, room: str, username: str) -> bool:
+        members = self._members.setdefault(room, set())
+        if username in members:
+            return False
+        members.add(username)
+        return True
+
+    def leave(self, room: str, username: str) -> bool:
+        members = self._members.get(room)
+        if not members or username not in members:
+            return False
+        members.discard(username)
+        if not members:
+            del self._members[room]
+        return True
@@ -3,10 +3,17 @@ import sys
 import warnings
 
 from common.decorators import log
+from server.async_transport import JIMAsyncServer
+from server.cluster import run_cluster
 from server.config import ServerConf
 from server.logger_conf import call_logger, main_logger
 from server.transport import JIMServer
 
+ENGINES = {
+    "socket": JIMServer,
+    "asyncio": JIMAsyncServer,
+}
+
 
 @log(call_logger)
 def parse_args():
@@ -28,23 +35,43 @@ def parse_args():
         type=type(ServerConf.DEFAULT_PORT),
         default=ServerConf.DEFAULT_PORT,
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="Server event loop engine",
+        choices=ServerConf.ENGINES,
+        default=ServerConf.DEFAULT_ENGINE,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of pre-forked worker processes sharing the port (SO_REUSEPORT, socket engine only)",
+        type=int,
+        default=ServerConf.DEFAULT_WORKERS,
+    )
     args = parser.parse_args()
     if not 1023 < args.port < 65536:
         main_logger.critical(
             f"Попытка запуска сервера с неподходящим номером порта: {args.port}. Допустимы адреса с 1024 до 65535."
         )
         sys.exit(1)
-    return args.address, args.port
+    if args.workers < 1 or (args.workers > 1 and args.engine != "socket"):
+        main_logger.critical(f"Режим pre-fork поддерживает только движок socket и число воркеров от 1.")
+        sys.exit(1)
+    return args.address, args.port, args.engine, args.workers
 
 
 def run():
     main_logger.info("Приложение запущено.")
     try:
-        ip, port = parse_args()
+        ip, port, engine, workers = parse_args()
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            with JIMServer(ip, port) as jim_server:
-                jim_server.start_server()
+            if workers > 1:
+                run_cluster(ip, port, workers)
+            else:
+                with ENGINES[engine](ip, port) as jim_server:
+                    jim_server.start_server()
     except KeyboardInterrupt:
         main_logger.info("Работа сервера была принудительно завершена.")
         sys.exit(0)
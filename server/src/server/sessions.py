@@ -0,0 +1,100 @@
+from common.codecs import JSON_CODEC
+from common.framing import FrameDecoder
+from server.buffers import OutboundBuffer
+
+
+class Session:
+    """
+    Состояние одного соединения: имя вошедшего пользователя, декодер кадров, кодек сообщений, порог сжатия кадров,
+    ожидающие подтверждения возможности протокола, согласована ли доставка сообщений пользователям не в сети
+    и ожидает ли клиента очередь таких сообщений, выданный токен сессии, очередь исходящих кадров,
+    время последней активности клиента (для таймаута простоя) и события, на которые соединение
+    зарегистрировано в селекторе (0 - соединение обслуживается не селектором)
+    """
+
+    __slots__ = (
+        "conn",
+        "username",
+        "frame_decoder",
+        "codec",
+        "compress_threshold",
+        "pending_features",
+        "offline_msgs",
+        "is_pending_due",
+        "token",
+        "outbound",
+        "last_seen",
+        "is_probed",
+        "events",
+    )
+
+    def __init__(self, conn) -> None:
+        self.conn = conn
+        self.username: str | None = None
+        self.frame_decoder: FrameDecoder | None = None
+        self.codec = JSON_CODEC
+        self.compress_threshold: int | None = None
+        self.pending_features: dict | None = None
+        self.offline_msgs = False
+        self.is_pending_due = False
+        self.token: str | None = None
+        self.outbound: OutboundBuffer | None = None
+        self.last_seen = 0.0
+        self.is_probed = False
+        self.events = 0
+
+    def __repr__(self):
+        return f"Session({self.username or 'anonymous'}, {self.conn})"
+
+    @property
+    def is_authenticated(self) -> bool:
+        return self.username is not None
+
+
+class SessionRegistry:
+    """
+    Реестр сессий сервера с двумя индексами: соединение -> сессия и имя пользователя -> сессия.
+    Все операции (поиск, вход, отключение) выполняются за O(1) независимо от числа клиентов
+    """
+
+    def __init__(self) -> None:
+        self._by_conn: dict[object, Session] = dict()
+        self._by_user: dict[str, Session] = dict()
+
+    def __len__(self):
+        return len(self._by_conn)
+
+    def __iter__(self):
+        return iter(list(self._by_conn.values()))
+
+    def __contains__(self, conn):
+        return conn in self._by_conn
+
+    def open(self, conn) -> Session:
+        session = self._by_conn.get(conn)
+        if session is None:
+            session = self._by_conn[conn] = Session(conn)
+        return session
+
+    def get(self, conn) -> Session | None:
+        return self._by_conn.get(conn)
+
+    def get_by_user(self, username: str) -> Session | None:
+        return self._by_user.get(username)
+
+    def login(self, session: Session, username: str):
+        session.username = username
+        self._by_user[username] = session
+
+    def close(self, conn) -> Session | None:
+        session = self._by_conn.pop(conn, None)
+        if session is not None and session.username is not None:
+            if self._by_user.get(session.username) is session:
+                del self._by_user[session.username]
+        return session
+
+    def usernames(self):
+        return self._by_user.keys()
+
+    def authenticated(self) -> list[Session]:
+        return list(self._by_user.values())
@@ -1,10 +1,24 @@
 import binascii
 import hashlib
+import hmac
+from dataclasses import dataclass
 
 from sqlalchemy.exc import NoResultFound
+from sqlalchemy.orm import aliased
 
 from server.config import ServerConf
-from server.model import Contact, History, User, init_db
+from server.model import Contact, History, PendingMessage, Room, RoomMember, User, init_db
+from server.user_cache import NO_USER, UserCache, UserRecord
+
+
+@dataclass
+class WriteKinds:
+    LOGIN = "login"
+    STATUS = "status"
+    ROOM_JOIN = "room_join"
+    ROOM_LEAVE = "room_leave"
+    CONTACT_ADD = "contact_add"
+    CONTACT_DEL = "contact_del"
 
 
 class ServerStorage:
@@ -12,26 +26,47 @@ class ServerStorage:
     Класс-обертка над ORM для взаимодействия сервера с базой данных
     """
 
-    def __init__(self) -> None:
+    def __init__(self, reset_status: bool = True) -> None:
         self.session = init_db()
-        self.set_all_users_inactive()
+        self.users = UserCache(ServerConf.USER_CACHE_SIZE, ServerConf.USER_CACHE_TTL, ServerConf.USER_CACHE_MISS_TTL)
+        if reset_status:
+            self.set_all_users_inactive()
+
+    def _get_user(self, username: str) -> UserRecord:
+        """Идентификатор, хеш пароля и статус пользователя: из кеша, при промахе - из БД (NoResultFound, если нет)"""
+        record = self.users.get(username)
+        if record is NO_USER:
+            raise NoResultFound(f"Пользователь {username} не найден")
+        if record is None:
+            try:
+                row = self.session.query(User.id, User.password, User.status).filter_by(username=username).one()
+            except NoResultFound:
+                self.users.put(username, NO_USER)
+                raise
+            record = UserRecord(row.id, row.password, row.status)
+            self.users.put(username, record)
+        return record
 
     def check_user_exists(self, username: str):
         try:
-            self.session.query(User).filter_by(username=username).one()
+            self._get_user(username)
             return True
         except NoResultFound:
             return False
 
     def check_user_auth(self, username: str, password: str):
-        if self.check_user_exists:
-            password = self.make_passwd_hash(username=username, password=password)
-            db_password = self.get_user_password_hash(username=username)
-            if password == db_password:
-                return True
-        return False
+        """
+        Проверяет пароль пользователя: True/False, а для неизвестного пользователя - None
+        (без хеширования пароля, одним запросом к БД)
+        """
+        db_password = self.get_user_password_hash(username=username)
+        if db_password is None:
+            return None
+        password = self.make_passwd_hash(username=username, password=password)
+        return hmac.compare_digest(password, db_password)
 
     def remove_user(self, username: str):
+        self.users.invalidate(username)
         try:
             user = self.session.query(User).filter_by(username=username).one()
         except NoResultFound:
@@ -49,8 +84,7 @@ class ServerStorage:
 
     def get_user_password_hash(self, username: str):
         try:
-            user = self.session.query(User).filter_by(username=username).one()
-            return user.password
+            return self._get_user(username).password
         except NoResultFound:
             return None
 
@@ -59,19 +93,60 @@ class ServerStorage:
         self.session.add(history)
         self.session.commit()
 
+    def apply_writes(self, records: list[tuple]):
+        """
+        Применяет пачку отложенных записей одной транзакцией: входы (WriteKinds.LOGIN, имя, IP-адрес, время),
+        смены статуса (WriteKinds.STATUS, имя, в сети ли, текст статуса), вход в комнату и выход из нее
+        (WriteKinds.ROOM_JOIN/ROOM_LEAVE, имя, комната), добавление и удаление контакта
+        (WriteKinds.CONTACT_ADD/CONTACT_DEL, имя, контакт). Статусы одного пользователя сводятся к последнему,
+        поэтому на пользователя выполняется не больше одного UPDATE; записи об удаленных пользователях пропускаются
+        """
+        statuses = dict()
+        try:
+            for kind, username, *args in records:
+                if kind == WriteKinds.LOGIN:
+                    ip_address, timestamp = args
+                    self.session.add(History(username=username, ip_address=ip_address, login_timestamp=timestamp))
+                elif kind == WriteKinds.STATUS:
+                    is_active, status = args
+                    values = statuses.setdefault(username, dict())
+                    values["is_active"] = is_active
+                    if status:
+                        values["status"] = status
+                elif kind == WriteKinds.ROOM_JOIN:
+                    self._add_room_member(args[0], username)
+                elif kind == WriteKinds.ROOM_LEAVE:
+                    self._remove_room_member(args[0], username)
+                elif kind == WriteKinds.CONTACT_ADD:
+                    self._add_contact(username, args[0])
+                elif kind == WriteKinds.CONTACT_DEL:
+                    self._delete_contact(username, args[0])
+            for username, values in statuses.items():
+                self.session.query(User).filter_by(username=username).update(values)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        for username, values in statuses.items():
+            if "status" in values:
+                self.users.set_status(username, values["status"])
+
     def add_user(self, username, password):
         password = self.make_passwd_hash(username=username, password=password)
         user = User(username=username, password=password)
         self.session.add(user)
         self.session.commit()
+        self.users.invalidate(username)
 
     def change_user_status(self, username: str, is_active: bool, status: str = ""):
-        user = self.session.query(User).filter_by(username=username).one()
-        user.is_active = is_active
+        user = self._get_user(username)
+        values: dict = {"is_active": is_active}
         if status:
-            user.status = status
-        self.session.add(user)
+            values["status"] = status
+        self.session.query(User).filter_by(id=user.id).update(values)
         self.session.commit()
+        if status:
+            self.users.set_status(username, status)
 
     def get_active_users(self):
         query = self.session.query(User).filter_by(is_active=True).all()
@@ -85,9 +160,89 @@ class ServerStorage:
         for user in self.get_active_users():
             self.change_user_status(user, is_active=False)
 
+    def store_pending_msg(self, username: str, payload: str):
+        try:
+            user = self._get_user(username)
+        except NoResultFound:
+            return False
+        self.session.add(PendingMessage(recipient_id=user.id, payload=payload))
+        self.session.commit()
+        return True
+
+    def pop_pending_msgs(self, username: str):
+        try:
+            user = self._get_user(username)
+        except NoResultFound:
+            return []
+        query = self.session.query(PendingMessage).filter_by(recipient_id=user.id)
+        messages = query.order_by(PendingMessage.id).all()
+        payloads = [msg.payload for msg in messages]
+        if messages:
+            query.filter(PendingMessage.id <= messages[-1].id).delete(synchronize_session=False)
+            self.session.commit()
+        return payloads
+
+    def get_rooms(self):
+        query = (
+            self.session.query(Room.name, User.username)
+            .join(RoomMember, RoomMember.room_id == Room.id)
+            .join(User, User.id == RoomMember.user_id)
+        )
+        rooms = dict()
+        for room_name, username in query:
+            rooms.setdefault(room_name, set()).add(username)
+        return rooms
+
+    def add_room_member(self, room_name: str, username: str):
+        if not self._add_room_member(room_name, username):
+            return False
+        self.session.commit()
+        return True
+
+    def _add_room_member(self, room_name: str, username: str) -> bool:
+        try:
+            user = self._get_user(username)
+        except NoResultFound:
+            return False
+        room = self.session.query(Room).filter_by(name=room_name).one_or_none()
+        if room is None:
+            room = Room(name=room_name)
+            self.session.add(room)
+            self.session.flush()
+        if not self.session.query(RoomMember).filter_by(room_id=room.id, user_id=user.id).count():
+            self.session.add(RoomMember(room_id=room.id, user_id=user.id))
+        return True
+
+    def remove_room_member(self, room_name: str, username: str):
+        deleted = self._remove_room_member(room_name, username)
+        self.session.commit()
+        return deleted
+
+    def _remove_room_member(self, room_name: str, username: str) -> bool:
+        try:
+            room = self.session.query(Room).filter_by(name=room_name).one()
+            user = self._get_user(username)
+        except NoResultFound:
+            return False
+        return bool(self.session.query(RoomMember).filter_by(room_id=room.id, user_id=user.id).delete())
+
+    def get_contact_graph(self):
+        """Все активные контакты одним запросом: имя пользователя -> множество имен контактов"""
+        contact_user = aliased(User)
+        query = (
+            self.session.query(User.username, contact_user.username)
+            .join(Contact, Contact.user_id == User.id)
+            .join(contact_user, contact_user.id == Contact.contact_id)
+            .filter(Contact.is_active.is_(True))
+        )
+        contacts = dict()
+        for username, contact_name in query:
+            contacts.setdefault(username, set()).add(contact_name)
+        return contacts
+
     def get_user_contacts(self, username: str):
         try:
-            user = self.session.query(User).filter_by(username=username).one()
+            user = self._get_user(username)
             contacts = self.session.query(Contact).filter_by(user_id=user.id, is_active=True).all()
         except NoResultFound:
             return []
@@ -95,22 +250,33 @@ class ServerStorage:
             return [contact.contact.username for contact in contacts]
 
     def delete_contact(self, username: str, contact_name: str):
+        if not self._delete_contact(username, contact_name):
+            return False
+        self.session.commit()
+        return True
+
+    def _delete_contact(self, username: str, contact_name: str) -> bool:
         try:
-            user = self.session.query(User).filter_by(username=username).one()
-            contact = self.session.query(User).filter_by(username=contact_name).one()
-            self.session.query(Contact).filter_by(user_id=user.id, contact_id=contact.id).update({"is_active": False})
-            self.session.commit()
-            return True
+            user = self._get_user(username)
+            contact = self._get_user(contact_name)
         except NoResultFound:
             return False
+        self.session.query(Contact).filter_by(user_id=user.id, contact_id=contact.id).update({"is_active": False})
+        return True
 
     def add_contact(self, username: str, contact_name: str):
+        if not self._add_contact(username, contact_name):
+            return False
+        self.session.commit()
+        return True
+
+    def _add_contact(self, username: str, contact_name: str) -> bool:
         try:
-            user = self.session.query(User).filter_by(username=username).one()
-            contact = self.session.query(User).filter_by(username=contact_name).one()
-            user.contacts.append(contact)
-            self.session.query(Contact).filter_by(user_id=user.id, contact_id=contact.id).update({"is_active": True})
-            self.session.commit()
-            return True
+            user = self._get_user(username)
+            contact = self._get_user(contact_name)
         except NoResultFound:
             return False
+        query = self.session.query(Contact).filter_by(user_id=user.id, contact_id=contact.id)
+        if not query.update({"is_active": True}):
+            self.session.add(Contact(user_id=user.id, contact_id=contact.id))
+        return True
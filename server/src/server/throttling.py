@@ -0,0 +1,92 @@
+from collections import OrderedDict
+
+
+class TokenBuckets:
+    """
+    Ведра токенов по ключу (IP-адрес, имя пользователя) для ограничения частоты попыток входа:
+    в ведре не больше capacity токенов, они пополняются со скоростью rate в секунду, попытка забирает токен.
+    Ведра хранятся в порядке последнего обращения: ведро, к которому не обращались дольше времени
+    полного пополнения, неотличимо от нового и удаляется с начала словаря. Число ведер ограничено max_keys
+    """
+
+    def __init__(self, capacity: float, rate: float, max_keys: int) -> None:
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self.refill_time = capacity / rate
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _level(self, key: str, now: float) -> float:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        tokens, updated = bucket
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def _store(self, key: str, tokens: float, now: float):
+        self.buckets[key] = (tokens, now)
+        self.buckets.move_to_end(key)
+        while self.buckets:
+            _, updated = next(iter(self.buckets.values()))
+            if len(self.buckets) <= self.max_keys and now - updated < self.refill_time:
+                break
+            self.buckets.popitem(last=False)
+
+    def acquire(self, key: str, now: float) -> bool:
+        """Забирает токен из ведра ключа; False - ведро пусто и попытку нужно отклонить"""
+        tokens = self._level(key, now)
+        if tokens < 1:
+            self.rejected += 1
+            return False
+        self._store(key, tokens - 1, now)
+        return True
+
+    def refund(self, key: str, now: float):
+        """Возвращает токен в ведро: попытка оказалась успешной и не должна расходовать лимит"""
+        if key in self.buckets:
+            self._store(key, min(self.capacity, self._level(key, now) + 1), now)
+
+
+class ExpiringSet:
+    """
+    Множество ключей с ограниченным временем жизни (отрицательный кеш). Срок у всех ключей одинаковый,
+    поэтому порядок вставки совпадает с порядком истечения и истекшие ключи удаляются с начала словаря
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.expires: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.expires)
+
+    def add(self, key: str, now: float):
+        self.expires[key] = now + self.ttl
+        self.expires.move_to_end(key)
+        self.purge(now)
+        while len(self.expires) > self.max_size:
+            self.expires.popitem(last=False)
+
+    def discard(self, key: str):
+        self.expires.pop(key, None)
+
+    def contains(self, key: str, now: float) -> bool:
+        expires = self.expires.get(key)
+        if expires is None:
+            return False
+        if expires <= now:
+            del self.expires[key]
+            return False
+        self.hits += 1
+        return True
+
+    def purge(self, now: float):
+        """Удаляет истекшие ключи"""
+        while self.expires and next(iter(self.expires.values())) <= now:
+            self.expires.popitem(last=False)
@@ -0,0 +1,48 @@
+class TimerWheel:
+    """
+    Хешированное колесо таймеров: срок каждого ключа округляется до тика и попадает в слот колеса.
+    Продвижение колеса просматривает только слоты прошедших тиков, поэтому стоимость проверки
+    зависит от числа истекающих таймеров, а не от общего числа отслеживаемых ключей
+    """
+
+    def __init__(self, tick: float, slots: int, now: float = 0.0) -> None:
+        self.tick = tick
+        self.slots: list[dict] = [dict() for _ in range(slots)]
+        self.current_tick = int(now / tick)
+        self._slot_index: dict = dict()
+
+    def __len__(self):
+        return len(self._slot_index)
+
+    def __contains__(self, key):
+        return key in self._slot_index
+
+    def schedule(self, key, delay: float, now: float):
+        """Ставит (или переставляет) таймер ключа на срок now + delay"""
+        self.cancel(key)
+        deadline = max(int((now + delay) / self.tick), self.current_tick + 1)
+        index = deadline % len(self.slots)
+        self.slots[index][key] = deadline
+        self._slot_index[key] = index
+
+    def cancel(self, key):
+        index = self._slot_index.pop(key, None)
+        if index is not None:
+            self.slots[index].pop(key, None)
+
+    def advance(self, now: float) -> list:
+        """Продвигает колесо до момента now и возвращает ключи с истекшим сроком"""
+        target = int(now / self.tick)
+        expired = []
+        steps = min(target - self.current_tick, len(self.slots))
+        for offset in range(1, steps + 1):
+            slot = self.slots[(self.current_tick + offset) % len(self.slots)]
+            if not slot:
+                continue
+            for key, deadline in list(slot.items()):
+                if deadline <= target:
+                    del slot[key]
+                    del self._slot_index[key]
+                    expired.append(key)
+        self.current_tick = max(self.current_tick, target)
+        return expired
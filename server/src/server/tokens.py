@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+from pathlib import Path
+from time import time
+
+
+def load_token_secret(path: Path, size: int = 32) -> bytes:
+    """
+    Читает ключ подписи токенов из файла, а при его отсутствии создает новый (права 0600).
+    Общий файл ключа позволяет воркерам кластера и перезапущенному серверу принимать выданные ранее токены
+    """
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_bytes(size)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # ключ одновременно создал другой воркер
+        return path.read_bytes()
+    with os.fdopen(fd, "wb") as file:
+        file.write(secret)
+    return secret
+
+
+class SessionTokens:
+    """
+    Подписанные (HMAC-SHA256) токены сессии с ограниченным сроком действия.
+    Токен выдается после успешного входа и позволяет повторно войти без пароля: проверка токена -
+    сравнение подписи и поиск в списке отзыва, без PBKDF2.
+    Формат токена: имя пользователя (base64url), время выдачи и окончания действия (мс), идентификатор, подпись.
+    Подпись охватывает и хеш пароля пользователя (в токен он не входит): после смены пароля или удаления
+    пользователя выданные ему токены перестают проходить проверку.
+    Отозванные идентификаторы хранятся до окончания действия токена, а если задан каталог revoked_dir -
+    еще и дописываются в файлы каталога (по файлу на каждый интервал ttl окончания действия), чтобы отзыв
+    пережил перезапуск сервера: ключ подписи хранится в файле и после перезапуска остается прежним
+    """
+
+    PURGE_EVERY = 1024  # отозванных токенов между очистками списка от истекших
+
+    def __init__(self, secret: bytes, ttl: float, revoked_dir: Path | None = None) -> None:
+        self.secret = secret
+        self.ttl = ttl
+        self.revoked_dir = revoked_dir
+        self.revoked: dict[str, int] = dict()
+        self._revoked_since_purge = 0
+        if revoked_dir is not None:
+            self._load_revoked()
+
+    def _sign(self, body: str, binding: str) -> bytes:
+        digest = hmac.new(self.secret, f"{body}.{binding}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=")
+
+    def issue(self, username: str, binding: str, now: float | None = None) -> str:
+        """Выдает токен пользователю; binding - текущий хеш его пароля"""
+        issued = int((time() if now is None else now) * 1000)
+        expires = issued + int(self.ttl * 1000)
+        user = base64.urlsafe_b64encode(username.encode()).decode("ascii")
+        body = f"{user}.{issued}.{expires}.{secrets.token_hex(8)}"
+        return f"{body}.{self._sign(body, binding).decode('ascii')}"
+
+    @staticmethod
+    def _parse(token: str) -> tuple[str, str, int, int, str, str]:
+        """Разбирает токен без проверки подписи: (тело, имя пользователя, выдан, истекает, идентификатор, подпись)"""
+        body, _, signature = token.rpartition(".")
+        user, issued, expires, token_id = body.split(".")
+        return body, base64.urlsafe_b64decode(user).decode(), int(issued), int(expires), token_id, signature
+
+    def verify(self, token: str, username: str, binding: str, now: float | None = None) -> bool:
+        """
+        Проверяет, что токен подписан сервером для пользователя username с хешем пароля binding,
+        не истек и не отозван
+        """
+        try:
+            body, user, _, expires, token_id, signature = self._parse(token)
+        except (ValueError, UnicodeError):
+            return False
+        if not hmac.compare_digest(signature.encode(), self._sign(body, binding)):
+            return False
+        return user == username and expires > (time() if now is None else now) * 1000 and token_id not in self.revoked
+
+    def revoke(self, token: str, now: float | None = None, persist: bool = True):
+        """
+        Отзывает токен до окончания его срока действия. Отзываются только токены, уже принятые сервером,
+        поэтому подпись не проверяется. persist=False - не записывать отзыв в файл (его записал другой воркер)
+        """
+        try:
+            _, _, _, expires, token_id, _ = self._parse(token)
+        except (ValueError, UnicodeError):
+            return
+        self.revoked[token_id] = expires
+        if persist and self.revoked_dir is not None:
+            with open(self._revoked_path(expires), "a") as file:
+                file.write(f"{token_id} {expires}\n")
+        self._revoked_since_purge += 1
+        if self._revoked_since_purge >= self.PURGE_EVERY:
+            self.purge(now)
+
+    def purge(self, now: float | None = None):
+        """Удаляет из списка отзыва (и из каталога отзыва) истекшие токены: они и так не пройдут проверку"""
+        now_ms = (time() if now is None else now) * 1000
+        self.revoked = {token_id: expires for token_id, expires in self.revoked.items() if expires > now_ms}
+        self._revoked_since_purge = 0
+        if self.revoked_dir is not None:
+            for path in self._revoked_files(now_ms, expired=True):
+                path.unlink(missing_ok=True)
+
+    def _revoked_path(self, expires: int) -> Path:
+        return self.revoked_dir / f"{expires // int(self.ttl * 1000)}.revoked"  # type: ignore
+
+    def _revoked_files(self, now_ms: float, expired: bool) -> list[Path]:
+        """Файлы отзыва, все токены которых уже истекли (expired=True), или остальные"""
+        interval = int(self.ttl * 1000)
+        files = []
+        for path in self.revoked_dir.glob("*.revoked"):  # type: ignore
+            try:
+                is_expired = (int(path.stem) + 1) * interval <= now_ms
+            except ValueError:
+                continue
+            if is_expired == expired:
+                files.append(path)
+        return files
+
+    def _load_revoked(self):
+        now_ms = time() * 1000
+        for path in self._revoked_files(now_ms, expired=False):
+            for line in path.read_text().splitlines():
+                try:
+                    token_id, expires = line.split()
+                    self.revoked[token_id] = int(expires)
+                except ValueError:
+                    continue  # строка, недописанная при аварийной остановке
+        self.purge()
@@ -1,19 +1,56 @@
+from collections.abc import Iterable
 from contextlib import ContextDecorator
+from datetime import datetime
+from functools import partial
 from http import HTTPStatus
 from ipaddress import ip_address
-from select import select
+from selectors import EVENT_READ, EVENT_WRITE, DefaultSelector
 from socket import AF_INET, SOCK_STREAM, socket
-from time import sleep
+from time import monotonic, sleep
 
 from common.base import JIMBase
+from common.buffers import RECV_POOL
+from common.codecs import JSON_CODEC, choose_codec, get_codec
 from common.decorators import login_required
 from common.descriptors import PortDescriptor
 from common.errors import IncorrectDataRecivedError, NonDictInputError, ReqiuredFieldMissingError
+from common.framing import FrameDecoder, pack_frame
+from common.messages import (
+    AddContact,
+    Auth,
+    ChatMsg,
+    Contacts,
+    DelContact,
+    JIMMessage,
+    Join,
+    Leave,
+    Presence,
+    Probe,
+    Quit,
+    Response,
+)
 from common.meta import JIMMeta
-from common.schema import Actions, Keys
+from common.schema import Actions, Features, JIMValidationSchema
+from server.buffers import OutboundBuffer, OverflowPolicy
 from server.config import ServerConf
+from server.contacts import ContactGraph
+from server.executor import BlockingExecutor, done_future, run_inline
 from server.logger_conf import main_logger
-from server.storage import ServerStorage
+from server.presence import PresenceRegistry, write_snapshot
+from server.rooms import RoomRegistry, is_room_name
+from server.sessions import Session, SessionRegistry
+from server.storage import ServerStorage, WriteKinds
+from server.throttling import ExpiringSet, TokenBuckets
+from server.timers import TimerWheel
+from server.tokens import SessionTokens, load_token_secret
+from server.write_behind import WriteBehindQueue
+
+
+# сообщение чата пересылается в исходных байтах, только если в нем ровно поля схемы и оно не длиннее
+# самого большого допустимого сообщения (до 4 байт UTF-8 на символ полей плюс разметка);
+# иначе лишние поля и пробелы ушли бы получателям в обход схемы
+RELAY_KEYS = frozenset(JIMValidationSchema.msg_keys[Actions.MSG])
+RELAY_MAX_SIZE = 4 * sum(JIMValidationSchema.field_limits.get(key, 0) for key in RELAY_KEYS) + 256
 
 
 class JIMServer(JIMBase, ContextDecorator, metaclass=JIMMeta):
@@ -28,10 +65,31 @@ class JIMServer(JIMBase, ContextDecorator, metaclass=JIMMeta):
         self.ip = ip_address(ip)
         self.port = port
         self.sock = socket(AF_INET, SOCK_STREAM)
-        self.connections = []
-        self.active_clients = dict()
-        self.storage = ServerStorage()
+        self.sessions = SessionRegistry()
+        self.presence = PresenceRegistry()
+        self._presence_due = 0.0
+        self._snapshot_due = 0.0
+        self._is_snapshot_stale = False
+        self.timers = TimerWheel(ServerConf.TIMER_TICK, ServerConf.TIMER_SLOTS, now=monotonic())
+        self.selector = DefaultSelector()
+        self.storage = self._make_storage()
+        self.rooms = RoomRegistry(self.storage.get_rooms())
+        self.contacts = ContactGraph(self.storage.get_contact_graph())
+        self.tokens = SessionTokens(
+            load_token_secret(ServerConf.TOKEN_SECRET_PATH), ServerConf.TOKEN_TTL, ServerConf.TOKEN_REVOKED_DIR
+        )
+        # ограничение частоты неудачных входов и отрицательный кеш несуществующих имен
+        max_keys = ServerConf.AUTH_THROTTLE_MAX_KEYS
+        self.ip_attempts = TokenBuckets(ServerConf.AUTH_IP_BURST, ServerConf.AUTH_IP_RATE, max_keys)
+        self.user_attempts = TokenBuckets(ServerConf.AUTH_USER_BURST, ServerConf.AUTH_USER_RATE, max_keys)
+        self.unknown_users = ExpiringSet(ServerConf.UNKNOWN_USER_TTL, max_keys)
         self.is_running = False
+        # соединения, в которые писали за текущую итерацию цикла (упорядоченное множество); None - вне цикла
+        self._tick_writes: dict | None = None
+        # пул потоков для блокирующих вызовов создается при запуске цикла; до этого они выполняются сразу
+        self.executor: BlockingExecutor | None = None
+        # очередь отложенной записи входов и статусов создается при запуске цикла; до этого запись идет сразу
+        self.writer: WriteBehindQueue | None = None
 
     def __str__(self):
         return "JIM_server_object"
@@ -46,10 +104,10 @@ class JIMServer(JIMBase, ContextDecorator, metaclass=JIMMeta):
     def _listen(self):
         self.sock.bind((str(self.ip), self.port))
         self.sock.setblocking(False)
-        self.sock.settimeout(0.2)
-        self.sock.listen(ServerConf.MAX_CONNECTIONS)
+        self.sock.listen(ServerConf.LISTEN_BACKLOG)
         main_logger.info(f"Сервер запущен на {self.ip}:{self.port}.")
         self.is_running = True
+        self._remove_stale_snapshot()
 
     def start_server(self):
         """Запускает сервер на прослушивание порта и обработку сообщений"""
@@ -63,182 +121,715 @@ class JIMServer(JIMBase, ContextDecorator, metaclass=JIMMeta):
         self._mainloop()
 
     def _mainloop(self):
+        self.selector.register(self.sock, EVENT_READ, self._accept_connections)
+        self.executor = self._make_executor()
+        if self.executor:
+            self.selector.register(self.executor.wakeup_sock, EVENT_READ, self.executor.run_callbacks)
+        self.writer = self._make_writer()
+        while self.is_running:
+            events_ready = self.selector.select(timeout=ServerConf.SELECT_TIMEOUT)
+            if ServerConf.OUTBOUND_COALESCE:
+                self._tick_writes = dict()
+            for key, events in events_ready:
+                if key.data:
+                    # служебные сокеты (слушающий и т.п.) регистрируются со своим обработчиком
+                    key.data()
+                    continue
+                if events & EVENT_WRITE:
+                    self._flush(key.fileobj)
+                if events & EVENT_READ and key.fileobj.fileno() != -1:
+                    self._accept_message(key.fileobj)
+            now = monotonic()
+            self._check_idle_sessions(now)
+            self._persist_presence(now)
+            self._flush_tick_writes()
+        # соединение SQLite нельзя закрыть из другого потока, поэтому сессия потока цикла закрывается здесь
+        self.storage.session.remove()
+
+    def _flush_tick_writes(self):
+        """Отправляет кадры, накопленные за итерацию цикла: по одному вызову sendmsg на соединение"""
+        pending, self._tick_writes = self._tick_writes, None
+        if pending:
+            for client in pending:
+                self._flush(client)
+
+    def _flush_tick_write(self, conn) -> bool:
+        """Сразу отправляет кадры соединения, отложенные до конца итерации цикла; False - таких кадров нет"""
+        if not self._tick_writes or conn not in self._tick_writes:
+            return False
+        del self._tick_writes[conn]
+        self._flush(conn)
+        return True
+
+    def _make_storage(self) -> ServerStorage:
+        return ServerStorage()
+
+    def _make_executor(self) -> BlockingExecutor | None:
+        if ServerConf.BLOCKING_WORKERS <= 0:
+            return None
+        return BlockingExecutor(ServerConf.BLOCKING_WORKERS, ServerConf.BLOCKING_MAX_PENDING)
+
+    def _make_writer(self) -> WriteBehindQueue | None:
+        if ServerConf.WRITE_BEHIND_MAX_DELAY <= 0:
+            return None
+        return WriteBehindQueue(
+            self.storage.apply_writes,
+            ServerConf.WRITE_BEHIND_MAX_BATCH,
+            ServerConf.WRITE_BEHIND_MAX_DELAY,
+            on_exit=self.storage.session.remove,
+        )
+
+    def _persist_presence(self, now: float):
+        """
+        Раз в PRESENCE_PERSIST_INTERVAL отправляет накопленные изменения присутствия в очередь записи в БД
+        (по одной записи на пользователя) и обновляет файл снимка присутствия в пуле потоков
+        """
+        if now < self._presence_due:
+            return
+        self._presence_due = now + ServerConf.PRESENCE_PERSIST_INTERVAL
+        changes = self.presence.pop_changes()
+        for username, (is_active, status) in changes.items():
+            self._write_behind(WriteKinds.STATUS, username, is_active, status)
+        # снимок обновляется и без изменений, чтобы окно клиентов отличало его от снимка остановленного процесса
+        if changes or self._is_snapshot_stale or now >= self._snapshot_due:
+            self._snapshot_due = now + ServerConf.PRESENCE_SNAPSHOT_MAX_AGE / 2
+            snapshot = self.presence.snapshot()
+            self._is_snapshot_stale = not self._run_blocking(None, write_snapshot, self._snapshot_path(), snapshot)
+
+    def _snapshot_path(self):
+        # имя класса сервера одинаково у всех его экземпляров, поэтому в имени файла есть адрес:
+        # иначе серверы на разных портах писали бы в один снимок и удаляли бы его друг у друга
+        return ServerConf.PRESENCE_DIR / f"{self}_{self.ip}_{self.port}.json"
+
+    def _remove_stale_snapshot(self):
+        """Удаляет снимок, оставшийся от прежнего запуска, завершенного без закрытия сервера"""
+        self._snapshot_path().unlink(missing_ok=True)
+
+    def _write_behind(self, kind: str, username: str, *args):
+        """
+        Отправляет запись о входе, статусе, комнате или контакте пользователя в очередь отложенной записи
+        (без нее - сразу в БД)
+        """
+        record = (kind, username, *args)
+        if self.writer is None or not self.writer.put(record):
+            self.storage.apply_writes([record])
+
+    def _run_blocking(self, callback, func, *args) -> bool:
+        """
+        Выполняет блокирующий вызов func(*args) в пуле потоков, не останавливая цикл событий;
+        callback(future) вызывается в цикле событий, когда результат готов.
+        Без пула (сервер не запущен или BLOCKING_WORKERS = 0) вызов выполняется сразу.
+        Возвращает False, если пул перегружен и задача не принята
+        """
+        if self.executor is None:
+            run_inline(callback, func, *args)
+            return True
+        return self.executor.submit(callback, self._call_in_worker, func, *args)
+
+    def _call_in_worker(self, func, *args):
+        try:
+            return func(*args)
+        finally:
+            # сессия ORM привязана к потоку: после задачи соединение с БД возвращается в пул
+            self.storage.session.remove()
+
+    def _accept_connections(self):
         while True:
-            if not self.is_running:
-                break
             try:
                 conn, addr = self.sock.accept()
             except OSError:
-                pass
+                break
+            main_logger.info(f"Подключился клиент {':'.join(map(str, addr))}")
+            conn.setblocking(False)
+            session = self._open_session(conn)
+            self.selector.register(conn, EVENT_READ)
+            session.events = EVENT_READ
+
+    def _open_session(self, conn) -> Session:
+        session = self.sessions.open(conn)
+        session.last_seen = monotonic()
+        self.timers.schedule(session, ServerConf.IDLE_TIMEOUT, session.last_seen)
+        return session
+
+    def _check_idle_sessions(self, now: float):
+        """
+        Обрабатывает сессии с истекшим таймером: молчавшему клиенту отправляется probe,
+        а не ответивший на probe клиент отключается. Разрыв соединения определяется по событиям чтения
+        """
+        for session in self.timers.advance(now):
+            if self.sessions.get(session.conn) is not session:
+                continue
+            idle = now - session.last_seen
+            if idle < ServerConf.IDLE_TIMEOUT:
+                session.is_probed = False
+                self.timers.schedule(session, ServerConf.IDLE_TIMEOUT - idle, now)
+            elif not session.is_probed:
+                session.is_probed = True
+                self.timers.schedule(session, ServerConf.PROBE_TIMEOUT, now)
+                self._send(msg=self._make_probe_msg(), client=session.conn)
             else:
-                main_logger.info(f"Подключился клиент {':'.join(map(str, addr))}")
-                self.connections.append(conn)
-            finally:
-                r_clients = []
-                try:
-                    if self.connections:
-                        r_clients, _, _ = select(self.connections, self.connections, self.connections)
-                except OSError:
-                    pass
-                for client in r_clients:
-                    self._accept_message(client)
-                self._cleanup_disconnected_users()
-
-    def _cleanup_disconnected_users(self):
-        disconnected_users = []
-        for user, conn in self.active_clients.items():
-            try:
-                conn.getpeername()
-            except OSError:
-                disconnected_users.append((conn, user))
-        for conn, user in disconnected_users:
-            self._disconnect_client(conn, user)
+                main_logger.info(f"Клиент {session.username or ''} не отвечает, отключаю.")
+                self._disconnect_client(session.conn)
 
-    def _disconnect_client(self, conn: socket, user: str | None = None):
-        if user:
-            self.storage.change_user_status(username=user, is_active=False)
-            try:
-                self.active_clients.pop(user)
-            except KeyError:
-                pass
+    def _get_username(self, conn: socket) -> str | None:
+        session = self.sessions.get(conn)
+        return session.username if session else None
+
+    def _disconnect_client(self, conn: socket):
+        # кадры, отложенные до конца итерации (например, ответ с отказом во входе), уходят до закрытия сокета
+        if self._flush_tick_write(conn) and conn not in self.sessions:
+            return  # соединение уже закрыто из-за ошибки отправки
+        session = self.sessions.close(conn)
+        if session:
+            self.timers.cancel(session)
+            if session.frame_decoder:
+                session.frame_decoder.close()
+            if session.username:
+                self.presence.set_offline(session.username, conn)
         try:
-            self.connections.remove(conn)
-        except ValueError:
+            self.selector.unregister(conn)
+        except (KeyError, ValueError, RuntimeError):
             pass
         conn.close()
         main_logger.info(f"Клиент отключился.")
 
+    def stop(self):
+        """Останавливает цикл обработки событий; можно вызывать из другого потока"""
+        self.is_running = False
+
     def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+        for username, (is_active, status) in self.presence.pop_changes().items():
+            self._write_behind(WriteKinds.STATUS, username, is_active, status)
+        self._snapshot_path().unlink(missing_ok=True)
+        if self.writer:
+            self.writer.close()
+            main_logger.info(
+                f"Отложенная запись: {self.writer.records} записей в {self.writer.batches} транзакциях, "
+                f"наибольшая очередь {self.writer.max_depth}, самая долгая транзакция "
+                f"{self.writer.commit_time_max * 1000:.1f} мс"
+            )
+            self.writer = None
+        main_logger.info(
+            f"Кеш пользователей хранилища: {self.storage.users.hits} попаданий, {self.storage.users.misses} промахов"
+        )
+        self.selector.close()
         self.sock.close()
-        self.connections = []
-        self.active_clients = dict()
+        self.sessions = SessionRegistry()
+        self.presence = PresenceRegistry()
+        self.timers = TimerWheel(ServerConf.TIMER_TICK, ServerConf.TIMER_SLOTS, now=monotonic())
         self.is_running = False
 
     def _accept_message(self, client_conn: socket):
+        session = self.sessions.get(client_conn)
+        if session:
+            session.last_seen = monotonic()
+        for msg, payload in self._recv_messages(client_conn):
+            if client_conn not in self.sessions:
+                break
+            self._process_msg(msg, client_conn, payload)
+        if session and session.frame_decoder:
+            # тела кадров обработаны, опустевший буфер приема возвращается в пул
+            session.frame_decoder.reclaim()
+
+    def _process_msg(self, msg: dict, client_conn: socket, payload: bytes | memoryview | None = None):
+        """
+        Обрабатывает принятое сообщение и отправляет ответ клиенту.
+        payload - исходные байты сообщения из кадра: сообщения чата пересылаются получателям в них же
+        """
         response_code = HTTPStatus.OK
         response_descr = ""
         disconnect_client = False
-        msg = self._recv(client_conn)
-        if msg:
-            try:
-                self._validate_msg(msg)
-                main_logger.debug(f"Принято сообщение: {msg}")
-                if msg.get(Keys.ACTION) == Actions.AUTH:
-                    response_code, response_descr, disconnect_client = self._register_user(msg, client_conn)
+        is_deferred = False
+        try:
+            message = self._parse_msg(msg)
+            if self._is_relayable(message, msg, payload):
+                session = self.sessions.get(client_conn)
+                message.wire = (session.codec, payload)  # type: ignore
+            main_logger.debug("Принято сообщение: %s", message)  # repr строится, только если уровень DEBUG включен
+            if type(message) is Auth:
+                result = self._register_user(message, client_conn)
+                if result is None:
+                    # ответ на вход отправит обработчик результата проверки пароля
+                    is_deferred = True
                 else:
-                    response_code, response_descr, disconnect_client = self._route_msg(msg, client_conn)
-            except (NonDictInputError, IncorrectDataRecivedError) as ex:
-                response_code = HTTPStatus.INTERNAL_SERVER_ERROR
-                response_descr = str(ex)
-                main_logger.error(f"Принято некорректное сообщение: {response_descr}")
-            except ReqiuredFieldMissingError as ex:
-                response_code = HTTPStatus.INTERNAL_SERVER_ERROR
-                response_descr = str(ex)
-                main_logger.error(f"Ошибка валидации сообщения: {response_descr}")
-            except Exception as ex:
-                response_code = HTTPStatus.INTERNAL_SERVER_ERROR
-                response_descr = str(ex)
-                main_logger.error(f"Непредвиденная ошибка: {response_descr}")
-            finally:
-                response = self._make_response_msg(code=response_code, description=response_descr)
-                self._send(msg=response, client=client_conn)
-                main_logger.debug(f"Отправлен ответ: {response}")
-                if disconnect_client:
-                    self._disconnect_client(client_conn)
-
-    def _register_user(self, msg: dict, client_conn: socket):
-        username = msg[Keys.USER][Keys.ACCOUNT_NAME]
-        if username in self.active_clients:
-            response_code = HTTPStatus.FORBIDDEN
-            response_descr = "Клиент с таким именем уже зарегистрирован на сервере"
-            disconnect_client = True
-        else:
-            passwd = msg[Keys.USER].get(Keys.PASSWORD)
-            ip = client_conn.getpeername()[0]
-            if self.storage.check_user_auth(username=username, password=passwd):
-                self.active_clients[username] = client_conn
-                self.storage.register_user_login(username=username, ip_address=ip)
-                response_code = HTTPStatus.OK
-                response_descr = ""
-                disconnect_client = False
+                    response_code, response_descr, disconnect_client = result
             else:
+                response_code, response_descr, disconnect_client = self._route_msg(message, client_conn)
+        except (NonDictInputError, IncorrectDataRecivedError) as ex:
+            response_code = HTTPStatus.INTERNAL_SERVER_ERROR
+            response_descr = str(ex)
+            main_logger.error(f"Принято некорректное сообщение: {response_descr}")
+        except ReqiuredFieldMissingError as ex:
+            response_code = HTTPStatus.INTERNAL_SERVER_ERROR
+            response_descr = str(ex)
+            main_logger.error(f"Ошибка валидации сообщения: {response_descr}")
+        except Exception as ex:
+            response_code = HTTPStatus.INTERNAL_SERVER_ERROR
+            response_descr = str(ex)
+            main_logger.error(f"Непредвиденная ошибка: {response_descr}")
+        finally:
+            if not is_deferred:
+                self._respond(client_conn, response_code, response_descr, disconnect_client)
+                self._deliver_pending_due(client_conn)
+
+    @staticmethod
+    def _is_relayable(message: JIMMessage, msg: dict, payload: bytes | memoryview | None) -> bool:
+        return (
+            payload is not None
+            and ServerConf.MSG_RELAY
+            and type(message) is ChatMsg
+            and msg.keys() == RELAY_KEYS
+            and len(payload) <= RELAY_MAX_SIZE
+        )
+
+    def _respond(
+        self,
+        client_conn: socket,
+        code: HTTPStatus,
+        description: str | list,
+        disconnect_client: bool,
+        token: str | None = None,
+    ):
+        """
+        Отправляет ответ на запрос клиента; после успешного входа передает клиенту токен сессии
+        и включает возможности протокола
+        """
+        response = self._make_response_msg(code=code, description=description)
+        response.token = token
+        session = self.sessions.get(client_conn)
+        features = session.pending_features if session else None
+        if features:
+            session.pending_features = None  # type: ignore
+            response.features = features
+        self._send(msg=response, client=client_conn)
+        main_logger.debug("Отправлен ответ: %s", response)
+        if features:
+            # накопленное за итерацию уходит в старом формате до переключения кадров и кодека
+            self._flush_tick_write(client_conn)
+            self._enable_features(session, features)  # type: ignore
+        if disconnect_client:
+            self._disconnect_client(client_conn)
+
+    def _register_user(self, msg: Auth, client_conn: socket):
+        """
+        Начинает вход пользователя. Действующий токен сессии принимается сразу, без пароля;
+        иначе пароль проверяется в пуле потоков (PBKDF2 и запрос к БД). Ответ отправляет _complete_login.
+        Попытка входа по паролю расходует лимиты IP-адреса и имени пользователя (успешный вход их возвращает),
+        а имена, не найденные в БД, какое-то время отклоняются без проверки.
+        Возвращает ответ сразу (код, описание, отключить ли клиента), только если вход отклонен
+        без проверки пароля; иначе - None
+        """
+        username = msg.account_name
+        session = self.sessions.get(client_conn)
+        if session is None or self.sessions.get_by_user(username):
+            return HTTPStatus.FORBIDDEN, "Клиент с таким именем уже зарегистрирован на сервере", True
+        callback = partial(self._complete_login, msg, client_conn, session)
+        if msg.token and self._verify_token(msg.token, username):
+            # предъявленный токен заменяется новым, поэтому старый отзывается
+            self._revoke_token(msg.token)
+            callback(done_future(True))
+            return None
+        now = monotonic()
+        ip = client_conn.getpeername()[0]
+        if not self.ip_attempts.acquire(ip, now):
+            main_logger.debug(f"Превышен лимит попыток входа с адреса {ip}")
+            return HTTPStatus.TOO_MANY_REQUESTS, "Слишком много попыток входа, повторите позже", True
+        if not self.user_attempts.acquire(username, now):
+            self.ip_attempts.refund(ip, now)
+            main_logger.debug(f"Превышен лимит попыток входа пользователя {username}")
+            return HTTPStatus.TOO_MANY_REQUESTS, "Слишком много попыток входа, повторите позже", True
+        if self.unknown_users.contains(username, now):
+            return HTTPStatus.FORBIDDEN, "Неверное имя пользователя или пароль", True
+        callback = partial(self._password_checked, ip, username, callback)
+        if not self._run_blocking(callback, self.storage.check_user_auth, username, msg.password):
+            self._refund_auth_attempt(ip, username)
+            return HTTPStatus.SERVICE_UNAVAILABLE, "Сервер перегружен, повторите вход позже", True
+        return None
+
+    def _verify_token(self, token: str, username: str) -> bool:
+        """Токен действителен, только пока пользователь существует и его пароль не менялся"""
+        password_hash = self.storage.get_user_password_hash(username)
+        return bool(password_hash) and self.tokens.verify(token, username, password_hash)
+
+    def _password_checked(self, ip: str, username: str, callback, future):
+        """Верный пароль возвращает потраченные попытки входа, а не найденное в БД имя попадает в отрицательный кеш"""
+        if future.exception() is None:
+            if future.result():
+                self._refund_auth_attempt(ip, username)
+            elif future.result() is None:
+                self.unknown_users.add(username, monotonic())
+        callback(future)
+
+    def _refund_auth_attempt(self, ip: str, username: str):
+        now = monotonic()
+        self.ip_attempts.refund(ip, now)
+        self.user_attempts.refund(username, now)
+
+    def _complete_login(self, msg: Auth, client_conn: socket, session: Session, future):
+        if self.sessions.get(client_conn) is not session:
+            return  # клиент отключился, пока проверялся пароль
+        disconnect_client = True
+        try:
+            is_valid = future.result()
+        except Exception as ex:
+            response_code, response_descr = HTTPStatus.INTERNAL_SERVER_ERROR, str(ex)
+            main_logger.error(f"Непредвиденная ошибка: {response_descr}")
+        else:
+            if not is_valid:
+                response_code, response_descr = HTTPStatus.FORBIDDEN, "Неверное имя пользователя или пароль"
+            elif self.sessions.get_by_user(msg.account_name):
                 response_code = HTTPStatus.FORBIDDEN
-                response_descr = "Неверное имя пользователя или пароль"
-                disconnect_client = True
-        return response_code, response_descr, disconnect_client
+                response_descr = "Клиент с таким именем уже зарегистрирован на сервере"
+            else:
+                self._login_user(session, msg)
+                response_code, response_descr, disconnect_client = HTTPStatus.OK, "", False
+        self._respond(client_conn, response_code, response_descr, disconnect_client, session.token)
+        if not disconnect_client:
+            # очередь уходит после ответа на следующий запрос: к нему клиент уже прочитал ответ на вход
+            session.is_pending_due = session.offline_msgs
+
+    def _login_user(self, session: Session, msg: Auth):
+        username = msg.account_name
+        self.sessions.login(session, username)
+        self.presence.set_online(username, session.conn)
+        session.pending_features = self._negotiate_features(msg.features)
+        session.token = self.tokens.issue(username, self.storage.get_user_password_hash(username) or "")
+        ip = session.conn.getpeername()[0]
+        self._write_behind(WriteKinds.LOGIN, username, ip, datetime.utcnow())
+
+    def _revoke_token(self, token: str):
+        self.tokens.revoke(token)
+
+    def _negotiate_features(self, offer: dict | None) -> dict:
+        accepted = dict()
+        if offer and ServerConf.FRAMING_ENABLED and offer.get(Features.FRAMING):
+            accepted[Features.FRAMING] = True
+            # двоичные кодеки согласуются только поверх кадров: старый протокол читает JSON фиксированной длины
+            codec = choose_codec(offer.get(Features.CODEC), ServerConf.CODECS)
+            if codec:
+                accepted[Features.CODEC] = codec
+            if ServerConf.COMPRESSION_ENABLED and offer.get(Features.COMPRESSION):
+                accepted[Features.COMPRESSION] = True
+            # клиент, предложивший доставку сообщений не в сети, понимает ответ 202 и отличает пересылки от ответов
+            if offer.get(Features.OFFLINE_MSGS):
+                accepted[Features.OFFLINE_MSGS] = True
+        return accepted
+
+    def _enable_features(self, session: Session, features: dict):
+        if features.get(Features.FRAMING):
+            session.frame_decoder = FrameDecoder()
+        if features.get(Features.CODEC):
+            session.codec = get_codec(features[Features.CODEC])
+        if features.get(Features.COMPRESSION):
+            session.compress_threshold = ServerConf.COMPRESSION_THRESHOLD
+        if features.get(Features.OFFLINE_MSGS):
+            session.offline_msgs = True
 
     @login_required
-    def _route_msg(self, msg: dict, client_conn: socket):
+    def _route_msg(self, msg: JIMMessage, client_conn: socket):
+        """Маршрутизирует типизированное сообщение по его классу"""
         response_code = HTTPStatus.OK
         response_descr = ""
         disconnect_client = False
-        match msg.get(Keys.ACTION):
-            case Actions.PRESENCE:
-                username = msg[Keys.USER][Keys.ACCOUNT_NAME]
-                status = msg[Keys.USER].get(Keys.STATUS)
-                self.storage.change_user_status(username=username, status=status, is_active=True)
-            case Actions.MSG:
-                username = msg[Keys.FROM]
-                target_user = msg[Keys.TO]
-                self.storage.add_contact(username=target_user, contact_name=username)
-                if target_user in self.active_clients:
-                    client_conn = self.active_clients[target_user]
-                    self._send(msg=msg, client=client_conn)
-                    main_logger.debug(f"Отправлено сообщение: {msg}")
-                else:
-                    response_code = HTTPStatus.NOT_FOUND
-                    response_descr = "Пользователь не активен"
-            case Actions.CONTACTS:
-                username = msg[Keys.ACCOUNT_NAME]
-                contacts = self.storage.get_user_contacts(username=username)
+        match msg:
+            case ChatMsg() if msg.from_ != self._get_username(client_conn):
+                response_code = HTTPStatus.FORBIDDEN
+                response_descr = "Отправитель сообщения не совпадает с пользователем соединения"
+            case Presence():
+                self.presence.set_status(msg.account_name, msg.status)
+            case ChatMsg() if is_room_name(msg.to):
+                response_code, response_descr = self._fan_out_msg(msg.to, msg, client_conn)
+            case ChatMsg():
+                username = msg.from_
+                target_user = msg.to
+                self._add_contact(target_user, username)
+                if not self._deliver_msg(target_user, msg):
+                    response_code, response_descr = self._store_offline_msg(target_user, msg, client_conn)
+            case Contacts():
                 response_code = HTTPStatus.ACCEPTED
-                response_descr = contacts
-            case Actions.ADD_CONTACT:
-                username = msg[Keys.ACCOUNT_NAME]
-                contact = msg[Keys.CONTACT]
-                ok = self.storage.add_contact(username=username, contact_name=contact)
-                if not ok:
+                response_descr = sorted(self.contacts.contacts(msg.account_name))
+            case AddContact():
+                if not self._add_contact(msg.account_name, msg.contact):
                     response_code = HTTPStatus.NOT_FOUND
-            case Actions.DEL_CONTACT:
-                username = msg[Keys.ACCOUNT_NAME]
-                contact = msg[Keys.CONTACT]
-                ok = self.storage.delete_contact(username=username, contact_name=contact)
-                if not ok:
+            case DelContact():
+                if not self._delete_contact(msg.account_name, msg.contact):
                     response_code = HTTPStatus.NOT_FOUND
-            case Actions.QUIT:
+            case Quit():
+                # выход по запросу клиента завершает сессию: ее токен больше не принимается
+                session = self.sessions.get(client_conn)
+                if session and session.token:
+                    self._revoke_token(session.token)
                 disconnect_client = True
-            case Actions.JOIN | Actions.LEAVE:
+            case Join() if is_room_name(msg.room):
+                if not self._join_room(msg.room, self._get_username(client_conn)):  # type: ignore
+                    response_code = HTTPStatus.NOT_FOUND
+            case Leave() if is_room_name(msg.room):
+                if not self._leave_room(msg.room, self._get_username(client_conn)):  # type: ignore
+                    response_code = HTTPStatus.NOT_FOUND
+                    response_descr = "Пользователь не состоит в комнате"
+            case Join() | Leave():
                 response_code = HTTPStatus.BAD_REQUEST
+                response_descr = "Имя комнаты должно начинаться с символа #"
             case _:
                 response_code = HTTPStatus.BAD_REQUEST
         return response_code, response_descr, disconnect_client
 
+    def _add_contact(self, username: str, contact_name: str) -> bool:
+        """
+        Добавляет контакт: существующая связь проверяется в памяти, пользователи - по кешу хранилища,
+        а новая связь пишется в БД через очередь отложенной записи
+        """
+        if self.contacts.has(username, contact_name):
+            return True
+        if not self._users_exist(username, contact_name):
+            return False
+        self.contacts.add(username, contact_name)
+        self._write_behind(WriteKinds.CONTACT_ADD, username, contact_name)
+        return True
+
+    def _delete_contact(self, username: str, contact_name: str) -> bool:
+        if not self._users_exist(username, contact_name):
+            return False
+        self.contacts.remove(username, contact_name)
+        self._write_behind(WriteKinds.CONTACT_DEL, username, contact_name)
+        return True
+
+    def _join_room(self, room: str, username: str) -> bool:
+        if not self._users_exist(username):
+            return False
+        if self.rooms.join(room, username):
+            self._write_behind(WriteKinds.ROOM_JOIN, username, room)
+        return True
+
+    def _leave_room(self, room: str, username: str) -> bool:
+        if not self.rooms.leave(room, username):
+            return False
+        self._write_behind(WriteKinds.ROOM_LEAVE, username, room)
+        return True
+
+    def _users_exist(self, *usernames: str) -> bool:
+        return all(self.storage.check_user_exists(username) for username in usernames)
+
+    def _fan_out_msg(self, room: str, msg: ChatMsg, client_conn: socket):
+        """Рассылает сообщение всем участникам комнаты, кроме отправителя"""
+        sender = self._get_username(client_conn)
+        members = self.rooms.members(room)
+        if sender not in members:
+            return HTTPStatus.FORBIDDEN, "Пользователь не состоит в комнате"
+        remote_members = self._deliver_local_many(members - {sender}, msg)
+        if remote_members:
+            self._deliver_remote_many(remote_members, msg)
+        main_logger.debug(f"Сообщение разослано в комнату {room} ({len(members)} участников)")
+        return HTTPStatus.OK, ""
+
+    def _deliver_local_many(self, usernames: Iterable[str], msg: dict | JIMMessage) -> list[str]:
+        """
+        Доставляет сообщение подключенным к этому процессу пользователям и возвращает остальных.
+        Сообщение сериализуется и упаковывается в кадр один раз на каждый вариант протокола (кодек, кадры, сжатие),
+        а не для каждого получателя
+        """
+        payloads = dict()
+        missing = []
+        for username in usernames:
+            session = self.sessions.get_by_user(username)
+            if session is None:
+                missing.append(username)
+                continue
+            wire_format = (session.codec, session.frame_decoder is not None, session.compress_threshold)
+            payload = payloads.get(wire_format)
+            if payload is None:
+                data = self._dump_msg(msg, session.codec)
+                if session.frame_decoder:
+                    data = pack_frame(data, session.compress_threshold)
+                payload = payloads[wire_format] = data
+            self._write(session.conn, payload)
+        return missing
+
+    def _deliver_msg(self, target_user: str, msg: dict | JIMMessage) -> bool:
+        return self._deliver_local(target_user, msg) or self._deliver_remote(target_user, msg)
+
+    def _deliver_local(self, target_user: str, msg: dict | JIMMessage) -> bool:
+        session = self.sessions.get_by_user(target_user)
+        if session is None:
+            return False
+        self._send(msg=msg, client=session.conn)
+        main_logger.debug("Отправлено сообщение: %s", msg)
+        return True
+
+    def _deliver_remote(self, target_user: str, msg: dict | JIMMessage) -> bool:
+        """Доставка пользователю, подключенному к другому процессу сервера; в одиночном режиме таких нет"""
+        return False
+
+    def _deliver_remote_many(self, usernames: list[str], msg: dict | JIMMessage):
+        for username in usernames:
+            self._deliver_remote(username, msg)
+
+    def _store_offline_msg(self, target_user: str, msg: ChatMsg, client_conn: socket):
+        """
+        Сохраняет сообщение пользователю не в сети до его входа. Клиент без согласованной доставки
+        сообщений не в сети считает ответ 202 недоставкой и отправил бы сообщение повторно,
+        поэтому для него сообщение не сохраняется и ответ прежний - 404
+        """
+        session = self.sessions.get(client_conn)
+        if session is None or not session.offline_msgs:
+            return HTTPStatus.NOT_FOUND, "Пользователь не в сети"
+        if self.storage.store_pending_msg(target_user, self._dump_msg(msg).decode(self.encoding)):
+            return HTTPStatus.ACCEPTED, "Пользователь не в сети, сообщение будет доставлено при его входе"
+        return HTTPStatus.NOT_FOUND, "Пользователь не найден"
+
+    def _deliver_pending_due(self, client_conn: socket):
+        session = self.sessions.get(client_conn)
+        if session and session.is_pending_due:
+            session.is_pending_due = False
+            callback = partial(self._pending_msgs_loaded, session)
+            if not self._run_blocking(callback, self.storage.pop_pending_msgs, session.username):
+                # пул перегружен: очередь уйдет после следующего запроса клиента
+                session.is_pending_due = True
+
+    def _pending_msgs_loaded(self, session: Session, future):
+        try:
+            payloads = future.result()
+        except Exception as ex:
+            main_logger.error(f"Не удалось прочитать отложенные сообщения пользователя {session.username}: {ex}")
+            return
+        if self.sessions.get(session.conn) is not session:
+            # пользователь отключился, пока очередь читалась из БД: сообщения возвращаются в нее
+            for payload in payloads:
+                self.storage.store_pending_msg(session.username, payload)
+            return
+        self._deliver_pending_msgs(session, payloads)
+
+    def _deliver_pending_msgs(self, session: Session, payloads: list[str]):
+        """Отправляет вошедшему пользователю накопленные для него сообщения без повторной сериализации"""
+        if not payloads:
+            return
+        main_logger.debug(f"Пользователю {session.username} доставляются отложенные сообщения: {len(payloads)}")
+        if session.frame_decoder:
+            encoded = [payload.encode(self.encoding) for payload in payloads]
+            if session.codec is not JSON_CODEC:
+                # очередь хранится в JSON, для двоичного кодека сообщения перекодируются
+                encoded = [session.codec.encode(JSON_CODEC.decode(payload)) for payload in encoded]
+            # кадры разделимы на стороне клиента, поэтому вся очередь уходит одной записью
+            frames = (pack_frame(payload, session.compress_threshold) for payload in encoded)
+            self._write(session.conn, b"".join(frames))
+        else:
+            for payload in payloads:
+                self._write(session.conn, payload.encode(self.encoding))
+
     def _recv(self, client) -> dict | None:
         msg = None
+        buffer = RECV_POOL.acquire(self.package_length)
         try:
-            raw_data = client.recv(self.package_length)
-            msg = self._load_msg(raw_data)
+            received = client.recv_into(buffer, self.package_length)
+            with memoryview(buffer)[:received] as raw_data:
+                msg = self._load_msg(raw_data)
+        except (BlockingIOError, InterruptedError):
+            # ложное срабатывание готовности (EAGAIN) или прерванный вызов: данные придут со следующим событием
+            pass
         except (IncorrectDataRecivedError, OSError, ConnectionRefusedError, ConnectionResetError, BrokenPipeError):
             self._disconnect_client(conn=client)
         finally:
+            RECV_POOL.release(buffer)
             return msg
 
+    def _recv_messages(self, client) -> list[tuple[dict, memoryview | bytes | None]]:
+        """
+        Принимает сообщения клиента вместе с их исходными байтами (для сообщений без кадров - None).
+        Байты кадров - представления буфера приема, они действительны до следующего чтения соединения
+        """
+        session = self.sessions.get(client)
+        decoder = session.frame_decoder if session else None
+        if decoder is None:
+            msg = self._recv(client)
+            return [(msg, None)] if msg else []
+        try:
+            codec = session.codec  # type: ignore
+            return [(self._load_msg(payload, codec), payload) for payload in decoder.recv_from(client)]
+        except (BlockingIOError, InterruptedError):
+            return []
+        except (IncorrectDataRecivedError, OSError):
+            self._disconnect_client(conn=client)
+            return []
+
     def _send(self, msg, client):
+        session = self.sessions.get(client)
+        msg_raw_data = self._dump_msg(msg, session.codec if session else None)
+        if session and session.frame_decoder:
+            msg_raw_data = pack_frame(msg_raw_data, session.compress_threshold)
+        self._write(client, msg_raw_data)
+
+    def _write(self, client, data: bytes):
+        session = self.sessions.get(client)
+        if session is None:
+            return
+        buffer = session.outbound
+        if buffer is None:
+            buffer = OutboundBuffer(ServerConf.OUTBOUND_HIGH_WATERMARK, ServerConf.OUTBOUND_LOW_WATERMARK)
+            session.outbound = buffer
+        if buffer.is_overloaded and not self._apply_overflow_policy(client, len(buffer)):
+            return
+        is_idle = not buffer
+        buffer.append(data)
+        pending = self._tick_writes
+        if pending is not None and session.frame_decoder and (is_idle or client in pending):
+            # кадры одной итерации цикла уходят в сокет вместе, в конце итерации. Сообщения без кадров
+            # не копятся: клиент старого протокола читает одно сообщение за вызов recv
+            pending[client] = None
+        elif is_idle:
+            self._flush(client)
+        else:
+            self._update_interest(session)
+
+    def _apply_overflow_policy(self, client, buffered: int) -> bool:
+        """Решает судьбу нового кадра для перегруженного получателя; True - поставить кадр в очередь"""
+        policy = ServerConf.OUTBOUND_OVERFLOW_POLICY
+        if policy == OverflowPolicy.DROP:
+            main_logger.debug(f"Кадр отброшен: очередь клиента переполнена ({buffered} байт)")
+            return False
+        if policy == OverflowPolicy.DEFER and buffered < ServerConf.OUTBOUND_HARD_LIMIT:
+            return True
+        main_logger.info(f"Клиент не успевает принимать сообщения ({buffered} байт в очереди), отключаю.")
+        self._disconnect_client(client)
+        return False
 
-        msg_raw_data = self._dump_msg(msg)
-        client.send(msg_raw_data)
+    def _flush(self, client):
+        session = self.sessions.get(client)
+        buffer = session.outbound if session else None
+        if buffer is None:
+            return
+        try:
+            buffer.flush(client)
+        except OSError:
+            self._disconnect_client(client)
+            return
+        self._update_interest(session)  # type: ignore
 
-    def _make_probe_msg(self):
-        msg = {Keys.ACTION: Actions.PROBE}
+    def _update_interest(self, session: Session):
+        """Переключает события селектора по состоянию очереди; системный вызов - только при их изменении"""
+        if not session.events:
+            return
+        buffer = session.outbound
+        events = EVENT_WRITE if buffer else 0
+        if not (buffer and buffer.is_overloaded and ServerConf.OUTBOUND_OVERFLOW_POLICY == OverflowPolicy.DEFER):
+            events |= EVENT_READ
+        if session.events != events:
+            self.selector.modify(session.conn, events)
+            session.events = events
+
+    def _make_probe_msg(self) -> Probe:
+        msg = Probe()
         self._update_timestamp(msg=msg)
         return msg
 
-    def _make_response_msg(self, code: HTTPStatus, description: str | list = ""):
+    def _make_response_msg(self, code: HTTPStatus, description: str | list = "") -> Response:
         if not isinstance(description, list):
             description = description or code.phrase
-        msg = {
-            Keys.RESPONSE: code.value,
-            Keys.ERROR if 400 <= code.value < 600 else Keys.ALERT: description,
-        }
+        if 400 <= code.value < 600:
+            msg = Response(code.value, error=description)
+        else:
+            msg = Response(code.value, alert=description)
         self._update_timestamp(msg=msg)
         return msg
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class UserRecord:
+    """Кешируемые поля пользователя: идентификатор, хеш пароля и текст статуса"""
+
+    __slots__ = ("id", "password", "status")
+
+    def __init__(self, id: int, password: str, status: str | None) -> None:
+        self.id = id
+        self.password = password
+        self.status = status
+
+
+# запись об отсутствии пользователя: повторный вход под несуществующим именем не идет в БД до истечения miss_ttl
+NO_USER = UserRecord(-1, "", None)
+
+
+class UserCache:
+    """
+    Ограниченный LRU-кеш имя пользователя -> UserRecord для ServerStorage, чтобы не искать пользователя
+    по имени в БД в начале каждой операции. Запись живет не дольше ttl секунд: пользователей добавляет
+    и удаляет также графический интерфейс в другом процессе, и его изменения должны доходить до сервера.
+    Инвалидации между процессами (графическим интерфейсом и воркерами кластера) не рассылаются, поэтому
+    удаленный пользователь виден процессу до ttl секунд, а новый считается отсутствующим до miss_ttl секунд.
+    Кешем пользуются цикл событий, пул потоков и поток отложенной записи, поэтому операции идут под блокировкой.
+    Метрики: hits, misses и hit_rate
+    """
+
+    def __init__(self, max_size: int, ttl: float, miss_ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._records: OrderedDict[str, tuple[UserRecord, float]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, username: str, now: float | None = None) -> UserRecord | None:
+        with self._lock:
+            cached = self._records.get(username)
+            if cached is None or cached[1] <= (monotonic() if now is None else now):
+                self.misses += 1
+                return None
+            self._records.move_to_end(username)
+            self.hits += 1
+            return cached[0]
+
+    def put(self, username: str, record: UserRecord, now: float | None = None):
+        """Кеширует запись пользователя; NO_USER кешируется как отсутствие пользователя на miss_ttl секунд"""
+        ttl = self.miss_ttl if record is NO_USER else self.ttl
+        with self._lock:
+            self._records[username] = (record, (monotonic() if now is None else now) + ttl)
+            self._records.move_to_end(username)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def set_status(self, username: str, status: str):
+        """Обновляет статус в кешированной записи (если она есть), не продлевая срок ее жизни"""
+        with self._lock:
+            cached = self._records.get(username)
+            if cached is not None and cached[0] is not NO_USER:
+                record = cached[0]
+                self._records[username] = (UserRecord(record.id, record.password, status), cached[1])
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._records.pop(username, None)
@@ -0,0 +1,96 @@
+from queue import Empty, SimpleQueue
+from threading import Thread
+from time import monotonic
+
+from server.logger_conf import main_logger
+
+_CLOSE = object()
+
+
+class WriteBehindQueue:
+    """
+    Отложенная запись в базу данных: цикл событий только ставит записи в очередь, а отдельный поток
+    собирает их в пачки и применяет одной транзакцией - по max_batch записей или через max_delay секунд
+    после первой записи пачки. close дожидается записи всего, что было поставлено в очередь.
+    Метрики: depth - длина очереди, max_depth, batches и records - число транзакций и записей,
+    commit_time_max и commit_time_total - длительность транзакций
+    """
+
+    def __init__(self, apply_batch, max_batch: int, max_delay: float, on_exit=None) -> None:
+        self.apply_batch = apply_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.on_exit = on_exit
+        self.queue: SimpleQueue = SimpleQueue()
+        self.is_closed = False
+        self.max_depth = 0
+        self.batches = 0
+        self.records = 0
+        self.failed = 0
+        self.commit_time_max = 0.0
+        self.commit_time_total = 0.0
+        self._thread = Thread(target=self._run, name="jim_write_behind", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def put(self, record) -> bool:
+        """Ставит запись в очередь; False - очередь уже закрыта и запись нужно выполнить самостоятельно"""
+        if self.is_closed:
+            return False
+        self.queue.put(record)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def close(self):
+        """Записывает все накопленное и останавливает поток записи"""
+        if self.is_closed:
+            return
+        self.is_closed = True
+        self.queue.put(_CLOSE)
+        self._thread.join()
+
+    def _run(self):
+        is_closing = False
+        while not is_closing:
+            record = self.queue.get()
+            batch = []
+            deadline = monotonic() + self.max_delay
+            while True:
+                if record is _CLOSE:
+                    is_closing = True
+                    break
+                batch.append(record)
+                timeout = deadline - monotonic()
+                if len(batch) >= self.max_batch or timeout <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=timeout)
+                except Empty:
+                    break
+            if batch:
+                self._commit(batch)
+        # записи, поставленные одновременно с закрытием очереди
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get())
+        if batch:
+            self._commit(batch)
+        if self.on_exit is not None:
+            self.on_exit()
+
+    def _commit(self, batch: list):
+        started = monotonic()
+        try:
+            self.apply_batch(batch)
+        except Exception as ex:
+            self.failed += len(batch)
+            main_logger.error(f"Ошибка отложенной записи в базу данных ({len(batch)} записей): {ex}")
+            return
+        elapsed = monotonic() - started
+        self.batches += 1
+        self.records += len(batch)
+        self.commit_time_total += elapsed
+        self.commit_time_max = max(self.commit_time_max, elapsed)
@@ -0,0 +1,172 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from common.messages import Auth
+from common.schema import Actions, Keys
+from server.cluster import ClusterEvents, ClusterRouter, JIMClusterWorker, run_cluster
+from server.config import ServerConf
+from server.contacts import ContactGraph
+
+
+class TestClusterRouter(TestCase):
+    def setUp(self):
+        self.run_dir = Path(tempfile.mkdtemp())
+        self.routers = [ClusterRouter(worker_id, 2, run_dir=self.run_dir) for worker_id in range(2)]
+        return super().setUp()
+
+    def tearDown(self):
+        for router in self.routers:
+            router.close()
+        return super().tearDown()
+
+    def test_user_online_broadcast(self):
+        self.routers[0].user_online("user")
+        events = self.routers[1].recv_events()
+        self.assertEqual(events, [{"event": ClusterEvents.ONLINE, "user": "user", "worker": 0}])
+        self.assertEqual(self.routers[0].recv_events(), [])
+
+    def test_forward_unknown_user(self):
+        self.assertFalse(self.routers[0].forward("user", {}))
+
+    def test_forward_cyrillic_not_escaped(self):
+        # в ASCII-экранировании \uXXXX такое сообщение втрое больше CLUSTER_MAX_EVENT_SIZE
+        text = "я" * (ServerConf.CLUSTER_MAX_EVENT_SIZE // 4)
+        self.routers[0].remote_clients["user"] = 1
+        self.assertTrue(self.routers[0].forward("user", {Keys.MSG: text}))
+        events = self.routers[1].recv_events()
+        self.assertEqual(events[0]["msg"][Keys.MSG], text)
+
+    def test_forward_oversized_event(self):
+        self.routers[0].remote_clients["user"] = 1
+        self.assertFalse(self.routers[0].forward("user", {Keys.MSG: "x" * ServerConf.CLUSTER_MAX_EVENT_SIZE}))
+        self.assertEqual(self.routers[1].recv_events(), [])
+
+
+class TestJIMClusterWorker(TestCase):
+    def setUp(self):
+        self.workers = [JIMClusterWorker("127.0.0.1", 7777, worker_id, 2) for worker_id in range(2)]
+        for worker in self.workers:
+            worker.storage = mock.Mock()
+            worker.storage.pop_pending_msgs.return_value = []
+            worker.storage.get_user_password_hash.return_value = "hash"
+            worker.contacts = ContactGraph()
+        self.conn = mock.Mock()
+        self.conn.send.side_effect = lambda data: len(data)
+        self.msg = {
+            Keys.ACTION: Actions.MSG,
+            Keys.FROM: "user1",
+            Keys.TO: "user2",
+            Keys.MSG: "message",
+            Keys.ENCODING: "utf-8",
+        }
+        return super().setUp()
+
+    def tearDown(self):
+        for worker in self.workers:
+            worker.close()
+        return super().tearDown()
+
+    def test_deliver_to_other_worker(self):
+        self.workers[1].sessions.login(self.workers[1].sessions.open(self.conn), "user2")
+        self.workers[0].router.remote_clients["user2"] = 1
+        self.assertTrue(self.workers[0]._deliver_msg("user2", self.msg))
+        self.workers[1]._accept_cluster_events()
+        delivered = self.workers[1]._load_msg(self.conn.send.call_args.args[0])
+        self.assertEqual(delivered[Keys.MSG], self.msg[Keys.MSG])
+
+    def test_forwarded_msg_stored_when_user_gone(self):
+        self.workers[0].router.remote_clients["user2"] = 1
+        self.assertTrue(self.workers[0]._deliver_msg("user2", self.msg))
+        self.workers[1]._accept_cluster_events()
+        username, payload = self.workers[1].storage.store_pending_msg.call_args.args
+        self.assertEqual((username, json.loads(payload)[Keys.MSG]), ("user2", self.msg[Keys.MSG]))
+
+        self.workers[1].storage.store_pending_msg.reset_mock()
+        self.workers[0].router.forward_many(["user2"], dict(self.msg, **{Keys.TO: "#room"}))
+        self.workers[1]._accept_cluster_events()
+        self.workers[1].storage.store_pending_msg.assert_not_called()
+
+    def test_room_fan_out_one_event_per_worker(self):
+        self.workers[0].sessions.login(self.workers[0].sessions.open(self.conn), "user1")
+        remote_conns = [mock.Mock(), mock.Mock()]
+        for username, conn in zip(("user2", "user3"), remote_conns):
+            conn.send.side_effect = lambda data: len(data)
+            self.workers[1].sessions.login(self.workers[1].sessions.open(conn), username)
+            self.workers[0].router.remote_clients[username] = 1
+        for username in ("user1", "user2", "user3"):
+            self.workers[0].rooms.join("#room", username)
+        with mock.patch.object(self.workers[0].router, "send_to", wraps=self.workers[0].router.send_to) as send_to:
+            self.workers[0]._fan_out_msg("#room", dict(self.msg, **{Keys.TO: "#room"}), self.conn)
+        send_to.assert_called_once()
+        self.workers[1]._accept_cluster_events()
+        for conn in remote_conns:
+            delivered = self.workers[1]._load_msg(conn.send.call_args.args[0])
+            self.assertEqual(delivered[Keys.MSG], self.msg[Keys.MSG])
+
+    def test_oversized_msg_not_forwarded(self):
+        self.workers[0].router.remote_clients["user2"] = 1
+        msg = dict(self.msg, **{Keys.MSG: "x" * ServerConf.CLUSTER_MAX_EVENT_SIZE})
+        self.assertFalse(self.workers[0]._deliver_msg("user2", msg))
+        self.assertEqual(self.workers[1].router.recv_events(), [])
+
+    def test_login_on_other_worker_forbidden(self):
+        self.workers[0].router.remote_clients["user2"] = 1
+        auth_msg = Auth(account_name="user2", password="")
+        self.workers[0].sessions.open(self.conn)
+        code, _, disconnect = self.workers[0]._register_user(auth_msg, self.conn)
+        self.assertEqual((code, disconnect), (403, True))
+        self.workers[0].storage.check_user_auth.assert_not_called()
+
+    def test_online_offline_events(self):
+        self.workers[1].storage.check_user_auth.return_value = True
+        self.conn.getpeername.return_value = ("127.0.0.1", 33333)
+        auth_msg = Auth(account_name="user2", password="")
+        self.workers[1].sessions.open(self.conn)
+        self.workers[1]._register_user(auth_msg, self.conn)
+        self.workers[0]._accept_cluster_events()
+        self.assertEqual(self.workers[0].router.remote_clients, {"user2": 1})
+        self.workers[1]._disconnect_client(self.conn)
+        self.workers[0]._accept_cluster_events()
+        self.assertEqual(self.workers[0].router.remote_clients, {})
+
+    def test_room_membership_sync(self):
+        self.workers[0].storage.check_user_exists.return_value = True
+        self.workers[0]._join_room("#room", "user1")
+        self.workers[1]._accept_cluster_events()
+        self.assertEqual(self.workers[1].rooms.members("#room"), {"user1"})
+        self.workers[0]._leave_room("#room", "user1")
+        self.workers[1]._accept_cluster_events()
+        self.assertNotIn("#room", self.workers[1].rooms)
+
+    def test_contact_sync(self):
+        self.workers[0].storage.check_user_exists.return_value = True
+        self.assertTrue(self.workers[0]._add_contact("user1", "user2"))
+        self.assertTrue(self.workers[0]._add_contact("user1", "user2"))
+        self.workers[0].storage.apply_writes.assert_called_once()
+        self.workers[1]._accept_cluster_events()
+        self.assertTrue(self.workers[1].contacts.has("user1", "user2"))
+        self.assertEqual(self.workers[1].router.recv_events(), [])
+
+        self.workers[1].storage.check_user_exists.return_value = True
+        self.assertTrue(self.workers[1]._delete_contact("user1", "user2"))
+        self.workers[0]._accept_cluster_events()
+        self.assertFalse(self.workers[0].contacts.has("user1", "user2"))
+
+    def test_token_revocation_sync(self):
+        token = self.workers[0].tokens.issue("user1", "hash")
+        self.assertTrue(self.workers[1].tokens.verify(token, "user1", "hash"))
+        self.workers[0]._revoke_token(token)
+        self.workers[1]._accept_cluster_events()
+        self.assertFalse(self.workers[1].tokens.verify(token, "user1", "hash"))
+
+
+class TestRunCluster(TestCase):
+    def test_users_reset_once(self):
+        with mock.patch("server.cluster.ServerStorage") as storage_cls, mock.patch("server.cluster.Process"):
+            run_cluster("127.0.0.1", 7777, 3)
+            storage_cls.assert_called_once_with()
+            worker = JIMClusterWorker("127.0.0.1", 7777, 0, 1)
+            worker.close()
+            storage_cls.assert_called_with(reset_status=False)
@@ -0,0 +1,97 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from pathlib import Path
+from unittest import TestCase, mock, skipUnless
+
+from common.schema import Keys
+from server.config import ServerConf
+from server.transport import JIMServer
+
+try:
+    from client.transport import JIMClient
+except ImportError:
+    JIMClient = None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@skipUnless(JIMClient, "пакет клиента не установлен")
+class TestEndToEnd(TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        patcher = mock.patch.multiple(
+            ServerConf,
+            DB_CONFIG=dict(ServerConf.DB_CONFIG, URL=f"sqlite:///{tmp_dir.name}/server.sqlite"),
+            TOKEN_SECRET_PATH=Path(tmp_dir.name) / "token.key",
+            PRESENCE_DIR=Path(tmp_dir.name),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.port = free_port()
+        self.server = JIMServer("127.0.0.1", self.port)
+        for username in ("sender", "recipient"):
+            self.server.storage.add_user(username, "pswd")
+        thread = threading.Thread(target=self.server.start_server, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.stop)
+        return super().setUp()
+
+    def _make_client(self, username: str):
+        client = JIMClient("127.0.0.1", self.port, username, "pswd")
+        self.addCleanup(lambda: client.storage.db_path.exists() and os.remove(client.storage.db_path))
+        self.addCleanup(client.close)
+        return client
+
+    def test_offline_msg_delivered_on_login(self):
+        sender = self._make_client("sender")
+        is_connected, _ = sender.authenticate()
+        self.assertTrue(is_connected)
+        self.assertTrue(sender.send_msg("recipient", "привет"))
+        self.assertTrue(sender.send_msg("recipient", "как дела?"))
+
+        recipient = self._make_client("recipient")
+        is_connected, _ = recipient.authenticate()
+        self.assertTrue(is_connected)
+        # очередь приходит вслед за ответом на presence, а ответ на запрос контактов все равно находится
+        recipient.sync_contacts()
+        self.assertEqual(recipient.storage.get_contact_list(), ["sender"])
+        for _ in range(2):
+            recipient._process_server_msg(recipient._parse_msg(recipient._recv()))
+        messages = [(text, is_incoming) for text, is_incoming, _, _ in recipient.storage.get_chat_messages("sender")]
+        self.assertEqual(messages, [("привет", True), ("как дела?", True)])
+        self.assertEqual(self.server.storage.pop_pending_msgs("recipient"), [])
+
+    def test_legacy_client_gets_not_found(self):
+        sender = self._make_client("sender")
+        with mock.patch.object(JIMClient, "_offer_features", return_value={}):
+            sender.authenticate()
+        resp = sender._send_data(sender.msg_factory.make_msg(user_or_room="recipient", message="привет"), True)
+        self.assertEqual(resp[Keys.RESPONSE], HTTPStatus.NOT_FOUND)
+        self.assertEqual(self.server.storage.pop_pending_msgs("recipient"), [])
+
+    def test_reconnect_with_saved_token(self):
+        client = self._make_client("sender")
+        is_connected, _ = client.authenticate()
+        self.assertTrue(is_connected)
+        client.close()
+        deadline = time.monotonic() + 5
+        while self.server.sessions.get_by_user("sender") and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        client = self._make_client("sender")
+        with mock.patch.object(self.server.storage, "check_user_auth") as check_user_auth:
+            is_connected, resp = client.authenticate()
+        self.assertTrue(is_connected)
+        self.assertEqual(resp[Keys.RESPONSE], HTTPStatus.OK)
+        check_user_auth.assert_not_called()
@@ -1,11 +1,53 @@
+import asyncio
+import json
+import os
+import select
+import tempfile
+import time
 from collections import defaultdict
 from copy import deepcopy
+from datetime import datetime
 from http import HTTPStatus
-from unittest import TestCase, mock
+from pathlib import Path
+from selectors import EVENT_READ, EVENT_WRITE
+from unittest import TestCase, mock, skipUnless
 
-from common.errors import IncorrectDataRecivedError, NonDictInputError, ReqiuredFieldMissingError
-from common.schema import Actions, Keys
-from server.transport import JIMServer
+from common.buffers import BufferPool
+from common.codecs import CODECS, JSON_CODEC, JSONCodec, OrjsonCodec, choose_codec, get_codec, make_json_codec, orjson
+from common.errors import IncorrectDataRecivedError, InvalidFieldError, NonDictInputError, ReqiuredFieldMissingError
+from common.framing import COMPRESSED_FLAG, FRAME_HEADER, FrameDecoder, pack_frame
+from common.messages import MESSAGE_TYPES, ChatMsg, Contacts, DelContact, JIMMessage, Quit, Response, parse_msg
+from common.schema import Actions, Features, JIMValidationSchema, Keys
+from server.async_transport import JIMAsyncServer, StreamConnection
+from server.buffers import OutboundBuffer, OverflowPolicy
+from server.config import ServerConf
+from server.executor import BlockingExecutor
+from server.contacts import ContactGraph
+from server.presence import PresenceRegistry, read_snapshots, write_snapshot
+from server.rooms import RoomRegistry
+from server.storage import ServerStorage, WriteKinds
+from server.throttling import ExpiringSet, TokenBuckets
+from server.timers import TimerWheel
+from server.tokens import SessionTokens
+from server.write_behind import WriteBehindQueue
+from server.transport import RELAY_KEYS, RELAY_MAX_SIZE, JIMServer
+from server.user_cache import NO_USER, UserCache, UserRecord
+
+
+def emulate_recv_into(sock: mock.Mock):
+    """recv_into поверх мока recv: байты, не поместившиеся в буфер, отдаются следующими вызовами"""
+    pending = bytearray()
+
+    def recv_into(buffer, nbytes=0):
+        size = nbytes or len(buffer)
+        if not pending:
+            pending.extend(sock.recv(size))
+        size = min(size, len(pending))
+        buffer[:size] = pending[:size]
+        del pending[:size]
+        return size
+
+    sock.recv_into.side_effect = recv_into
 
 
 class BaseServerTestCase(TestCase):
@@ -13,9 +55,10 @@ class BaseServerTestCase(TestCase):
         def make_client(ret_msg: dict):
             client = mock.Mock()
             client.close.return_value = None
-            client.send.return_value = None
+            client.send.side_effect = lambda data: len(data)
             client.getpeername.return_value = "mock_peer_name"
             client.recv.return_value = self.server._dump_msg(ret_msg)
+            emulate_recv_into(client)
             return client
 
         self.mock_time = {Keys.TIME: 0}
@@ -28,6 +71,9 @@ class BaseServerTestCase(TestCase):
         self.server.sock.accept.return_value = (mock.Mock(), ("192.168.1.1", 33333))
         self.server.storage = mock.Mock()
         self.server.storage.change_user_status.return_value = None
+        self.server.storage.pop_pending_msgs.return_value = []
+        self.server.storage.get_user_password_hash.return_value = "hash"
+        self.server.contacts = ContactGraph()
         self.server._listen()
 
         self.mock_presense = {Keys.ACTION: Actions.PRESENCE, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.STATUS: ""}}
@@ -43,6 +89,8 @@ class BaseServerTestCase(TestCase):
             self.users[0]: self.client1,
             self.users[1]: self.client2,
         }
+        for user, conn in self.mock_active_clients.items():
+            self.server.sessions.login(self.server.sessions.open(conn), user)
         self.mock_messages_queue = defaultdict(
             list,
             {
@@ -63,33 +111,71 @@ class TestJIMBase(BaseServerTestCase):
     def setUp(self):
         return super().setUp()
 
-    def test_validate_msg_ok(self):
+    def test_parse_msg_ok(self):
         result = True
         try:
-            self.server._validate_msg(self.mock_presense)
+            self.server._parse_msg(self.mock_presense)
         except Exception:
             result = False
         finally:
             self.assertTrue(result)
 
-    def test_validate_msg_non_dict(self):
+    def test_parse_msg_non_dict(self):
         arg = [1, 2, 3]
-        self.assertRaises(NonDictInputError, self.server._validate_msg, arg)
+        self.assertRaises(NonDictInputError, self.server._parse_msg, arg)
 
-    def test_validate_msg_incorrect_data_error(self):
+    def test_parse_msg_incorrect_data_error(self):
         arg = deepcopy(self.mock_presense)
         arg.pop(Keys.ACTION)
-        self.assertRaises(IncorrectDataRecivedError, self.server._validate_msg, arg)
+        self.assertRaises(IncorrectDataRecivedError, self.server._parse_msg, arg)
 
-    def test_validate_msg_missing_key_error(self):
+    def test_parse_msg_missing_key_error(self):
         arg = deepcopy(self.mock_presense)
         arg.pop(Keys.TIME)
-        self.assertRaises(ReqiuredFieldMissingError, self.server._validate_msg, arg)
+        self.assertRaises(ReqiuredFieldMissingError, self.server._parse_msg, arg)
+
+    def test_parse_msg_missing_user_key_error(self):
+        arg = deepcopy(self.mock_presense)
+        arg[Keys.USER].pop(Keys.STATUS)
+        self.assertRaises(ReqiuredFieldMissingError, self.server._parse_msg, arg)
+
+    def test_parse_msg_wrong_type(self):
+        for key, value in ((Keys.TIME, "0"), (Keys.USER, "user")):
+            with self.subTest(key=key):
+                arg = deepcopy(self.mock_presense)
+                arg[key] = value
+                self.assertRaises(InvalidFieldError, self.server._parse_msg, arg)
+        arg = deepcopy(self.mock_presense)
+        arg[Keys.USER][Keys.ACCOUNT_NAME] = 1
+        self.assertRaises(InvalidFieldError, self.server._parse_msg, arg)
+
+    def test_parse_msg_size_limit(self):
+        msg = {Keys.ACTION: Actions.MSG, Keys.TIME: 0, Keys.FROM: "user1", Keys.TO: "user2", Keys.ENCODING: "utf-8"}
+        msg[Keys.MSG] = "x" * JIMValidationSchema.field_limits[Keys.MSG]
+        self.assertEqual(self.server._parse_msg(msg).to_dict(), msg)
+        msg[Keys.MSG] += "x"
+        self.assertRaises(InvalidFieldError, self.server._parse_msg, msg)
+
+    def test_parse_msg_unknown_action(self):
+        arg = deepcopy(self.mock_presense)
+        arg[Keys.ACTION] = "unknown"
+        self.assertRaises(IncorrectDataRecivedError, self.server._parse_msg, arg)
+
+    def test_parse_msg_optional_features(self):
+        auth = {Keys.ACTION: Actions.AUTH, Keys.TIME: 0, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pwd"}}
+        self.server._parse_msg(auth)
+        auth[Keys.FEATURES] = [Features.FRAMING]
+        self.assertRaises(InvalidFieldError, self.server._parse_msg, auth)
+
+    def test_parse_response(self):
+        self.server._parse_msg({Keys.RESPONSE: 200, Keys.TIME: 0, Keys.ALERT: ["user1"]})
+        self.assertRaises(ReqiuredFieldMissingError, self.server._parse_msg, {Keys.RESPONSE: 400, Keys.TIME: 0})
+        self.assertRaises(IncorrectDataRecivedError, self.server._parse_msg, {Keys.RESPONSE: "200"})
 
-    def test_from_timestamp(self):
-        iso_time_orig = "1970-01-01T03:00:00"
-        iso_time = self.server._from_timestamp_to_iso(0)
-        self.assertEqual(iso_time, iso_time_orig)
+    def test_load_msg_keeps_numeric_time(self):
+        msg = self.server._load_msg(self.server._dump_msg({"some_key": "some_value"}))
+        self.assertIsInstance(msg[Keys.TIME], float)
+        self.assertIsInstance(self.server._make_probe_msg().time, float)
 
     def test_dump_load_msg(self):
         orig_msg = {"some_key": "some_value"}
@@ -99,6 +185,600 @@ class TestJIMBase(BaseServerTestCase):
         self.assertEqual(orig_msg, result)
 
 
+class TestFrameDecoder(TestCase):
+    def setUp(self):
+        self.decoder = FrameDecoder(max_frame_length=1024)
+        self.payloads = [b'{"key": "value"}', b"", b"x" * 1000]
+        return super().setUp()
+
+    def test_feed_merged_frames(self):
+        data = b"".join(pack_frame(payload) for payload in self.payloads)
+        self.assertEqual(self.decoder.feed(data), self.payloads)
+        self.assertEqual(self.decoder.buffer, bytearray())
+
+    def test_feed_split_frames(self):
+        data = b"".join(pack_frame(payload) for payload in self.payloads)
+        result = []
+        for index in range(len(data)):
+            result.extend(self.decoder.feed(data[index : index + 1]))
+        self.assertEqual(result, self.payloads)
+
+    def test_feed_too_long_frame(self):
+        self.assertRaises(IncorrectDataRecivedError, self.decoder.feed, pack_frame(b"x" * 1025))
+
+    def test_feed_compressed_frames(self):
+        data = pack_frame(b"x" * 1000, compress_threshold=100) + pack_frame(b"short", compress_threshold=100)
+        (header,) = FRAME_HEADER.unpack_from(data)
+        self.assertTrue(header & COMPRESSED_FLAG)
+        self.assertLess(len(data), 100)
+        self.assertEqual(self.decoder.feed(data), [b"x" * 1000, b"short"])
+
+    def test_feed_compressed_frame_too_long_unpacked(self):
+        self.assertRaises(IncorrectDataRecivedError, self.decoder.feed, pack_frame(b"x" * 2048, compress_threshold=1))
+        broken = FRAME_HEADER.pack(3 | COMPRESSED_FLAG) + b"abc"
+        self.assertRaises(IncorrectDataRecivedError, FrameDecoder().feed, broken)
+
+    def test_recv_from_split_frames(self):
+        sock = mock.Mock()
+        data = b"".join(pack_frame(payload) for payload in self.payloads)
+        sock.recv.side_effect = [data[:3], data[3:30], data[30:]]
+        emulate_recv_into(sock)
+        result = []
+        for _ in range(3):
+            result.extend(bytes(payload) for payload in self.decoder.recv_from(sock))
+        self.assertEqual(result, self.payloads)
+
+    def test_recv_from_closed_connection(self):
+        sock = mock.Mock()
+        sock.recv.return_value = b""
+        emulate_recv_into(sock)
+        self.assertRaises(ConnectionResetError, self.decoder.recv_from, sock)
+
+    def test_recv_from_grows_buffer_for_long_frame(self):
+        pool = BufferPool(size_classes=(16, 64), max_free=2)
+        decoder = FrameDecoder(pool=pool)
+        sock = mock.Mock()
+        sock.recv.return_value = pack_frame(b"x" * 5000)
+        emulate_recv_into(sock)
+        payloads = []
+        while not payloads:
+            payloads = [bytes(payload) for payload in decoder.recv_from(sock)]
+        decoder.reclaim()
+        self.assertEqual(payloads, [b"x" * 5000])
+        self.assertGreater(pool.discarded, 0)
+
+    def test_steady_state_reads_do_not_allocate(self):
+        pool = BufferPool()
+        decoder = FrameDecoder(pool=pool)
+        sock = mock.Mock()
+        sock.recv.return_value = pack_frame(b'{"key": "value"}') * 3
+        emulate_recv_into(sock)
+        for _ in range(100):
+            self.assertEqual(len(decoder.recv_from(sock)), 3)
+            decoder.reclaim()
+        self.assertEqual(pool.allocated, 1)
+        self.assertEqual(pool.reused, 99)
+        decoder.close()
+        self.assertEqual(pool.stats()["free"], 1)
+
+
+class TestBufferPool(TestCase):
+    def setUp(self):
+        self.pool = BufferPool(size_classes=(16, 64), max_free=1)
+        return super().setUp()
+
+    def test_size_classes(self):
+        self.assertEqual(len(self.pool.acquire(1)), 16)
+        self.assertEqual(len(self.pool.acquire(17)), 64)
+        self.assertEqual(len(self.pool.acquire(100)), 100)
+
+    def test_release_and_reuse(self):
+        buffer = self.pool.acquire(10)
+        self.pool.release(buffer)
+        self.assertIs(self.pool.acquire(16), buffer)
+        self.assertEqual((self.pool.allocated, self.pool.reused), (1, 1))
+
+    def test_release_discards_extra_buffers(self):
+        buffers = [self.pool.acquire(10), self.pool.acquire(10), self.pool.acquire(100)]
+        for buffer in buffers:
+            self.pool.release(buffer)
+        self.assertEqual(self.pool.stats(), {"allocated": 3, "reused": 0, "released": 1, "discarded": 2, "free": 1})
+
+
+class TestCodecs(TestCase):
+    def setUp(self):
+        self.msg = {
+            Keys.ACTION: Actions.MSG,
+            Keys.TIME: 1.5,
+            Keys.TO: "user",
+            Keys.MSG: "сообщение",
+            Keys.ENCODING: "utf-8",
+        }
+        return super().setUp()
+
+    def test_roundtrip(self):
+        for codec in CODECS.values():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.decode(codec.encode(self.msg)), self.msg)
+                self.assertRaises(IncorrectDataRecivedError, codec.decode, b"\xc1\xff")
+
+    def test_json_backend_selection(self):
+        self.assertIs(type(make_json_codec("json")), JSONCodec)
+        self.assertIs(type(make_json_codec("orjson", encoding="cp1251")), JSONCodec)
+        expected = OrjsonCodec if orjson is not None else JSONCodec
+        self.assertIs(type(make_json_codec("auto")), expected)
+        self.assertEqual(JSON_CODEC.name, "json")
+
+    @skipUnless(orjson is not None, "orjson не установлен")
+    def test_json_backends_byte_for_byte(self):
+        stdlib, fast = JSONCodec(), OrjsonCodec()
+        samples = [
+            self.msg,
+            {Keys.RESPONSE: 202, Keys.TIME: 1700000000.123456, Keys.ALERT: ["контакт", 'user\n"quoted"', "😀"]},
+            {Keys.ACTION: Actions.PRESENCE, Keys.TIME: 0, Keys.USER: {Keys.ACCOUNT_NAME: "u", Keys.STATUS: "\t/\\"}},
+            ChatMsg(from_="user", to="#room", encoding="utf-8", message="текст", time=1.5),
+            Response(HTTPStatus.OK.value, alert="OK", time=2.0, features={Features.FRAMING: True}),
+        ]
+        for msg in samples:
+            with self.subTest(msg=msg):
+                data = stdlib.encode(msg)
+                self.assertEqual(fast.encode(msg), data)
+                self.assertEqual(fast.decode(data), stdlib.decode(data))
+        self.assertRaises(IncorrectDataRecivedError, fast.decode, b"\xc1\xff")
+
+    def test_stamp_without_reencoding(self):
+        payload = JSON_CODEC.encode(self.msg)
+        stamped = JSON_CODEC.stamp(memoryview(payload), 5.25)
+        self.assertIn(JSON_CODEC.encode(5.25), stamped)
+        self.assertEqual(JSON_CODEC.decode(stamped), dict(self.msg, **{Keys.TIME: 5.25}))
+        self.assertIsNone(JSON_CODEC.stamp(JSON_CODEC.encode([1]), 5.25))
+        if "msgpack" in CODECS:
+            msgpack_codec = CODECS["msgpack"]
+            self.assertIsNone(msgpack_codec.stamp(msgpack_codec.encode(self.msg), 5.25))
+
+    def test_json_stamp_replaces_time_key_only(self):
+        samples = {
+            b"{}": {},
+            b"{ }": {},
+            b'{"time":1}': {},
+            b'{"time" : 1.5 , "to":"time"}': {Keys.TO: Keys.TIME},
+            b'{"to":"time", "time": 1}': {Keys.TO: Keys.TIME},
+            b'{"message":"\\"time\\":1","time":1}': {Keys.MSG: '"time":1'},
+        }
+        for payload, msg in samples.items():
+            with self.subTest(payload=payload):
+                stamped = JSON_CODEC.stamp(payload, 5.25)
+                self.assertEqual(JSON_CODEC.decode(stamped), dict(msg, **{Keys.TIME: 5.25}))
+                self.assertEqual(stamped.count(b'"time":'), 1)
+
+    def test_choose_codec(self):
+        self.assertEqual(choose_codec(["unknown", "json"]), "json")
+        self.assertIsNone(choose_codec(["unknown"]))
+        self.assertIsNone(choose_codec("json"))
+        self.assertIs(get_codec(None), JSON_CODEC)
+
+
+class TestMessages(TestCase):
+    def setUp(self):
+        self.samples = [
+            {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pwd"}},
+            {Keys.ACTION: Actions.PRESENCE, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.STATUS: "на связи"}},
+            {Keys.ACTION: Actions.PROBE},
+            {Keys.ACTION: Actions.QUIT},
+            {Keys.ACTION: Actions.MSG, Keys.FROM: "user", Keys.TO: "#room", Keys.MSG: "текст", Keys.ENCODING: "utf-8"},
+            {Keys.ACTION: Actions.JOIN, Keys.ROOM: "#room"},
+            {Keys.ACTION: Actions.LEAVE, Keys.ROOM: "#room"},
+            {Keys.ACTION: Actions.CONTACTS, Keys.ACCOUNT_NAME: "user"},
+            {Keys.ACTION: Actions.ADD_CONTACT, Keys.ACCOUNT_NAME: "user", Keys.CONTACT: "contact"},
+            {Keys.ACTION: Actions.DEL_CONTACT, Keys.ACCOUNT_NAME: "user", Keys.CONTACT: "contact"},
+            {Keys.RESPONSE: HTTPStatus.ACCEPTED.value, Keys.ALERT: ["contact"]},
+            {Keys.RESPONSE: HTTPStatus.OK.value, Keys.ALERT: "OK", Keys.FEATURES: {Features.FRAMING: True}},
+        ]
+        for msg in self.samples:
+            msg[Keys.TIME] = 1.5
+        return super().setUp()
+
+    def test_parse_roundtrip(self):
+        for msg in self.samples:
+            with self.subTest(msg=msg):
+                message = parse_msg(deepcopy(msg))
+                self.assertIs(type(message), MESSAGE_TYPES.get(msg.get(Keys.ACTION), Response))
+                self.assertFalse(hasattr(message, "__dict__"))
+                self.assertEqual(message.to_dict(), msg)
+
+    def test_codecs_encode_typed_messages(self):
+        message = ChatMsg(from_="user", to="contact", encoding="utf-8", message="текст", time=1.5)
+        for codec in CODECS.values():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(codec.encode(message), codec.encode(message.to_dict()))
+                self.assertRaises(TypeError, codec.encode, {Keys.MSG: object()})
+
+    def test_parse_rejects_invalid(self):
+        msg = deepcopy(self.samples[4])
+        msg[Keys.TO] = None
+        self.assertRaises(ReqiuredFieldMissingError, parse_msg, msg)
+
+
+class TestOutboundBuffer(TestCase):
+    def setUp(self):
+        self.buffer = OutboundBuffer(high_watermark=10, low_watermark=4)
+        self.sock = mock.Mock()
+        return super().setUp()
+
+    def test_partial_flush(self):
+        self.buffer.append(b"abcdef")
+        self.buffer.append(b"gh")
+        self.sock.sendmsg.side_effect = [4, BlockingIOError]
+        self.assertEqual(self.buffer.flush(self.sock), 4)
+        self.assertEqual(len(self.buffer), 4)
+        self.sock.sendmsg.side_effect = [3]
+        self.sock.send.side_effect = lambda data: len(data)
+        self.assertEqual(self.buffer.flush(self.sock), 3)
+        self.assertEqual(self.buffer.flush(self.sock), 1)
+        self.assertEqual([bytes(chunk) for chunk in self.sock.sendmsg.call_args.args[0]], [b"ef", b"gh"])
+        self.assertEqual(bytes(self.sock.send.call_args.args[0]), b"h")
+        self.assertFalse(self.buffer)
+
+    def test_flush_frames_with_one_sendmsg(self):
+        frames = [b"a" * 3, b"b" * 4, b"c" * 5]
+        for frame in frames:
+            self.buffer.append(frame)
+        self.sock.sendmsg.side_effect = lambda chunks: sum(map(len, chunks))
+        self.assertEqual(self.buffer.flush(self.sock), 12)
+        self.sock.sendmsg.assert_called_once_with(frames)
+        self.sock.send.assert_not_called()
+        self.assertFalse(self.buffer)
+
+    def test_watermarks_hysteresis(self):
+        self.buffer.append(b"x" * 12)
+        self.assertTrue(self.buffer.is_overloaded)
+        self.sock.send.side_effect = [6, BlockingIOError]
+        self.buffer.flush(self.sock)
+        self.assertTrue(self.buffer.is_overloaded)
+        self.sock.send.side_effect = [2, BlockingIOError]
+        self.buffer.flush(self.sock)
+        self.assertFalse(self.buffer.is_overloaded)
+
+
+class TestBlockingExecutor(TestCase):
+    def setUp(self):
+        self.executor = BlockingExecutor(workers=2, max_pending=2)
+        self.results = []
+        return super().setUp()
+
+    def tearDown(self):
+        self.executor.shutdown()
+        return super().tearDown()
+
+    def wait_wakeup(self):
+        readable, _, _ = select.select([self.executor.wakeup_sock], [], [], 5)
+        self.assertTrue(readable)
+
+    def test_callbacks_run_in_loop(self):
+        self.assertTrue(self.executor.submit(self.results.append, sum, (1, 2)))
+        self.wait_wakeup()
+        while self.executor.pending:
+            self.executor.run_callbacks()
+        (future,) = self.results
+        self.assertEqual(future.result(), 3)
+
+    def test_max_pending(self):
+        for _ in range(2):
+            self.assertTrue(self.executor.submit(None, sum, (1, 2)))
+        self.assertFalse(self.executor.submit(None, sum, (1, 2)))
+        self.assertEqual((self.executor.submitted, self.executor.rejected), (2, 1))
+        while self.executor.pending:
+            self.wait_wakeup()
+            self.executor.run_callbacks()
+        self.assertTrue(self.executor.submit(None, sum, (1, 2)))
+
+
+class TestWriteBehindQueue(TestCase):
+    def setUp(self):
+        self.batches = []
+        self.on_exit = mock.Mock()
+        return super().setUp()
+
+    def make_queue(self, max_batch: int, max_delay: float) -> WriteBehindQueue:
+        queue = WriteBehindQueue(self.batches.append, max_batch, max_delay, on_exit=self.on_exit)
+        self.addCleanup(queue.close)
+        return queue
+
+    def test_batch_by_size_and_flush_on_close(self):
+        queue = self.make_queue(max_batch=2, max_delay=60)
+        for record in range(5):
+            self.assertTrue(queue.put(record))
+        queue.close()
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual((queue.batches, queue.records), (3, 5))
+        self.on_exit.assert_called_once()
+        self.assertFalse(queue.put(5))
+
+    def test_batch_by_delay(self):
+        queue = self.make_queue(max_batch=100, max_delay=0.01)
+        queue.put(0)
+        for _ in range(500):
+            if self.batches:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.batches, [[0]])
+
+    def test_failed_batch(self):
+        queue = WriteBehindQueue(mock.Mock(side_effect=RuntimeError), max_batch=10, max_delay=60)
+        queue.put(0)
+        queue.close()
+        self.assertEqual((queue.failed, queue.batches), (1, 0))
+
+
+class TestContactGraph(TestCase):
+    def test_add_remove(self):
+        graph = ContactGraph({"user": {"contact"}})
+        self.assertTrue(graph.has("user", "contact"))
+        self.assertFalse(graph.add("user", "contact"))
+        self.assertTrue(graph.add("user", "other"))
+        self.assertEqual(graph.contacts("user"), {"contact", "other"})
+        self.assertFalse(graph.remove("ghost", "contact"))
+        self.assertTrue(graph.remove("user", "contact"))
+        self.assertTrue(graph.remove("user", "other"))
+        self.assertEqual((len(graph), graph.contacts("user")), (0, set()))
+
+
+class TestPresenceRegistry(TestCase):
+    def test_online_status_offline(self):
+        presence = PresenceRegistry()
+        old_conn, new_conn = mock.Mock(), mock.Mock()
+        presence.set_online("user", old_conn, now=1)
+        presence.set_status("user", "busy", now=2)
+        presence.set_status("ghost", "busy", now=2)
+        self.assertEqual(presence.snapshot(), {"user": {"status": "busy", "last_seen": 2}})
+        self.assertEqual(presence.pop_changes(), {"user": (True, "busy")})
+        self.assertEqual(presence.pop_changes(), {})
+
+        # повторный вход с нового соединения: отключение старого не снимает пользователя из сети
+        presence.set_online("user", new_conn, now=3)
+        presence.set_offline("user", old_conn)
+        self.assertEqual(presence.active_users(), ["user"])
+        presence.set_offline("user", new_conn)
+        self.assertEqual(len(presence), 0)
+        self.assertEqual(presence.pop_changes(), {"user": (False, "")})
+
+    def test_stale_snapshots_ignored(self):
+        with tempfile.TemporaryDirectory() as presence_dir:
+            presence_dir = Path(presence_dir)
+            for name in ("worker0", "worker1"):
+                write_snapshot(presence_dir / f"{name}.json", {name: {"status": "", "last_seen": 1}})
+            self.assertEqual(list(read_snapshots(presence_dir)), ["worker0", "worker1"])
+            self.assertEqual(sorted(path.name for path in presence_dir.iterdir()), ["worker0.json", "worker1.json"])
+            # снимок, не обновлявшийся дольше max_age, и снимок завершенного процесса пропускаются
+            os.utime(presence_dir / "worker0.json", (0, 0))
+            self.assertEqual(list(read_snapshots(presence_dir, max_age=60)), ["worker1"])
+            with mock.patch("server.presence.os.kill", side_effect=ProcessLookupError):
+                self.assertEqual(read_snapshots(presence_dir), {})
+
+
+class TestSessionTokens(TestCase):
+    def setUp(self):
+        self.tokens = SessionTokens(secret=b"secret", ttl=60)
+        self.token = self.tokens.issue("user", "hash", now=1000)
+        return super().setUp()
+
+    def test_verify(self):
+        self.assertTrue(self.tokens.verify(self.token, "user", "hash", now=1001))
+        self.assertFalse(self.tokens.verify(self.token, "other", "hash", now=1001))
+        self.assertFalse(self.tokens.verify(self.token, "user", "hash", now=1060))
+        self.assertFalse(SessionTokens(secret=b"other", ttl=60).verify(self.token, "user", "hash", now=1001))
+        # после смены пароля выданные токены недействительны
+        self.assertFalse(self.tokens.verify(self.token, "user", "new_hash", now=1001))
+
+    def test_verify_tampered(self):
+        body, _, signature = self.token.rpartition(".")
+        user, issued, expires, token_id = body.split(".")
+        forged = f"{user}.{issued}.{int(expires) + 10**6}.{token_id}.{signature}"
+        for token in (forged, self.token[:-1], "", "garbage", "a.b.c.d.e", "a.b.c.d.ü", f"{body}.ü"):
+            with self.subTest(token=token):
+                self.assertFalse(self.tokens.verify(token, "user", "hash", now=1001))
+
+    def test_revoke(self):
+        other = self.tokens.issue("user", "hash", now=1000)
+        self.tokens.revoke(self.token, now=1001)
+        self.assertFalse(self.tokens.verify(self.token, "user", "hash", now=1001))
+        self.assertTrue(self.tokens.verify(other, "user", "hash", now=1001))
+        self.tokens.purge(now=1061)
+        self.assertEqual(self.tokens.revoked, {})
+
+    def test_revoke_persisted(self):
+        with tempfile.TemporaryDirectory() as revoked_dir:
+            tokens = SessionTokens(secret=b"secret", ttl=60, revoked_dir=Path(revoked_dir))
+            token = tokens.issue("user", "hash")
+            tokens.revoke(token)
+            tokens.revoke(tokens.issue("user", "hash", now=1000), persist=False)
+            # перезапущенный сервер с тем же ключом подписи не принимает отозванный токен
+            restarted = SessionTokens(secret=b"secret", ttl=60, revoked_dir=Path(revoked_dir))
+            self.assertFalse(restarted.verify(token, "user", "hash"))
+            self.assertEqual(len(restarted.revoked), 1)
+            restarted.purge(now=time.time() + 120)
+            self.assertEqual(list(Path(revoked_dir).iterdir()), [])
+
+
+class TestTokenBuckets(TestCase):
+    def setUp(self):
+        self.buckets = TokenBuckets(capacity=2, rate=0.5, max_keys=3)
+        return super().setUp()
+
+    def test_acquire_and_refill(self):
+        self.assertTrue(self.buckets.acquire("ip", now=0))
+        self.assertTrue(self.buckets.acquire("ip", now=0))
+        self.assertFalse(self.buckets.acquire("ip", now=1))
+        self.assertTrue(self.buckets.acquire("other", now=1))
+        self.assertTrue(self.buckets.acquire("ip", now=2))
+        self.assertEqual(self.buckets.rejected, 1)
+
+    def test_refund(self):
+        self.buckets.acquire("ip", now=0)
+        self.buckets.acquire("ip", now=0)
+        self.buckets.refund("ip", now=0)
+        self.assertTrue(self.buckets.acquire("ip", now=0))
+        self.assertFalse(self.buckets.acquire("ip", now=0))
+
+    def test_evict_refilled_and_oldest(self):
+        for index in range(5):
+            self.buckets.acquire(f"ip{index}", now=0)
+        self.assertEqual(list(self.buckets.buckets), ["ip2", "ip3", "ip4"])
+        self.buckets.acquire("ip3", now=3)
+        self.buckets.acquire("ip5", now=4)
+        self.assertEqual(list(self.buckets.buckets), ["ip3", "ip5"])
+
+
+class TestExpiringSet(TestCase):
+    def test_expire(self):
+        keys = ExpiringSet(ttl=10, max_size=2)
+        keys.add("a", now=0)
+        keys.add("b", now=5)
+        self.assertTrue(keys.contains("a", now=9))
+        self.assertFalse(keys.contains("a", now=10))
+        self.assertTrue(keys.contains("b", now=10))
+        keys.add("c", now=16)
+        self.assertEqual(list(keys.expires), ["c"])
+        self.assertEqual(keys.hits, 2)
+
+    def test_max_size(self):
+        keys = ExpiringSet(ttl=10, max_size=2)
+        for key in "abc":
+            keys.add(key, now=0)
+        self.assertFalse(keys.contains("a", now=0))
+        keys.discard("b")
+        self.assertEqual(list(keys.expires), ["c"])
+
+
+class TestUserCache(TestCase):
+    def test_lru_and_ttl(self):
+        users = UserCache(max_size=2, ttl=10, miss_ttl=1)
+        users.put("a", UserRecord(1, "hash", None), now=0)
+        users.put("b", UserRecord(2, "hash", None), now=5)
+        self.assertEqual(users.get("a", now=1).id, 1)
+        users.put("c", UserRecord(3, "hash", None), now=5)
+        self.assertIsNone(users.get("b", now=5))
+        self.assertIsNone(users.get("a", now=10))
+        users.set_status("c", "busy")
+        self.assertEqual(users.get("c", now=14).status, "busy")
+        self.assertIsNone(users.get("c", now=15))
+        self.assertEqual((users.hits, users.misses), (2, 3))
+        self.assertAlmostEqual(users.hit_rate, 0.4)
+
+    def test_cached_miss(self):
+        users = UserCache(max_size=2, ttl=10, miss_ttl=1)
+        users.put("a", NO_USER, now=0)
+        users.set_status("a", "busy")
+        self.assertIs(users.get("a", now=0.5), NO_USER)
+        self.assertIsNone(users.get("a", now=1))
+
+
+class TestServerStorage(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(ServerConf.DB_CONFIG, {"URL": "sqlite://"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = ServerStorage()
+        self.addCleanup(self.storage.session.remove)
+        return super().setUp()
+
+    def test_check_user_auth(self):
+        self.storage.add_user("user", "pswd")
+        self.assertTrue(self.storage.check_user_auth("user", "pswd"))
+        self.assertFalse(self.storage.check_user_auth("user", "wrong"))
+        with mock.patch.object(ServerStorage, "make_passwd_hash") as make_passwd_hash:
+            self.assertIsNone(self.storage.check_user_auth("unknown", "pswd"))
+            make_passwd_hash.assert_not_called()
+
+    def test_user_cache(self):
+        self.storage.add_user("user", "pswd")
+        self.assertTrue(self.storage.check_user_exists("user"))
+        with mock.patch.object(self.storage, "session", wraps=self.storage.session) as session:
+            self.assertTrue(self.storage.check_user_exists("user"))
+            self.assertTrue(self.storage.get_user_password_hash("user"))
+            session.query.assert_not_called()
+        self.storage.change_user_status("user", True, "busy")
+        self.assertEqual(self.storage.users.get("user").status, "busy")
+        self.storage.remove_user("user")
+        self.assertFalse(self.storage.check_user_exists("user"))
+        with mock.patch.object(self.storage, "session", wraps=self.storage.session) as session:
+            self.assertFalse(self.storage.check_user_exists("user"))
+            self.assertIsNone(self.storage.check_user_auth("user", "pswd"))
+            session.query.assert_not_called()
+        self.storage.add_user("user", "pswd")
+        self.assertTrue(self.storage.check_user_exists("user"))
+
+    def test_get_contact_graph(self):
+        for username in ("user", "contact1", "contact2"):
+            self.storage.add_user(username, "pswd")
+        self.storage.add_contact("user", "contact1")
+        self.storage.add_contact("user", "contact2")
+        self.storage.add_contact("contact1", "user")
+        self.storage.delete_contact("user", "contact2")
+        self.assertEqual(self.storage.get_contact_graph(), {"user": {"contact1"}, "contact1": {"user"}})
+
+    def test_apply_writes(self):
+        self.storage.add_user("user", "pswd")
+        login_time = datetime(2024, 1, 1, 12, 0)
+        self.storage.apply_writes(
+            [
+                (WriteKinds.LOGIN, "user", "127.0.0.1", login_time),
+                (WriteKinds.STATUS, "user", True, "busy"),
+                (WriteKinds.STATUS, "user", False, ""),
+                (WriteKinds.STATUS, "unknown", True, ""),
+            ]
+        )
+        self.assertEqual(self.storage.get_users_history(), [("user", "127.0.0.1", login_time)])
+        self.assertEqual(self.storage.get_active_users(), [])
+        self.storage.apply_writes([(WriteKinds.STATUS, "user", True, "")])
+        self.assertEqual(self.storage.get_active_users(), ["user"])
+
+    def test_apply_room_and_contact_writes(self):
+        for username in ("user", "contact"):
+            self.storage.add_user(username, "pswd")
+        self.storage.apply_writes(
+            [
+                (WriteKinds.CONTACT_ADD, "user", "contact"),
+                (WriteKinds.CONTACT_DEL, "user", "contact"),
+                (WriteKinds.CONTACT_ADD, "user", "contact"),
+                (WriteKinds.CONTACT_ADD, "user", "unknown"),
+                (WriteKinds.ROOM_JOIN, "user", "#room"),
+                (WriteKinds.ROOM_JOIN, "contact", "#room"),
+                (WriteKinds.ROOM_LEAVE, "contact", "#room"),
+                (WriteKinds.ROOM_JOIN, "unknown", "#room"),
+            ]
+        )
+        self.assertEqual(self.storage.get_contact_graph(), {"user": {"contact"}})
+        self.assertEqual(self.storage.get_rooms(), {"#room": {"user"}})
+
+
+class TestTimerWheel(TestCase):
+    def setUp(self):
+        self.wheel = TimerWheel(tick=1.0, slots=8)
+        return super().setUp()
+
+    def test_expire_in_order(self):
+        self.wheel.schedule("a", 2, now=0)
+        self.wheel.schedule("b", 5, now=0)
+        self.assertEqual(self.wheel.advance(1), [])
+        self.assertEqual(self.wheel.advance(3), ["a"])
+        self.assertEqual(self.wheel.advance(6), ["b"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_delay_longer_than_wheel(self):
+        self.wheel.schedule("a", 20, now=0)
+        self.assertEqual(self.wheel.advance(12), [])
+        self.assertEqual(self.wheel.advance(100), ["a"])
+
+    def test_cancel_and_reschedule(self):
+        self.wheel.schedule("a", 2, now=0)
+        self.wheel.schedule("b", 2, now=0)
+        self.wheel.cancel("b")
+        self.wheel.schedule("a", 4, now=0)
+        self.assertEqual(self.wheel.advance(3), [])
+        self.assertEqual(self.wheel.advance(4), ["a"])
+
+
 class TestJIMServer(BaseServerTestCase):
     def setUp(self):
         return super().setUp()
@@ -106,26 +786,172 @@ class TestJIMServer(BaseServerTestCase):
     def test_disconnect_client(self):
         user = self.users[0]
         conn = self.mock_active_clients[user]
-        active_clients_result = self.mock_active_clients.copy()
-        active_clients_result.pop(user)
-        connections_result = self.connections.copy()
-        connections_result.remove(conn)
-        self.server.active_clients = self.mock_active_clients.copy()
-        self.server.connections = self.connections.copy()
-        self.server._disconnect_client(user=user, conn=conn)
-        self.assertEqual(self.server.active_clients, active_clients_result)
-        self.assertEqual(self.server.connections, connections_result)
-
-    def test_cleanup_disconnected_users(self):
-        disconnected_user = self.users[-1]
-        active_clients = deepcopy(self.mock_active_clients)
-        self.server.active_clients = active_clients.copy()
-        active_clients.pop(disconnected_user)
-        with mock.patch.object(
-            self.server.active_clients[disconnected_user], "getpeername", mock.MagicMock(side_effect=OSError)
+        self.server.presence.set_online(user, conn)
+        self.server._disconnect_client(conn=conn)
+        self.assertEqual(set(self.server.sessions.usernames()), {self.users[1]})
+        self.assertNotIn(conn, self.server.sessions)
+        self.assertEqual(len(self.server.sessions), 1)
+        self.assertNotIn(user, self.server.presence)
+        self.assertEqual(self.server.presence.pop_changes(), {user: (False, "")})
+
+    def test_idle_session_probe_and_disconnect(self):
+        conn = mock.Mock()
+        conn.send.side_effect = lambda data: len(data)
+        session = self.server._open_session(conn)
+        started = session.last_seen
+        self.server._check_idle_sessions(started + ServerConf.IDLE_TIMEOUT / 2)
+        conn.send.assert_not_called()
+
+        self.server._check_idle_sessions(started + ServerConf.IDLE_TIMEOUT + ServerConf.TIMER_TICK)
+        probe = self.server._load_msg(conn.send.call_args.args[0])
+        self.assertEqual(probe[Keys.ACTION], Actions.PROBE)
+        self.assertIn(conn, self.server.sessions)
+
+        deadline = started + ServerConf.IDLE_TIMEOUT + ServerConf.PROBE_TIMEOUT + 2 * ServerConf.TIMER_TICK
+        self.server._check_idle_sessions(deadline)
+        conn.close.assert_called()
+        self.assertNotIn(conn, self.server.sessions)
+        self.assertNotIn(session, self.server.timers)
+
+    def test_idle_session_answered_probe(self):
+        conn = mock.Mock()
+        conn.send.side_effect = lambda data: len(data)
+        session = self.server._open_session(conn)
+        probe_time = session.last_seen + ServerConf.IDLE_TIMEOUT + ServerConf.TIMER_TICK
+        self.server._check_idle_sessions(probe_time)
+        session.last_seen = probe_time + 1
+        self.server._check_idle_sessions(probe_time + ServerConf.PROBE_TIMEOUT + ServerConf.TIMER_TICK)
+        self.assertIn(conn, self.server.sessions)
+        self.assertFalse(session.is_probed)
+        self.assertIn(session, self.server.timers)
+
+    def test_session_registry_relogin(self):
+        conn = self.mock_active_clients[self.users[0]]
+        stale = self.server.sessions.get(conn)
+        new_conn = mock.Mock()
+        self.server.sessions.close(conn)
+        self.server.sessions.login(self.server.sessions.open(new_conn), self.users[0])
+        self.server.sessions.close(conn)
+        self.assertIsNone(self.server.sessions.get(conn))
+        self.assertIsNot(self.server.sessions.get_by_user(self.users[0]), stale)
+        self.assertIs(self.server.sessions.get_by_user(self.users[0]).conn, new_conn)
+
+    def test_persist_presence(self):
+        self.server.presence.set_online("user1", self.client1, now=100)
+        self.server.presence.set_status("user1", "busy", now=101)
+        self.server.presence.set_online("user2", self.client2, now=102)
+        with tempfile.TemporaryDirectory() as presence_dir, mock.patch.object(
+            ServerConf, "PRESENCE_DIR", Path(presence_dir)
+        ):
+            self.server._persist_presence(now=1000)
+            calls = [call.args[0] for call in self.server.storage.apply_writes.call_args_list]
+            self.assertEqual(
+                calls, [[(WriteKinds.STATUS, "user1", True, "busy")], [(WriteKinds.STATUS, "user2", True, "")]]
+            )
+            expected = {"user1": {"status": "busy", "last_seen": 101}, "user2": {"status": "", "last_seen": 102}}
+            self.assertEqual(read_snapshots(Path(presence_dir)), expected)
+
+            # до истечения интервала изменения копятся, а при закрытии сервера сохраняются, и снимок удаляется
+            self.server._disconnect_client(self.client2)
+            self.server._persist_presence(now=1000.5)
+            self.assertEqual(self.server.storage.apply_writes.call_count, 2)
+            self.server.close()
+            self.server.storage.apply_writes.assert_called_with([(WriteKinds.STATUS, "user2", False, "")])
+            self.assertEqual(read_snapshots(Path(presence_dir)), {})
+
+    def test_stale_snapshot_removed_on_start(self):
+        with tempfile.TemporaryDirectory() as presence_dir, mock.patch.object(
+            ServerConf, "PRESENCE_DIR", Path(presence_dir)
         ):
-            self.server._cleanup_disconnected_users()
-        self.assertEqual(self.server.active_clients, active_clients)
+            # снимок сервера, остановленного без закрытия, не доживает до нового запуска
+            write_snapshot(self.server._snapshot_path(), {"user1": {"status": "", "last_seen": 1}})
+            self.server._listen()
+            self.assertEqual(read_snapshots(Path(presence_dir)), {})
+            # снимок сервера на другом порту при этом не удаляется
+            other = JIMServer("127.0.0.1", self.server.port + 1)
+            self.addCleanup(other.close)
+            self.assertNotEqual(other._snapshot_path(), self.server._snapshot_path())
+            write_snapshot(other._snapshot_path(), {"user2": {"status": "", "last_seen": 1}})
+            self.server._remove_stale_snapshot()
+            self.assertEqual(list(read_snapshots(Path(presence_dir))), ["user2"])
+            other._snapshot_path().unlink()
+            # без изменений снимок все равно обновляется раз в половину PRESENCE_SNAPSHOT_MAX_AGE
+            self.server._persist_presence(now=1000)
+            self.assertEqual(read_snapshots(Path(presence_dir)), {})
+            self.assertTrue(self.server._snapshot_path().exists())
+
+    def test_login_required(self):
+        anonymous = mock.Mock()
+        self.server.sessions.open(anonymous)
+        code, _, disconnect = self.server._route_msg(Quit(), anonymous)
+        self.assertEqual((code, disconnect), (HTTPStatus.FORBIDDEN, True))
+        code, _, disconnect = self.server._route_msg(Quit(), self.client1)
+        self.assertEqual((code, disconnect), (HTTPStatus.OK, True))
+
+    def test_route_dispatches_on_type(self):
+        self.server.contacts = ContactGraph({self.users[0]: {"contact2", "contact1"}})
+        code, contacts, _ = self.server._route_msg(Contacts(account_name=self.users[0]), self.client1)
+        self.assertEqual((code, contacts), (HTTPStatus.ACCEPTED, ["contact1", "contact2"]))
+        self.server.storage.get_user_contacts.assert_not_called()
+        code, _, _ = self.server._route_msg(Response(HTTPStatus.OK.value, alert="OK"), self.client1)
+        self.assertEqual(code, HTTPStatus.BAD_REQUEST)
+
+    def test_relay_forwards_original_payload(self):
+        for session in self.server.sessions:
+            session.frame_decoder = FrameDecoder()
+        msg = {Keys.ACTION: Actions.MSG, Keys.FROM: self.users[0], Keys.TO: self.users[1], Keys.MSG: "текст"}
+        msg[Keys.ENCODING] = "utf-8"
+        msg[Keys.TIME] = 1.0
+        payload = json.dumps(msg, ensure_ascii=False).encode()
+        with mock.patch.object(JSON_CODEC, "encode", wraps=JSON_CODEC.encode) as encode:
+            self.server._process_msg(json.loads(payload), self.client1, payload)
+        self.assertEqual(encode.call_count, 1)  # только ответ отправителю
+        (relayed,) = FrameDecoder().feed(self.client2.send.call_args.args[0])
+        self.assertTrue(relayed.startswith(payload[: payload.index(b', "time"')]))
+        self.assertEqual(relayed.count(b'"time"'), 1)
+        delivered = JSON_CODEC.decode(relayed)
+        self.assertEqual(delivered[Keys.MSG], "текст")
+        self.assertGreater(delivered[Keys.TIME], 1.0)
+
+    def test_relay_reencodes_unexpected_payload(self):
+        for session in self.server.sessions:
+            session.frame_decoder = FrameDecoder()
+        msg = {Keys.ACTION: Actions.MSG, Keys.FROM: self.users[0], Keys.TO: self.users[1], Keys.MSG: "текст"}
+        msg.update({Keys.ENCODING: "utf-8", Keys.TIME: 1.0})
+        payloads = {
+            "лишнее поле": json.dumps(dict(msg, extra="x" * 1000)).encode(),
+            "пробелы сверх размера": json.dumps(msg).encode()[:-1] + b" " * RELAY_MAX_SIZE + b"}",
+        }
+        for name, payload in payloads.items():
+            with self.subTest(name):
+                self.client2.send.reset_mock()
+                self.server._process_msg(json.loads(payload), self.client1, payload)
+                (relayed,) = FrameDecoder().feed(self.client2.send.call_args.args[0])
+                self.assertEqual(JSON_CODEC.decode(relayed).keys(), RELAY_KEYS)
+                self.assertLess(len(relayed), 1000)
+
+    def test_chat_msg_adds_contact_once(self):
+        self.server.storage.check_user_exists.return_value = True
+        msg = {Keys.ACTION: Actions.MSG, Keys.FROM: self.users[0], Keys.TO: self.users[1], Keys.MSG: "текст"}
+        msg[Keys.ENCODING] = "utf-8"
+        for _ in range(3):
+            code, _, _ = self.server._route_msg(self._parse_dumped(msg), self.client1)
+            self.assertEqual(code, HTTPStatus.OK)
+        (records,) = self.server.storage.apply_writes.call_args.args
+        self.assertEqual(records, [(WriteKinds.CONTACT_ADD, self.users[1], self.users[0])])
+        self.assertEqual(self.server.storage.apply_writes.call_count, 1)
+        self.assertTrue(self.server.contacts.has(self.users[1], self.users[0]))
+
+        del_msg = DelContact(account_name=self.users[1], contact=self.users[0])
+        self.assertEqual(self.server._route_msg(del_msg, self.client2)[0], HTTPStatus.OK)
+        self.assertFalse(self.server.contacts.has(self.users[1], self.users[0]))
+        self.server.storage.apply_writes.assert_called_with([(WriteKinds.CONTACT_DEL, self.users[1], self.users[0])])
+
+    def test_relay_sender_mismatch(self):
+        msg = ChatMsg(from_=self.users[1], to=self.users[0], encoding="utf-8", message="text")
+        code, _, _ = self.server._route_msg(msg, self.client1)
+        self.assertEqual(code, HTTPStatus.FORBIDDEN)
+        self.client1.send.assert_not_called()
 
     def test_recv_presense(self):
         msg = self.server._recv(self.client1)
@@ -148,9 +974,437 @@ class TestJIMServer(BaseServerTestCase):
         else:
             self.assertEqual(None, msg)
 
+    def test_recv_would_block(self):
+        self.client1.recv_into.side_effect = BlockingIOError
+        self.assertIsNone(self.server._recv(self.client1))
+        self.server.sessions.get(self.client1).frame_decoder = FrameDecoder()
+        self.assertEqual(self.server._recv_messages(self.client1), [])
+        self.assertIn(self.client1, self.server.sessions)
+        self.client1.close.assert_not_called()
+
+    def test_login_offloaded_to_executor(self):
+        self.server.storage.check_user_auth.return_value = True
+        self.server.storage.pop_pending_msgs.return_value = []
+        self.client2.getpeername.return_value = ("127.0.0.1", 33333)
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server.executor = BlockingExecutor(workers=1, max_pending=4)
+        self.addCleanup(self.server.executor.shutdown)
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        self.client2.send.assert_not_called()
+        while self.server.executor.pending:
+            select.select([self.server.executor.wakeup_sock], [], [], 5)
+            self.server.executor.run_callbacks()
+        self.server.storage.check_user_auth.assert_called_once_with("user", "pswd")
+        response = self.server._load_msg(self.client2.send.call_args_list[0].args[0])
+        self.assertEqual(response[Keys.RESPONSE], HTTPStatus.OK)
+        self.assertEqual(self.server._get_username(self.client2), "user")
+        self.server.storage.apply_writes.assert_called_once_with([(WriteKinds.LOGIN, "user", "127.0.0.1", mock.ANY)])
+
+    def test_login_with_session_token(self):
+        self.server.storage.check_user_auth.return_value = True
+        self.server.storage.pop_pending_msgs.return_value = []
+        self.client2.getpeername.return_value = ("127.0.0.1", 33333)
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+
+        def login(token: str | None = None) -> dict:
+            self.server.storage.check_user_auth.reset_mock()
+            self.server.sessions.close(self.client2)
+            self.server.sessions.open(self.client2)
+            msg = dict(auth_msg, **{Keys.TOKEN: token}) if token else auth_msg
+            self.server._process_msg(self._load_dumped(msg), self.client2)
+            response = self.server._load_msg(self.client2.send.call_args.args[0])
+            self.assertEqual(response[Keys.RESPONSE], HTTPStatus.OK)
+            return response
+
+        token = login()[Keys.TOKEN]
+        self.server.storage.check_user_auth.assert_called_once_with("user", "pswd")
+        new_token = login(token)[Keys.TOKEN]
+        self.server.storage.check_user_auth.assert_not_called()
+        self.assertNotEqual(new_token, token)
+
+        # использованный токен заменяется новым, а токен сессии, завершенной по quit, отзывается
+        login(token)
+        self.server.storage.check_user_auth.assert_called_once()
+        self.server._process_msg(self._load_dumped({Keys.ACTION: Actions.QUIT}), self.client2)
+        login(new_token)
+        self.server.storage.check_user_auth.assert_not_called()
+        quit_token = login()[Keys.TOKEN]
+        self.server._process_msg(self._load_dumped({Keys.ACTION: Actions.QUIT}), self.client2)
+        login(quit_token)
+        self.server.storage.check_user_auth.assert_called_once()
+
+        # токен не действует после смены пароля и удаления пользователя
+        for password_hash in ("new_hash", None):
+            with self.subTest(password_hash=password_hash):
+                self.server._process_msg(self._load_dumped({Keys.ACTION: Actions.QUIT}), self.client2)
+                token = login()[Keys.TOKEN]
+                self.server.storage.get_user_password_hash.return_value = password_hash
+                login(token)
+                self.server.storage.check_user_auth.assert_called_once()
+                self.server.storage.get_user_password_hash.return_value = "hash"
+
+    def test_login_rejected_when_executor_overloaded(self):
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server.executor = mock.Mock()
+        self.server.executor.submit.return_value = False
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        response = self.server._load_msg(self.client2.send.call_args.args[0])
+        self.assertEqual(response[Keys.RESPONSE], HTTPStatus.SERVICE_UNAVAILABLE)
+        self.assertNotIn(self.client2, self.server.sessions)
+        self.server.executor = None
+
+    def test_login_throttled(self):
+        self.server.storage.check_user_auth.return_value = False
+        self.client2.getpeername.return_value = ("10.0.0.1", 33333)
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+
+        def login() -> int:
+            self.server.sessions.close(self.client2)
+            self.server.sessions.open(self.client2)
+            self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+            return self.server._load_msg(self.client2.send.call_args.args[0])[Keys.RESPONSE]
+
+        self.server.user_attempts = TokenBuckets(2, 0.001, max_keys=10)
+        self.assertEqual([login() for _ in range(3)], [HTTPStatus.FORBIDDEN] * 2 + [HTTPStatus.TOO_MANY_REQUESTS])
+        self.assertEqual(self.server.storage.check_user_auth.call_count, 2)
+        self.assertNotIn(self.client2, self.server.sessions)
+
+        # успешный вход не расходует лимит
+        self.server.user_attempts = TokenBuckets(2, 0.001, max_keys=10)
+        self.server.storage.check_user_auth.return_value = True
+        self.server.storage.pop_pending_msgs.return_value = []
+        for _ in range(3):
+            self.assertEqual(login(), HTTPStatus.OK)
+            self.server._process_msg(self._load_dumped({Keys.ACTION: Actions.QUIT}), self.client2)
+
+    def test_unknown_user_negative_cache(self):
+        self.server.storage.check_user_auth.return_value = None
+        self.client2.getpeername.return_value = ("10.0.0.1", 33333)
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "ghost", Keys.PASSWORD: "pswd"}}
+        for _ in range(2):
+            self.server.sessions.close(self.client2)
+            self.server.sessions.open(self.client2)
+            self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+            response = self.server._load_msg(self.client2.send.call_args.args[0])
+            self.assertEqual(response[Keys.RESPONSE], HTTPStatus.FORBIDDEN)
+        self.server.storage.check_user_auth.assert_called_once_with("ghost", "pswd")
+        self.assertEqual(self.server.unknown_users.hits, 1)
+
+    def test_negotiate_framing(self):
+        auth_msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"},
+            Keys.FEATURES: {Features.FRAMING: True},
+        }
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server._process_msg(self.server._load_msg(self.server._dump_msg(auth_msg)), self.client2)
+        response = self.server._load_msg(self.client2.send.call_args.args[0])
+        self.assertEqual(response[Keys.FEATURES], {Features.FRAMING: True})
+        self.assertIsNotNone(self.server.sessions.get(self.client2).frame_decoder)
+
+        self.client2.recv.return_value = pack_frame(self.server._dump_msg(self.mock_presense)) * 2
+        messages = self.server._recv_messages(self.client2)
+        self.assertEqual([msg[Keys.ACTION] for msg, _ in messages], [Actions.PRESENCE, Actions.PRESENCE])
+
+    def test_coalesce_writes_per_tick(self):
+        self.server.sessions.get(self.client1).frame_decoder = FrameDecoder()
+        self.server._tick_writes = dict()
+        self.server._write(self.client1, b"frame1")
+        self.server._write(self.client1, b"frame2")
+        self.client1.send.assert_not_called()
+        self.client1.sendmsg.side_effect = lambda chunks: sum(map(len, chunks))
+        self.server._flush_tick_writes()
+        self.client1.sendmsg.assert_called_once_with([b"frame1", b"frame2"])
+        self.client1.send.assert_not_called()
+        self.assertIsNone(self.server._tick_writes)
+        self.server._write(self.client1, b"frame")
+        self.client1.send.assert_called_once_with(b"frame")
+
+    def test_unframed_writes_not_coalesced(self):
+        self.server._tick_writes = dict()
+        for msg, _ in self.server._recv_messages(self.client1):
+            self.server._process_msg(msg, self.client1)
+        self.server._write(self.client1, b"{}")
+        responses = [call.args[0] for call in self.client1.send.call_args_list]
+        self.assertEqual(self.server._load_msg(responses[0])[Keys.RESPONSE], HTTPStatus.OK)
+        self.assertEqual(responses[1], b"{}")
+        self.assertEqual(self.server._tick_writes, {})
+
+    def _run_ticks(self, *ticks):
+        """Выполняет настоящие итерации цикла событий: по одной на список готовых соединений"""
+        ticks_left = iter(ticks)
+
+        def select(timeout):
+            conns = next(ticks_left, None)
+            if conns is None:
+                self.server.stop()
+                return []
+            return [(mock.Mock(data=None, fileobj=conn), EVENT_READ) for conn in conns]
+
+        self.server.selector = mock.Mock()
+        self.server.selector.select.side_effect = select
+        with tempfile.TemporaryDirectory() as presence_dir, mock.patch.multiple(
+            ServerConf, BLOCKING_WORKERS=0, WRITE_BEHIND_MAX_DELAY=0, PRESENCE_DIR=Path(presence_dir)
+        ):
+            self.server._mainloop()
+
+    @staticmethod
+    def _written(client) -> list[bytes]:
+        """Данные каждого вызова send и sendmsg соединения по порядку"""
+        writes = []
+        for name, args, _ in client.method_calls:
+            if name == "send":
+                writes.append(args[0])
+            elif name == "sendmsg":
+                writes.append(b"".join(args[0]))
+        return writes
+
+    def test_mainloop_login_response_written_separately(self):
+        payloads = ['{"action": "msg", "message": "first"}', '{"action": "msg", "message": "second"}']
+        self.server.storage.pop_pending_msgs.return_value = payloads
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.client2.sendmsg.side_effect = lambda chunks: sum(map(len, chunks))
+        auth_msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"},
+            Keys.FEATURES: {Features.FRAMING: True, Features.OFFLINE_MSGS: True},
+        }
+        self.client2.recv.side_effect = [
+            self.server._dump_msg(auth_msg),
+            pack_frame(self.server._dump_msg(self.mock_presense)),
+        ]
+        self.server.is_running = True
+        self._run_ticks([self.client2], [self.client2])
+        response, *frames = self._written(self.client2)
+        # ответ без кадров читается клиентом одним recv, поэтому не склеивается с кадрами, а очередь сообщений
+        # уходит вслед за ответом на следующий запрос
+        self.assertEqual(self.server._load_msg(response)[Keys.RESPONSE], HTTPStatus.OK)
+        presence_response, *pushed = FrameDecoder().feed(b"".join(frames))
+        self.assertEqual(self.server._load_msg(presence_response)[Keys.RESPONSE], HTTPStatus.OK)
+        self.assertEqual(pushed, [payload.encode() for payload in payloads])
+
+    def test_disconnect_flushes_tick_writes(self):
+        self.server._tick_writes = dict()
+        self.client1.sendmsg.side_effect = lambda chunks: sum(map(len, chunks))
+        self.server._write(self.client1, b"denied")
+        self.server._disconnect_client(self.client1)
+        self.client1.send.assert_called_once_with(b"denied")
+        self.client1.close.assert_called_once()
+        self.assertNotIn(self.client1, self.server._tick_writes)
+
+    @skipUnless("msgpack" in CODECS, "msgpack не установлен")
+    def test_negotiate_binary_codec(self):
+        auth_msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"},
+            Keys.FEATURES: {Features.FRAMING: True, Features.CODEC: ["msgpack", "json"]},
+        }
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        response = self.server._load_msg(self.client2.send.call_args.args[0])
+        self.assertEqual(response[Keys.FEATURES], {Features.FRAMING: True, Features.CODEC: "msgpack"})
+
+        msgpack_codec = CODECS["msgpack"]
+        self.client2.recv.return_value = pack_frame(msgpack_codec.encode(self.mock_presense))
+        self.assertEqual(self.server._recv_messages(self.client2)[0][0][Keys.ACTION], Actions.PRESENCE)
+        self.server._deliver_msg("user", {Keys.ACTION: Actions.PROBE})
+        frame = FrameDecoder().feed(self.client2.send.call_args.args[0])[0]
+        self.assertEqual(msgpack_codec.decode(frame)[Keys.ACTION], Actions.PROBE)
+
+    def test_negotiate_compression(self):
+        auth_msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"},
+            Keys.FEATURES: {Features.FRAMING: True, Features.COMPRESSION: True},
+        }
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        response = self.server._load_msg(self.client2.send.call_args.args[0])
+        self.assertEqual(response[Keys.FEATURES], {Features.FRAMING: True, Features.COMPRESSION: True})
+
+        self.server._deliver_msg("user", {Keys.ACTION: Actions.PROBE, Keys.MSG: "x" * 4096})
+        data = self.client2.send.call_args.args[0]
+        self.assertTrue(FRAME_HEADER.unpack_from(data)[0] & COMPRESSED_FLAG)
+        self.assertEqual(self.server._load_msg(FrameDecoder().feed(data)[0])[Keys.MSG], "x" * 4096)
+
+    def test_legacy_client_not_framed(self):
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        self.server._process_msg(self.server._load_msg(self.server._dump_msg(auth_msg)), self.client2)
+        response = self.server._load_msg(self.client2.send.call_args.args[0])
+        self.assertNotIn(Keys.FEATURES, response)
+        self.assertIsNone(self.server.sessions.get(self.client2).frame_decoder)
+
+    def test_msg_to_offline_user_stored(self):
+        msg = {
+            Keys.ACTION: Actions.MSG,
+            Keys.FROM: self.users[0],
+            Keys.TO: "offline_user",
+            Keys.MSG: "message",
+            Keys.ENCODING: "utf-8",
+        }
+        # клиент без согласованной доставки получает прежний ответ, и сообщение не сохраняется
+        code, _, _ = self.server._route_msg(self._parse_dumped(msg), self.client1)
+        self.assertEqual(code, HTTPStatus.NOT_FOUND)
+        self.server.storage.store_pending_msg.assert_not_called()
+
+        self.server.sessions.get(self.client1).offline_msgs = True
+        self.server.storage.store_pending_msg.return_value = True
+        code, _, _ = self.server._route_msg(self._parse_dumped(msg), self.client1)
+        self.assertEqual(code, HTTPStatus.ACCEPTED)
+        username, payload = self.server.storage.store_pending_msg.call_args.args
+        self.assertEqual((username, json.loads(payload)[Keys.MSG]), ("offline_user", "message"))
+
+        self.server.storage.store_pending_msg.return_value = False
+        code, _, _ = self.server._route_msg(self._parse_dumped(msg), self.client1)
+        self.assertEqual(code, HTTPStatus.NOT_FOUND)
+
+    def test_pending_msgs_delivered_after_first_request(self):
+        payloads = ['{"action": "msg", "message": "first"}', '{"action": "msg", "message": "second"}']
+        self.server.storage.pop_pending_msgs.return_value = payloads
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        auth_msg = {
+            Keys.ACTION: Actions.AUTH,
+            Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"},
+            Keys.FEATURES: {Features.FRAMING: True, Features.OFFLINE_MSGS: True},
+        }
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        self.server.storage.pop_pending_msgs.assert_not_called()
+        self.server._process_msg(self._load_dumped(self.mock_presense), self.client2)
+        self.server.storage.pop_pending_msgs.assert_called_once_with("user")
+        _, presence_response, flushed = [call.args[0] for call in self.client2.send.call_args_list]
+        self.assertEqual(len(FrameDecoder().feed(presence_response)), 1)
+        self.assertEqual(FrameDecoder().feed(flushed), [payload.encode() for payload in payloads])
+
+    def test_pending_msgs_restored_after_disconnect(self):
+        payloads = ['{"action": "msg", "message": "first"}']
+        self.server.storage.pop_pending_msgs.return_value = payloads
+        session = self.server.sessions.get(self.client2)
+        session.is_pending_due = True
+        with mock.patch.object(self.server, "_run_blocking", return_value=True) as run_blocking:
+            self.server._deliver_pending_due(self.client2)
+        callback, func, username = run_blocking.call_args.args
+        self.assertEqual((func, username), (self.server.storage.pop_pending_msgs, session.username))
+        self.server.sessions.close(self.client2)
+        future = mock.Mock()
+        future.result.return_value = payloads
+        callback(future)
+        self.server.storage.store_pending_msg.assert_called_once_with(session.username, payloads[0])
+        self.client2.send.assert_not_called()
+
+    def test_pending_msgs_retried_when_pool_overloaded(self):
+        session = self.server.sessions.get(self.client2)
+        session.is_pending_due = True
+        with mock.patch.object(self.server, "_run_blocking", return_value=False):
+            self.server._deliver_pending_due(self.client2)
+        self.assertTrue(session.is_pending_due)
+
+    def test_pending_msgs_kept_for_legacy_client(self):
+        self.server.storage.check_user_auth.return_value = True
+        self.server.sessions.close(self.client2)
+        self.server.sessions.open(self.client2)
+        auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+        self.server._process_msg(self._load_dumped(auth_msg), self.client2)
+        self.server._process_msg(self._load_dumped(self.mock_presense), self.client2)
+        self.server.storage.pop_pending_msgs.assert_not_called()
+
+    def test_join_leave_room(self):
+        self.server.rooms = RoomRegistry()
+        self.server.storage.check_user_exists.return_value = True
+        join_msg = self._parse_dumped({Keys.ACTION: Actions.JOIN, Keys.ROOM: "#room"})
+        code, _, _ = self.server._route_msg(join_msg, self.client1)
+        self.assertEqual(code, HTTPStatus.OK)
+        self.assertEqual(self.server.rooms.members("#room"), {self.users[0]})
+        self.server.storage.apply_writes.assert_called_with([(WriteKinds.ROOM_JOIN, self.users[0], "#room")])
+
+        leave_msg = self._parse_dumped({Keys.ACTION: Actions.LEAVE, Keys.ROOM: "#room"})
+        code, _, _ = self.server._route_msg(leave_msg, self.client1)
+        self.assertEqual(code, HTTPStatus.OK)
+        self.assertNotIn("#room", self.server.rooms)
+        self.server.storage.apply_writes.assert_called_with([(WriteKinds.ROOM_LEAVE, self.users[0], "#room")])
+        code, _, _ = self.server._route_msg(leave_msg, self.client1)
+        self.assertEqual(code, HTTPStatus.NOT_FOUND)
+
+        bad_msg = self._parse_dumped({Keys.ACTION: Actions.JOIN, Keys.ROOM: "room"})
+        code, _, _ = self.server._route_msg(bad_msg, self.client1)
+        self.assertEqual(code, HTTPStatus.BAD_REQUEST)
+
+    def test_room_fan_out(self):
+        self.server.rooms = RoomRegistry({"#room": set(self.users) | {"offline_user"}})
+        msg = self._parse_dumped(
+            {Keys.ACTION: Actions.MSG, Keys.FROM: "user1", Keys.TO: "#room", Keys.MSG: "hi", Keys.ENCODING: "utf-8"}
+        )
+        with mock.patch.object(self.server, "_dump_msg", wraps=self.server._dump_msg) as dump_msg:
+            code, _, _ = self.server._route_msg(msg, self.client1)
+        self.assertEqual(code, HTTPStatus.OK)
+        dump_msg.assert_called_once()
+        self.client1.send.assert_not_called()
+        self.assertEqual(self.server._load_msg(self.client2.send.call_args.args[0])[Keys.MSG], "hi")
+        self.server.storage.apply_writes.assert_not_called()
+
+        self.server.rooms.leave("#room", self.users[0])
+        code, _, _ = self.server._route_msg(msg, self.client1)
+        self.assertEqual(code, HTTPStatus.FORBIDDEN)
+
+    def _overload_client(self, policy: str):
+        self.server.selector = mock.Mock()
+        self.server.sessions.get(self.client2).events = EVENT_READ
+        self.client2.send.side_effect = BlockingIOError
+        patcher = mock.patch.multiple(
+            ServerConf, OUTBOUND_OVERFLOW_POLICY=policy, OUTBOUND_HIGH_WATERMARK=10, OUTBOUND_LOW_WATERMARK=4
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server._write(self.client2, b"x" * 12)
+
+    def test_outbound_defer_pauses_reading(self):
+        self._overload_client(OverflowPolicy.DEFER)
+        self.server.selector.modify.assert_called_with(self.client2, EVENT_WRITE)
+        self.server._write(self.client2, b"y")
+        self.assertEqual(len(self.server.sessions.get(self.client2).outbound), 13)
+
+        self.client2.sendmsg.side_effect = lambda chunks: sum(map(len, chunks))
+        self.server._flush(self.client2)
+        self.server.selector.modify.assert_called_with(self.client2, EVENT_READ)
+
+    def test_outbound_drop(self):
+        self._overload_client(OverflowPolicy.DROP)
+        self.server._write(self.client2, b"y")
+        self.assertEqual(len(self.server.sessions.get(self.client2).outbound), 12)
+        self.server.selector.modify.assert_called_with(self.client2, EVENT_READ | EVENT_WRITE)
+
+    def test_outbound_disconnect(self):
+        self._overload_client(OverflowPolicy.DISCONNECT)
+        self.server._write(self.client2, b"y")
+        self.client2.close.assert_called()
+        self.assertNotIn(self.client2, self.server.sessions)
+        self.assertIsNone(self.server.sessions.get_by_user(self.users[1]))
+
+    def _load_dumped(self, msg: dict) -> dict:
+        return self.server._load_msg(self.server._dump_msg(msg))
+
+    def _parse_dumped(self, msg: dict) -> JIMMessage:
+        return self.server._parse_msg(self._load_dumped(msg))
+
     def test_make_probe_msg(self):
         probe_msg_orig = {Keys.ACTION: Actions.PROBE}
-        probe_msg = self.server._make_probe_msg()
+        probe_msg = self.server._make_probe_msg().to_dict()
         probe_msg_orig.update(self.mock_time)  # type: ignore
         probe_msg.update(self.mock_time)  # type: ignore
         self.assertEqual(probe_msg, probe_msg_orig)
@@ -160,7 +1414,7 @@ class TestJIMServer(BaseServerTestCase):
             Keys.RESPONSE: HTTPStatus.OK,
             Keys.ALERT: HTTPStatus.OK.phrase,
         }
-        response_msg = self.server._make_response_msg(code=HTTPStatus.OK)
+        response_msg = self.server._make_response_msg(code=HTTPStatus.OK).to_dict()
         response_orig.update(self.mock_time)  # type: ignore
         response_msg.update(self.mock_time)  # type: ignore
         self.assertEqual(response_msg, response_orig)
@@ -170,7 +1424,7 @@ class TestJIMServer(BaseServerTestCase):
             Keys.RESPONSE: HTTPStatus.FORBIDDEN,
             Keys.ERROR: HTTPStatus.FORBIDDEN.phrase,
         }
-        response_msg = self.server._make_response_msg(code=HTTPStatus.FORBIDDEN)
+        response_msg = self.server._make_response_msg(code=HTTPStatus.FORBIDDEN).to_dict()
         response_orig.update(self.mock_time)  # type: ignore
         response_msg.update(self.mock_time)  # type: ignore
         self.assertEqual(response_msg, response_orig)
@@ -181,7 +1435,57 @@ class TestJIMServer(BaseServerTestCase):
             Keys.RESPONSE: HTTPStatus.INTERNAL_SERVER_ERROR,
             Keys.ERROR: descr,
         }
-        response_msg = self.server._make_response_msg(code=HTTPStatus.INTERNAL_SERVER_ERROR, description=descr)
+        response_msg = self.server._make_response_msg(
+            code=HTTPStatus.INTERNAL_SERVER_ERROR, description=descr
+        ).to_dict()
         response_orig.update(self.mock_time)  # type: ignore
         response_msg.update(self.mock_time)  # type: ignore
         self.assertEqual(response_msg, response_orig)
+
+
+class TestJIMAsyncServer(TestCase):
+    def setUp(self):
+        self.server = JIMAsyncServer("127.0.0.1", 7777)
+        self.server.close()
+        self.server.storage = mock.Mock()
+        self.server.storage.check_user_auth.return_value = True
+        self.server.storage.pop_pending_msgs.return_value = []
+        self.server.storage.get_user_password_hash.return_value = "hash"
+        self.server.is_running = True
+        self.auth_msg = {Keys.ACTION: Actions.AUTH, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.PASSWORD: "pswd"}}
+        self.presence_msg = {Keys.ACTION: Actions.PRESENCE, Keys.USER: {Keys.ACCOUNT_NAME: "user", Keys.STATUS: ""}}
+        return super().setUp()
+
+    def _make_writer(self):
+        writer = mock.Mock()
+        writer.is_closing.return_value = False
+        writer.get_extra_info.return_value = ("127.0.0.1", 33333)
+        writer.drain = mock.AsyncMock()
+        writer.transport.get_write_buffer_size.return_value = 0
+        return writer
+
+    def _serve_connection(self, *messages):
+        reader = mock.Mock()
+        reader.read = mock.AsyncMock(side_effect=[self.server._dump_msg(msg) for msg in messages] + [b""])
+        writer = self._make_writer()
+        asyncio.run(self.server._handle_connection(reader, writer))
+        return writer, [self.server._load_msg(call.args[0]) for call in writer.write.call_args_list]
+
+    def test_stream_connection_getpeername_closed(self):
+        writer = self._make_writer()
+        writer.is_closing.return_value = True
+        conn = StreamConnection(mock.Mock(), writer)
+        self.assertRaises(OSError, conn.getpeername)
+
+    def test_handle_connection_login_required(self):
+        writer, responses = self._serve_connection(self.presence_msg)
+        self.assertEqual([resp[Keys.RESPONSE] for resp in responses], [HTTPStatus.FORBIDDEN])
+        writer.close.assert_called()
+        self.assertEqual(len(self.server.sessions), 0)
+
+    def test_handle_connection_auth_and_disconnect(self):
+        writer, responses = self._serve_connection(self.auth_msg, self.presence_msg)
+        self.assertEqual([resp[Keys.RESPONSE] for resp in responses], [HTTPStatus.OK, HTTPStatus.OK])
+        self.assertEqual(self.server.presence.pop_changes(), {"user": (False, "")})
+        self.assertEqual(list(self.server.sessions.usernames()), [])
+        self.assertEqual(len(self.server.sessions), 0)